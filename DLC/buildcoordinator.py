@@ -0,0 +1,108 @@
+import threading
+
+
+class CoordinatorAborted(RuntimeError):
+  pass
+
+
+class BatchCoordinator:
+  """
+  Round based rendezvous for the kernel tuner threads.
+
+  Every round each participant calls submit() with its item.  The last one
+  to arrive runs action(items) once for the whole batch (e.g. one cmake +
+  ninja build for all kernels' pending configs) and every participant gets
+  its return value.  A participant with nothing to submit for a while (e.g.
+  done with its tests of a generation while others still take samples)
+  calls pause(), resume_all() brings the paused ones back.  If the action raises, or a participant times out or
+  calls abort(), all current and later submit() calls raise
+  CoordinatorAborted instead of waiting forever.  A participant that is done
+  tuning calls leave() so the remaining ones stop waiting for it.
+  """
+
+  def __init__(self, participants, timeout=None, name="batch"):
+    self.participants = participants
+    self.paused = 0
+    self.timeout = timeout
+    self.name = name
+    self.cond = threading.Condition()
+    self.items = []
+    self.action = None
+    self.round = 0
+    self.result = None
+    self.error = None
+
+  def submit(self, item=None, action=None, timeout=None):
+    if timeout is None:
+      timeout = self.timeout
+    with self.cond:
+      self.check_error()
+      my_round = self.round
+      self.items.append(item)
+      if action is not None:
+        self.action = action
+      batch = self.take_batch()
+      if batch is None:
+        if not self.cond.wait_for(lambda: self.round != my_round or self.error is not None, timeout):
+          self.fail(CoordinatorAborted("{0}: timed out after {1}s waiting for {2} of {3} participants".format(
+            self.name, timeout, self.participants - len(self.items), self.participants)))
+        if self.round == my_round:
+          self.check_error()
+        return self.result
+    return self.run_batch(*batch)
+
+  def leave(self, pause=False):
+    """a participant is done, the others no longer wait for it"""
+    with self.cond:
+      self.participants -= 1
+      if pause:
+        self.paused += 1
+      batch = self.take_batch() if self.items else None
+    if batch is not None:
+      self.run_batch(*batch)
+
+  def pause(self):
+    """leave() until the next resume_all()"""
+    self.leave(pause=True)
+
+  def resume_all(self):
+    """the paused participants take part in the rounds again"""
+    with self.cond:
+      self.participants += self.paused
+      self.paused = 0
+
+  def abort(self, exc):
+    """fail the current and all later rounds with exc"""
+    with self.cond:
+      self.fail(exc)
+
+  def take_batch(self):
+    # called with self.cond held, returns the batch to run if it is complete
+    if len(self.items) < self.participants:
+      return None
+    items, action = self.items, self.action
+    self.items = []
+    self.action = None
+    return items, action
+
+  def run_batch(self, items, action):
+    # the action runs without holding the lock, so abort() stays responsive
+    try:
+      result = action(items) if action is not None else None
+    except BaseException as e:
+      self.abort(e)
+      raise
+    with self.cond:
+      self.result = result
+      self.round += 1
+      self.cond.notify_all()
+    return result
+
+  def fail(self, exc):
+    if self.error is None:
+      self.error = exc
+    self.cond.notify_all()
+
+  def check_error(self):
+    if self.error is not None:
+      raise CoordinatorAborted("{0} aborted: {1!r}".format(self.name, self.error))
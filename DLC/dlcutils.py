@@ -1,5 +1,8 @@
+import hashlib
 import os
 import re
+import subprocess
+import threading
 from llamatool import *
 import yaml
 
@@ -26,6 +29,16 @@ def get_kernel_path():
   else:
     raise SystemError("DLC_Custom_Kernel not found")
   
+def get_kernel_source_version():
+  # git tree hash of dlc_kernels, plus a hash of any uncommitted changes,
+  # so cached measurements are only reused for identical kernel sources
+  kernel_path = get_kernel_path()
+  version = subprocess.check_output(['git', '-C', kernel_path, 'rev-parse', 'HEAD:dlc_kernels']).decode().strip()
+  diff = subprocess.check_output(['git', '-C', kernel_path, 'diff', 'HEAD', '--', 'dlc_kernels'])
+  if diff:
+    version += "-" + hashlib.sha256(diff).hexdigest()[:16]
+  return version
+  
 def get_policy_path():
   kernel_dir = get_kernel_path()
   return kernel_dir + "dlc_src/opt_flag_data/autotune_strategies.csv"
@@ -33,13 +46,99 @@ def get_policy_path():
 def get_default_policy():
   return ",,,1.0,all"
 
+class PolicyStore:
+  """
+  In memory copy of the policy csv, indexed by kernel name.
+
+  Tuner threads only update the table (set() is a dict lookup and a list
+  store), the file is written as a whole snapshot by write() once per build,
+  via a temp file and os.replace so a crash never leaves a truncated csv.
+  """
+
+  def __init__(self, path):
+    self.path = path
+    self.lock = threading.Lock()
+    self.write_lock = threading.Lock()
+    self.lines = []
+    self.index = {}
+    with open(path, 'r') as file:
+      self.reset(file.readlines())
+
+  def reset(self, lines):
+    lines = [line if line.endswith("\n") else line + "\n" for line in lines]
+    index = {}
+    for i, line in enumerate(lines):
+      kernel = line.split(',')[0]
+      if kernel.strip() and kernel not in index:
+        index[kernel] = i
+    with self.lock:
+      self.lines, self.index = lines, index
+
+  def get(self, kernel_name):
+    """(line number, line) of a kernel, (-1, "") if it is not in the table"""
+    i = self.index.get(kernel_name, -1)
+    if i == -1:
+      return -1, ""
+    return i, self.lines[i]
+
+  def set(self, kernel_name, flags):
+    """set the flags of a kernel, new kernels are appended, returns its line number"""
+    line = kernel_name + "," + ",".join([str(flag) for flag in flags]) + "\n"
+    with self.lock:
+      i = self.index.get(kernel_name)
+      if i is None:
+        i = len(self.lines)
+        self.lines.append(line)
+        self.index[kernel_name] = i
+      else:
+        self.lines[i] = line
+    return i
+
+  def setdefault(self, kernel_name, policy):
+    with self.lock:
+      if kernel_name not in self.index:
+        self.index[kernel_name] = len(self.lines)
+        self.lines.append(kernel_name + "," + policy + "\n")
+      i = self.index[kernel_name]
+    return i, self.lines[i]
+
+  def table(self):
+    """kernel name -> tuple of its policy flags"""
+    with self.lock:
+      lines = list(self.lines)
+    return dict((kernel, tuple(lines[i].strip().split(',')[1:])) for kernel, i in self.index.items())
+
+  def write(self, path=None):
+    """write a snapshot of the table to path (default the policy file), returns the snapshot lines"""
+    path = path or self.path
+    with self.write_lock:
+      with self.lock:
+        lines = list(self.lines)
+      tmp = "{0}.{1}.tmp".format(path, os.getpid())
+      with open(tmp, 'w') as file:
+        file.writelines(lines)
+      os.replace(tmp, path)
+    return lines
+
+policy_store = None
+policy_store_lock = threading.Lock()
+
+def get_policy_store():
+  global policy_store
+  with policy_store_lock:
+    if policy_store is None:
+      policy_store = PolicyStore(get_policy_path())
+  return policy_store
+
 def get_line_number(file_path, kernel_name):
-  with open(file_path, 'r') as file:
-    for i, line in enumerate(file):
-      if kernel_name == line.split(',')[0]:
-        return i, line
-  # kernel not seen before
-  return -1, ""
+  if file_path != get_policy_path():
+    with open(file_path, 'r') as file:
+      for i, line in enumerate(file):
+        if kernel_name == line.split(',')[0]:
+          return i, line
+    # kernel not seen before
+    return -1, ""
+  return get_policy_store().get(kernel_name)
 
 def get_flag_dict(flags):
   flag_dict = {}
@@ -48,12 +147,17 @@ def get_flag_dict(flags):
   return flag_dict
 
 def change_policy_file(line_number, new_line):
-  with open(get_policy_path(), 'r') as file:
-    data = file.readlines()
-  data[line_number] = new_line
-  with open(get_policy_path(), 'w') as file:
-    file.writelines(data)
+  # kept for old scripts, the tuners call set() and write once per build
+  fields = new_line.strip().split(',')
+  get_policy_store().set(fields[0], fields[1:])
+  get_policy_store().write()
     
+def get_line_cycles(line):
+  # xys0 + xys1 cycles of a syntests result line, None for other lines
+  if "xys0" in line and "xys1" in line:
+    return int(re.findall(r"xys0: \d+", line)[0].split()[-1]) + int(re.findall(r"xys1: \d+", line)[0].split()[-1])
+  return None
+
 def diagnose_run_result(lines):
   test_pass = True
   cycle = 0
@@ -61,12 +165,71 @@ def diagnose_run_result(lines):
   for line in lines:
     if "fail" in line:
       test_pass = False
-    if "xys0" in line and "xys1" in line:
+    line_cycles = get_line_cycles(line)
+    if line_cycles is not None:
       result_lines += line + "\n"
-      cycle += int(re.findall(r"xys0: \d+", line)[0].split()[-1])
-      cycle += int(re.findall(r"xys1: \d+", line)[0].split()[-1])
+      cycle += line_cycles
   return cycle, test_pass, result_lines
 
+def parse_dependency(dep_info):
+  kernel_to_dep = {}
+  dep_to_kernel = {}
+  for line in dep_info:
+      line = line.strip()
+      if not line:  # Skip empty lines
+          continue
+      
+      # Check if line contains a colon
+      if ':' in line and 'dlc_src' in line:
+        target, _ = line.split(':', 1)
+        target = target.strip().split('/')[-1]
+        target = target.split('_dlc')[0]
+        kernel_to_dep[target] = []
+      elif 'dlc_kernels' in line:
+        file_name = line.split()[0].strip().split('/')[-1]
+        kernel_to_dep[target].append(file_name)
+
+  # remove all the _xys1 files
+  duplicates = []
+  for target in kernel_to_dep:
+    if "_xys1" in target:
+      duplicates.append(target)
+  for target in duplicates:
+    kernel_to_dep.pop(target)
+
+  for target in kernel_to_dep:
+    for dep in kernel_to_dep[target]:
+      if dep not in dep_to_kernel:
+        dep_to_kernel[dep] = []
+      dep_to_kernel[dep].append(target)
+  return kernel_to_dep, dep_to_kernel
+
+def parse_dependency_graph(dep_info):
+  # kernel name -> {'targets': [...], 'deps': [...]} from `ninja -t deps`,
+  # paths are kept as printed by ninja (relative to the build dir).  Unlike
+  # parse_dependency the _xys1 objects are kept under their kernel, and the
+  # policy file is left out since a kernel's flags are tracked separately.
+  graph = {}
+  node = None
+  for line in dep_info:
+    if not line.strip():
+      continue
+    if not line[0].isspace() and ':' in line:
+      target = line.split(':', 1)[0].strip()
+      node = None
+      if 'dlc_src' in target:
+        kernel = target.split('/')[-1].split('_dlc')[0]
+        if kernel.endswith('_xys1'):
+          kernel = kernel[:-len('_xys1')]
+        node = graph.setdefault(kernel, {'targets': [], 'deps': []})
+        node['targets'].append(target)
+    elif node is not None:
+      dep = line.split()[0].strip()
+      if ('dlc_kernels' in dep or 'dlc_src' in dep) and not dep.endswith('autotune_strategies.csv'):
+        if dep not in node['deps']:
+          node['deps'].append(dep)
+  return graph
+
 def get_most_recent_log_dir(log_dir):
   log_dirs = [log_dir + d for d in os.listdir(log_dir) if os.path.isdir(log_dir + d)]
   if not len(log_dirs):
@@ -75,27 +238,24 @@ def get_most_recent_log_dir(log_dir):
     log_dirs.sort(key=lambda x: os.path.getmtime(x))
     return log_dirs[-1]
   
+def get_resume_database(resume_dir, kernel_name):
+  # database of an earlier tuning of kernel_name in resume_dir, or None
+  if not resume_dir:
+    return None
+  path = os.path.join(resume_dir, kernel_name + ".db")
+  if os.path.isfile(path) and os.path.getsize(path) > 0:
+    return path
+  return None
+
 def diagnose_llama_result(text):
-  kernel_launches_name_body = [get_kernel_info(remove_ansi(kernel)) for kernel in get_kernel_launches(text)]
-  kernel_names = [x[0] for x in kernel_launches_name_body]
-  kernel_cycles = get_kernel_cycles(text)
-  total_cycles = sum(kernel_cycles) + 1
-
-  if len(kernel_cycles) != len(kernel_names):
-      print('Warning: kernel names and cycles length mismatch')
-      print('kernel length:', len(kernel_names))
-      print('cycles length:', len(kernel_cycles))
-      kernel_cycles = kernel_cycles[:len(kernel_names)]
-      while len(kernel_cycles) < len(kernel_names):
-          kernel_cycles.append(0)
-
-  ############################################################################################################################
-  kernel_name_cycles = {}
-  for name, cycle in zip(kernel_names, kernel_cycles):
-      if name not in kernel_name_cycles:
-          kernel_name_cycles[name] = 0
-      kernel_name_cycles[name] += int(cycle)
-      # kernel_name_cycles[name][1] += 1
+  parser = LlamaLogParser()
+  for line in text.splitlines(True):
+    parser.feed(line)
+  return diagnose_llama_log(parser)
+
+def diagnose_llama_log(parser, launch_counts=None):
+  # launch_counts (from a complete run) if the log was stopped early
+  kernel_name_cycles, total_cycles = parser.finish(launch_counts)
   return get_kernel_to_cycle(kernel_name_cycles, get_register_name_to_kernel()), total_cycles
 
 def get_register_name_to_kernel():
@@ -110,13 +270,16 @@ def get_register_name_to_kernel():
       name_to_kernel[item['name']] = src
   return name_to_kernel
 
+def get_launch_kernel(name, name_to_kernel):
+  # kernel source a launched kernel name belongs to
+  if name not in name_to_kernel.keys():
+    return name.split('custom_')[1]
+  return name_to_kernel[name]
+
 def get_kernel_to_cycle(res, name_to_kernel):
   kernel_to_cycle = {}
   for item in res.keys():
-    if item not in name_to_kernel.keys():
-      kernel = item.split('custom_')[1]
-    else:
-      kernel = name_to_kernel[item]
+    kernel = get_launch_kernel(item, name_to_kernel)
     if kernel in kernel_to_cycle.keys():
       kernel_to_cycle[kernel] += res[item]
     else:
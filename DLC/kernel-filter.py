@@ -36,39 +36,6 @@ def get_commit_hash(log_path):
     print("No commit hash found in the log directory")
     return ""
   
-def parse_dependency(dep_info):
-  kernel_to_dep = {}
-  dep_to_kernel = {}
-  for line in dep_info:
-      line = line.strip()
-      if not line:  # Skip empty lines
-          continue
-      
-      # Check if line contains a colon
-      if ':' in line and 'dlc_src' in line:
-        target, _ = line.split(':', 1)
-        target = target.strip().split('/')[-1]
-        target = target.split('_dlc')[0]
-        kernel_to_dep[target] = []
-      elif 'dlc_kernels' in line:
-        file_name = line.split()[0].strip().split('/')[-1]
-        kernel_to_dep[target].append(file_name)
-
-  # remove all the _xys1 files
-  duplicates = []
-  for target in kernel_to_dep:
-    if "_xys1" in target:
-      duplicates.append(target)
-  for target in duplicates:
-    kernel_to_dep.pop(target)
-
-  for target in kernel_to_dep:
-    for dep in kernel_to_dep[target]:
-      if dep not in dep_to_kernel:
-        dep_to_kernel[dep] = []
-      dep_to_kernel[dep].append(target)
-  return kernel_to_dep, dep_to_kernel
-  
 if __name__ == '__main__':
   cur_dir = os.getcwd()
   # check the result we have last time
@@ -154,6 +121,15 @@ if __name__ == '__main__':
   kernel_param = "--kernel=" + ",".join(candidate_kernel)
   subprocess.run(['mkdir', '-p', new_log_dir + "/tunerDB"])
   database_param = "--database=" + new_log_dir + "/tunerDB"
+  tune_cmd = ['python3', cur_dir + '/' + script, kernel_param, database_param]
+  if most_recent_log_dir != "" and os.path.isdir(most_recent_log_dir + "/tunerDB"):
+    # warm-start each kernel from last night's results
+    tune_cmd.append("--resume-from-dir=" + most_recent_log_dir + "/tunerDB")
+    # and try the configs that did best on similar kernels first
+    tune_cmd.append("--transfer-from=" + most_recent_log_dir + "/tunerDB")
+  if script == 'multi-tune-hw.py':
+    # configs measured on identical kernel sources on earlier nights are not run again
+    tune_cmd.append("--measurement-cache=" + log_path + "/measurement_cache.db")
   print("*********** Start to tune ***********")
-  subprocess.run(['python3', cur_dir + '/' + script, kernel_param, database_param])
+  subprocess.run(tune_cmd)
   subprocess.run(['cp', get_policy_path(), new_log_dir]) 
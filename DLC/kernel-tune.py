@@ -17,17 +17,20 @@ from opentuner.search.driver import SearchDriver
 
 import argparse
 from dlcutils import *
+from kernelcache import IncrementalKernelBuilder
 
 parser = argparse.ArgumentParser(parents=opentuner.argparsers())
 parser.add_argument('--kernel', help='kernel name to tune')
 
 class KernelFlagsTuner(MeasurementInterface):
   def __init__(self, *pargs, **kwargs):
-    super(KernelFlagsTuner, self).__init__(program_name=args.kernel, *pargs,
-                                            **kwargs)
+    super(KernelFlagsTuner, self).__init__(program_name=args.kernel,
+                                           program_version=get_kernel_source_version(),
+                                           *pargs, **kwargs)
     self.kernel_name = pargs[0].kernel
     self.stragegy_path = get_policy_path()
     self.line_number, content = get_line_number(self.stragegy_path, self.kernel_name)
+    self.kernel_builder = IncrementalKernelBuilder()
     self.opt_flag = get_flag_dict(content.strip().split(',')[1:])
     # to record if it's tested
     self.option_record = {}
@@ -73,17 +76,8 @@ class KernelFlagsTuner(MeasurementInterface):
       # print("Compiling with configuration: ", cfg)
       self.set_opt_flag(cfg)
       # print("MIScheduler set to: ", cfg[opt_dim[0]])
-      change_policy_file(self.line_number, self.kernel_name + "," + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
-      build_dir = get_kernel_path() + "build/"
-      cmake_cmd = 'cmake -G Ninja -S {0} -B {1}'.format(get_kernel_path(), build_dir)
-      cmake_res = self.call_program(cmake_cmd)
-      assert cmake_res['returncode'] == 0
-      print("CMake finished")
-      ninja_cmd = 'ninja -C {0} '.format(build_dir)
-      ninja_res = self.call_program(ninja_cmd)
-      print("Build finished")
-      assert ninja_res['returncode'] == 0
-      return ninja_res
+      get_policy_store().set(self.kernel_name, [self.opt_flag[key] for key in opt_dim])
+      return self.kernel_builder.build(self.call_program)
 
   def run_precompiled(self, desired_result, input, limit, compile_result, id):
     """
@@ -129,7 +123,8 @@ class KernelFlagsTuner(MeasurementInterface):
     else:
       print("Optimal compiling flag is:", configuration.data)
       self.opt_flag["MIScheduler"] = configuration.data[opt_dim[0]]
-    change_policy_file(self.line_number, self.kernel_name + "," + ",".join([self.opt_flag[key] for key in opt_dim]) + "\n")
+    get_policy_store().set(self.kernel_name, [self.opt_flag[key] for key in opt_dim])
+    get_policy_store().write()
     
   def set_opt_flag(self, configuration):
     for key in configuration:
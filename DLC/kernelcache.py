@@ -0,0 +1,178 @@
+import hashlib
+import os
+import shutil
+import subprocess
+from dlcutils import *
+
+
+class KernelObjectCache:
+  """
+  Compiled kernel objects keyed by (source hash, flag tuple), so a config
+  that was built before is restored by copying instead of compiling.
+  """
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+    self.hits = 0
+    self.misses = 0
+    os.makedirs(cache_dir, exist_ok=True)
+
+  def key(self, sources, flags):
+    h = hashlib.sha256()
+    for path in sorted(sources):
+      h.update(path.encode())
+      try:
+        with open(path, 'rb') as f:
+          h.update(f.read())
+      except IOError:
+        h.update(b'<missing>')
+    h.update(repr(tuple(flags)).encode())
+    return h.hexdigest()
+
+  def entry(self, key, output):
+    # outputs of one kernel share a directory, named by their build path
+    return os.path.join(self.cache_dir, key, output.replace('/', '%'))
+
+  def restore(self, key, outputs):
+    """
+    copy the cached outputs over the existing ones, returns False on a miss;
+    the files keep their timestamps, which ninja's build and deps logs refer to
+    """
+    entries = [self.entry(key, output) for output in outputs]
+    if not all(os.path.exists(e) and os.path.exists(o) for e, o in zip(entries, outputs)):
+      self.misses += 1
+      return False
+    for e, output in zip(entries, outputs):
+      st = os.stat(output)
+      shutil.copyfile(e, output)
+      os.utime(output, ns=(st.st_atime_ns, st.st_mtime_ns))
+    self.hits += 1
+    return True
+
+  def store(self, key, outputs):
+    os.makedirs(os.path.join(self.cache_dir, key), exist_ok=True)
+    for output in outputs:
+      if os.path.exists(output):
+        tmp = self.entry(key, output) + ".tmp"
+        shutil.copy(output, tmp)
+        os.replace(tmp, self.entry(key, output))
+
+
+class IncrementalKernelBuilder:
+  """
+  Builds the kernel tree so that only kernels whose sources or policy flags
+  changed are recompiled.
+
+  Every kernel object depends on the policy file, so ninja alone would
+  rebuild all of them whenever any policy line changes.  The builder keeps
+  the policy file's mtime at that of the last build, so ninja ignores policy
+  changes, and tracks each kernel's flags itself: the objects of kernels
+  whose (sources, flags) key changed are restored from the object cache or
+  deleted and compiled with `ninja <their targets>`, and whatever links a
+  restored object is deleted so ninja relinks it.
+  """
+
+  def __init__(self, install=False, cache_dir=None, build_dir=None):
+    self.build_dir = build_dir or get_kernel_path() + "build/"
+    self.cache = KernelObjectCache(cache_dir or self.build_dir + "kernel_cache/")
+    self.install = install
+    self.graph = None
+    self.current = {}  # kernel -> key of the objects in the build dir
+    self.dependents = {}  # target -> targets built from it
+    self.policy_mtime = None  # of the policy file at the last build
+
+  def path(self, p):
+    return os.path.normpath(os.path.join(self.build_dir, p))
+
+  def ninja(self, *args):
+    return subprocess.check_output(['ninja', '-C', self.build_dir] + list(args), stderr=subprocess.STDOUT).decode()
+
+  def load_graph(self):
+    self.graph = parse_dependency_graph(self.ninja('-t', 'deps').splitlines())
+
+  def keys(self, policy):
+    keys = {}
+    for kernel, node in self.graph.items():
+      flags = policy.get(kernel, tuple(get_default_policy().split(',')))
+      keys[kernel] = self.cache.key([self.path(dep) for dep in node['deps']], flags)
+    return keys
+
+  def outputs(self, kernel):
+    return [self.path(t) for t in self.graph[kernel]['targets']]
+
+  def users(self, targets):
+    """targets transitively built from targets (e.g. the linked binaries)"""
+    users = set()
+    todo = list(targets)
+    while todo:
+      target = todo.pop()
+      if target not in self.dependents:
+        self.dependents[target] = []
+        section = None
+        for line in self.ninja('-t', 'query', target).splitlines():
+          if line.startswith('  ') and not line.startswith('    '):
+            section = line.strip()
+          elif section == 'outputs:' and line.strip():
+            self.dependents[target].append(line.strip())
+      for user in self.dependents[target]:
+        if user not in users:
+          users.add(user)
+          todo.append(user)
+    return users
+
+  def remove(self, paths):
+    for path in paths:
+      if os.path.isfile(path):
+        os.remove(path)
+
+  def build(self, call_program):
+    # the build reads this snapshot, tuner threads keep updating the store
+    lines = get_policy_store().write()
+    policy = {}
+    for line in lines:
+      policy.setdefault(line.split(',')[0], tuple(line.strip().split(',')[1:]))
+    policy_path = get_policy_path()
+    compiled = []
+    if self.graph is None:
+      cmake_cmd = 'cmake -G Ninja -S {0} -B {1}'.format(get_kernel_path(), self.build_dir)
+      cmake_res = call_program(cmake_cmd)
+      assert cmake_res['returncode'] == 0
+      print("CMake finished")
+    else:
+      # changed kernels are handled here, so hide the new policy file from ninja
+      os.utime(policy_path, ns=(os.stat(policy_path).st_atime_ns, self.policy_mtime))
+      restored = []
+      for kernel, key in self.keys(policy).items():
+        if self.current.get(kernel) == key:
+          continue
+        self.current.pop(kernel, None)
+        if self.cache.restore(key, self.outputs(kernel)):
+          restored.extend(self.graph[kernel]['targets'])
+        else:
+          self.remove(self.outputs(kernel))
+          compiled.append((kernel, key))
+      # whatever links a restored object has to be relinked
+      self.remove(self.path(t) for t in self.users(restored))
+      print("Rebuilding", len(compiled), "of", len(self.graph), "kernels,",
+            self.cache.hits, "restored from the cache so far")
+      if compiled:
+        targets = ' '.join(t for kernel, key in compiled for t in self.graph[kernel]['targets'])
+        ninja_res = call_program('ninja -C {0} {1}'.format(self.build_dir, targets))
+        assert ninja_res['returncode'] == 0
+
+    ninja_res = call_program('ninja -C {0} '.format(self.build_dir))
+    print("Build finished")
+    assert ninja_res['returncode'] == 0
+    self.policy_mtime = os.stat(policy_path).st_mtime_ns
+
+    if self.graph is None:
+      # the deps log is only complete after the first build
+      self.load_graph()
+      compiled = list(self.keys(policy).items())
+    for kernel, key in compiled:
+      self.cache.store(key, self.outputs(kernel))
+    self.current = self.keys(policy)
+
+    if self.install:
+      call_program('ninja -C {0} install'.format(self.build_dir))
+    return ninja_res
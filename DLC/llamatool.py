@@ -1,4 +1,6 @@
+import math
 import re
+from collections import deque
 
 def remove_ansi(sometext):
     ansi_escape = re.compile(r'\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])')
@@ -25,4 +27,130 @@ def get_kernel_cycles(text):
     ret = []
     for item in r.findall(text):
         ret.append(max(int(item[0]), int(item[1])))
-    return ret
\ No newline at end of file
+    return ret
+
+class RunningStats:
+    """mean and variance of a stream of values (Welford's algorithm)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def variance(self):
+        if self.count < 2:
+            return float('inf')
+        return self.m2 / (self.count - 1)
+
+    def relative_ci(self, z=1.96):
+        """half width of the confidence interval of the mean, relative to the mean"""
+        if self.count < 2 or self.mean <= 0:
+            return float('inf')
+        return z * math.sqrt(self.variance() / self.count) / self.mean
+
+
+LAUNCH_START = '─' * 83 + ' '
+LAUNCH_END = '─' * 72
+CYCLES_RE = re.compile(r'k\[.+ (\d+) cycles.+ (\d+) cycles')
+
+class LlamaLogParser:
+    """
+    Line by line version of get_kernel_launches + get_kernel_info +
+    get_kernel_cycles, so a model run can be analyzed while it streams.
+    Only the current kernel launch block and the launches/cycles not paired
+    up yet are kept, memory does not grow with the length of the log.
+
+    The i-th kernel launch is charged the i-th cycle count, as in
+    diagnose_llama_result.
+    """
+
+    def __init__(self):
+        self.block = None  # text of the launch block being read
+        self.names = deque()  # launches waiting for their cycles
+        self.cycles = deque()  # cycles waiting for their launch
+        self.kernel_name_cycles = {}
+        self.launch_stats = {}  # kernel name -> RunningStats of cycles per launch
+        self.launch_count = 0
+        self.cycle_count = 0
+        self.total_cycles = 0
+
+    def feed(self, line):
+        for item in CYCLES_RE.findall(line):
+            cycle = max(int(item[0]), int(item[1]))
+            self.cycle_count += 1
+            self.total_cycles += cycle
+            self.cycles.append(cycle)
+        # launch markers never span lines, but a block usually does
+        while line:
+            if self.block is None:
+                start = line.find(LAUNCH_START)
+                if start < 0:
+                    break
+                self.block = []
+                line = line[start + len(LAUNCH_START):]
+            end = line.find(LAUNCH_END)
+            if end < 0:
+                self.block.append(line)
+                break
+            self.block.append(line[:end])
+            self.add_launch(''.join(self.block))
+            self.block = None
+            line = line[end + len(LAUNCH_END):]
+        self.pair()
+
+    def add_launch(self, text):
+        name, body = get_kernel_info(remove_ansi(text))
+        self.launch_count += 1
+        self.names.append(name)
+
+    def pair(self):
+        while self.names and self.cycles:
+            name = self.names.popleft()
+            cycle = self.cycles.popleft()
+            self.kernel_name_cycles[name] = self.kernel_name_cycles.get(name, 0) + cycle
+            if name not in self.launch_stats:
+                self.launch_stats[name] = RunningStats()
+            self.launch_stats[name].add(cycle)
+
+    def stable(self, names, min_launches, max_relative_ci):
+        """True once every kernel in names has min_launches launches and a
+        per launch mean known to within max_relative_ci"""
+        for name in names:
+            stats = self.launch_stats.get(name)
+            if stats is None or stats.count < min_launches:
+                return False
+            if stats.relative_ci() > max_relative_ci:
+                return False
+        return True
+
+    def finish(self, launch_counts=None):
+        """
+        returns (kernel name -> cycles, total cycles + 1)
+
+        for a log that was cut short, pass the launch counts of a complete
+        run; each kernel is then charged its mean cycles per launch times
+        that count, so the result is comparable to a complete run
+        """
+        if launch_counts is not None:
+            self.names.clear()
+            self.cycles.clear()
+            estimate = {}
+            for name, stats in self.launch_stats.items():
+                estimate[name] = int(stats.mean * launch_counts.get(name, stats.count))
+            return estimate, sum(estimate.values()) + 1
+        if self.launch_count != self.cycle_count:
+            print('Warning: kernel names and cycles length mismatch')
+            print('kernel length:', self.launch_count)
+            print('cycles length:', self.cycle_count)
+        # launches without cycles count as 0, extra cycles only add to the total
+        for name in self.names:
+            self.kernel_name_cycles.setdefault(name, 0)
+        self.names.clear()
+        self.cycles.clear()
+        return self.kernel_name_cycles, self.total_cycles + 1
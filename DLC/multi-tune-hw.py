@@ -14,13 +14,12 @@ from opentuner import MeasurementInterface
 from opentuner import EnumParameter
 from opentuner import Result
 from opentuner.search.driver import SearchDriver
+from opentuner.measurement.interface import ProgressPruner
+from opentuner.api import MultiTuningRunManager
 
 import argparse
-from multiprocessing.pool import ThreadPool
-from multiprocessing import Manager
-import multiprocessing
 from dlcutils import *
-from ctypes import c_int
+from kernelcache import IncrementalKernelBuilder
 import copy
 import os
 import signal
@@ -28,24 +27,14 @@ import signal
 
 parser = argparse.ArgumentParser(parents=opentuner.argparsers())
 parser.add_argument('--kernel', help='kernel name to tune')
-
-manager = Manager()
-test_res_list = manager.list()
-
-# sync across processes
-compile_ready_count = multiprocessing.Value(c_int, 0)
-compile_ready_count_lock = multiprocessing.Lock()
-test_ready_count = multiprocessing.Value(c_int, 0)
-test_ready_count_lock = multiprocessing.Lock()
+parser.add_argument('--resume-from-dir', help='tunerDB directory of an earlier run, each kernel resumes from its database there')
 
 
 class KernelFlagsTuner(MeasurementInterface):
   def __init__(self, *pargs, **kwargs):
-    super(KernelFlagsTuner, self).__init__(program_name=args.kernel, *pargs,
+    super(KernelFlagsTuner, self).__init__(program_name=pargs[0].kernel, *pargs,
                                             **kwargs)
     self.kernel_name = pargs[0].kernel
-    self.total_kernel = pargs[0].total_kernel
-    self.is_executor = pargs[0].is_executor
     self.log_path = pargs[0].log_path
     self.best_res = pargs[0].best_res
     self.best_cycle = 2 ** 32
@@ -53,14 +42,9 @@ class KernelFlagsTuner(MeasurementInterface):
     self.line_number, content = get_line_number(self.stragegy_path, self.kernel_name)
     info = ""
     if self.line_number == -1:
-      compile_ready_count_lock.acquire()
-      self.line_number = len(open(self.stragegy_path, 'r').readlines())
-      content = self.kernel_name + "," + get_default_policy() + "\n"
+      self.line_number, content = get_policy_store().setdefault(self.kernel_name, get_default_policy())
       info += "New kernel found, add to the end of the file\n"
       info += "line number: " + str(self.line_number) + "\n"
-      with open(self.stragegy_path, 'a') as file:
-        file.write(content)
-      compile_ready_count_lock.release()
     self.opt_flag = get_flag_dict(content.strip().split(',')[1:])
     # to record if it's tested
     self.option_record = {}
@@ -101,62 +85,31 @@ class KernelFlagsTuner(MeasurementInterface):
 
   def compile(self, cfg, id):
       """
-      Compile a given configuration in parallel
+      Write the policy of a given configuration, MultiKernelTuner builds
+      the policies of all kernels at once
       """
       # print("Compiling with configuration: ", cfg)
       self.set_opt_flag(cfg)
-      compile_ready_count_lock.acquire()
-      change_policy_file(self.line_number, self.kernel_name + "," + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
-      compile_ready_count.value += 1
-      compile_ready_count_lock.release()
-      # only one thread is allowed to compile
-      if self.is_executor:
-        build_dir = get_kernel_path() + "build/"
-        cmake_cmd = 'cmake -G Ninja -S {0} -B {1}'.format(get_kernel_path(), build_dir)
-        while compile_ready_count.value != self.total_kernel:
-          pass
-        cmake_res = self.call_program(cmake_cmd)
-        assert cmake_res['returncode'] == 0
-        print("CMake finished")
-        ninja_cmd = 'ninja -C {0} '.format(build_dir)
-        ninja_res = self.call_program(ninja_cmd)
-        print("Build finished")
-        assert ninja_res['returncode'] == 0
-        self.call_program('ninja -C {0} install'.format(build_dir))
-        # inform all threads that the compile is done
-        compile_ready_count_lock.acquire()
-        compile_ready_count.value = 0
-        compile_ready_count_lock.release()
-      else:
-        while compile_ready_count.value != 0:
-          pass
-      return {'returncode': 0, 'stdout': '', 'stderr': '', 'timeout': False, 'time': 0.1}
+      get_policy_store().set(self.kernel_name, [self.opt_flag[key] for key in opt_dim])
 
   def run_precompiled(self, desired_result, input, limit, compile_result, id):
     """
     Run a compile_result from compile() sequentially and return performance
     """
-    test_ready_count_lock.acquire()
     run_cmd = get_kernel_path() + "build/syntests/syntests -t " + self.kernel_name
+    # stop as soon as the cycles so far are worse than the best config
+    pruner = ProgressPruner(lambda line: get_line_cycles(line.decode(errors='replace')), self.driver.prune_bound(desired_result))
     print(self.get_prefix(), "Start to run the kernel")
-    run_result = self.call_program(run_cmd)
-    test_ready_count.value += 1
-    print(self.get_prefix(), "Kernel run finished, total run: ", test_ready_count.value)
-    test_ready_count_lock.release()
+    run_result = self.call_program(run_cmd, progress_callback=pruner, progress_stream='stderr')
+    print(self.get_prefix(), "Kernel run finished")
+    if run_result['aborted']:
+      print(self.get_prefix(), "Pruned, at least", pruner.total, "cycles")
+      return Result(state='TIMEOUT', time=pruner.total)
     cycle, succ, result_lines = diagnose_run_result(run_result['stderr'].decode().split('\n'))
     assert succ
     cycle = self.handle_results(cycle, run_result, result_lines)
     return Result(time = cycle)
 
-  def compile_and_run(self, desired_result, input, limit):
-    """
-    Compile and run a given configuration then
-    return performance
-    """
-    cfg = desired_result.configuration.data
-    compile_result = self.compile(cfg, 0)
-    return self.run_precompiled(desired_result, input, limit, compile_result, 0)
-  
   def extra_convergence_criteria(self, result):
     for res in result:
       self.option_record[opt_dim[0]][res.configuration.data[opt_dim[0]]] = 1
@@ -172,29 +125,13 @@ class KernelFlagsTuner(MeasurementInterface):
       # print(self.get_prefix() + "Testing current setting")
       self.old_performance = self.run_precompiled(Result(time = 0), None, 0, 0, 0).time
       self.best_cycle = self.old_performance
-      if self.is_executor:
-        while test_ready_count.value != self.total_kernel:
-          pass
-        test_ready_count_lock.acquire()
-        test_ready_count.value = 0
-        test_ready_count_lock.release()
-      else:
-        while test_ready_count.value != 0:
-          pass
       
-  def post_process(self):
-    if self.is_executor:
-      while test_ready_count.value != self.total_kernel:
-        pass
-      test_ready_count_lock.acquire()
-      test_ready_count.value = 0
-      test_ready_count_lock.release()
-    else:
-      while test_ready_count.value != 0:
-        pass
-  
   def save_final_config(self, configuration):
     """called at the end of tuning"""
+    # the best config may come from the measurement cache or an earlier run,
+    # neither goes through handle_results()
+    best = min(result.time for result in self.driver.results_query(config=configuration))
+    self.handle_best(best)
     if self.old_better:
       print(self.get_prefix(), "The original setting is better")
       self.opt_flag = self.old_flag.copy()
@@ -209,9 +146,8 @@ class KernelFlagsTuner(MeasurementInterface):
         f.write("Find a better setting\n")
       f.write("The best setting is: " + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
       f.write("The performance is: " + str(self.best_cycle) + "\n")
-    compile_ready_count_lock.acquire()
-    change_policy_file(self.line_number, self.kernel_name + "," + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
-    compile_ready_count_lock.release()
+    get_policy_store().set(self.kernel_name, [self.opt_flag[key] for key in opt_dim])
+    get_policy_store().write()
     
   def set_opt_flag(self, configuration):
     for key in configuration:
@@ -236,11 +172,14 @@ class KernelFlagsTuner(MeasurementInterface):
   def get_prefix(self):
     return "[" + self.kernel_name + "]"
   
-  def handle_results(self, cycle, run_result, result_lines):
+  def handle_best(self, cycle):
     if self.old_better and cycle < self.old_performance:
       self.old_better = False
     if cycle < self.best_cycle:
       self.best_cycle = cycle
+
+  def handle_results(self, cycle, run_result, result_lines):
+    self.handle_best(cycle)
     if result_lines:
       print(result_lines)
     else:
@@ -257,39 +196,50 @@ class KernelFlagsTuner(MeasurementInterface):
     return cycle
 
 
-class MultiKernelTuner():
+class MultiKernelTuner(MultiTuningRunManager):
+  """
+  Tunes all kernels in lock step: every generation writes one policy per
+  kernel, builds them with a single ninja run and runs the kernels one
+  after the other
+  """
   def __init__(self, *pargs, **kwargs):
     self.kernel_names = pargs[0].kernel.split(',')
-    self.thread_pool = ThreadPool(len(self.kernel_names))
-    self.kernel_params = []
+    self.kernel_builder = IncrementalKernelBuilder(install=True)
     self.db_path = pargs[0].database
+    # measurement cache entries are only reused for the same kernel sources
+    source_version = get_kernel_source_version()
     print(len(self.kernel_names), "kernels to tune")
-      
+    interfaces = []
     for i in range(len(self.kernel_names)):
       kernel_name = self.kernel_names[i]
       single_parg = copy.copy(pargs[0])
       single_parg.kernel = kernel_name
       single_parg.database = self.db_path + "/" + kernel_name + ".db"
+      single_parg.resume_from = get_resume_database(pargs[0].resume_from_dir, kernel_name)
       single_parg.log_path = self.db_path + "/" + kernel_name + "_log.txt"
       single_parg.best_res = self.db_path + "/" + kernel_name + "_best.txt"
-      single_parg.total_kernel = len(self.kernel_names)
-      if i == 0:
-        single_parg.is_executor = True
-      else:
-        single_parg.is_executor = False
       os.system("touch " + single_parg.database)
       os.system("touch " + single_parg.log_path)
       os.system("touch " + single_parg.best_res)
-      self.kernel_params.append(single_parg)
-      
-  def main(self):
-    self.thread_pool.map(KernelFlagsTuner.main, self.kernel_params)
-    self.thread_pool.close()      
+      interfaces.append(KernelFlagsTuner(single_parg, program_version=source_version))
+    super(MultiKernelTuner, self).__init__(interfaces)
+
+  def compile_batch(self, batch):
+    for interface, desired_result, input in batch:
+      interface.compile(desired_result.configuration.data, desired_result.id)
+    # only kernels whose sources or policy flags changed are recompiled
+    self.kernel_builder.build(batch[0][0].call_program)
+    compile_result = {'returncode': 0, 'stdout': '', 'stderr': '', 'timeout': False, 'time': 0.1}
+    return [compile_result] * len(batch)
+
+  def run_batch(self, batch, compile_results):
+    return [interface.run_precompiled(desired_result, input, desired_result.limit, compile_result, desired_result.id)
+            for (interface, desired_result, input), compile_result in zip(batch, compile_results)]
     
 def signal_handler(self, sig):
   print(self.get_prefix(), "Caught signal", sig, "write the original setting back")
-  with open(get_policy_path(), 'w') as file:
-    file.writelines(original_setting)
+  get_policy_store().reset(original_setting)
+  get_policy_store().write()
 
 if __name__ == '__main__':
   args = parser.parse_args()
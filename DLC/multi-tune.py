@@ -17,9 +17,9 @@ from opentuner.search.driver import SearchDriver
 
 import argparse
 from multiprocessing.pool import ThreadPool
-import multiprocessing
 from dlcutils import *
-from ctypes import c_int
+from buildcoordinator import BatchCoordinator
+from kernelcache import IncrementalKernelBuilder
 import copy
 import os
 import signal
@@ -27,20 +27,20 @@ import signal
 
 parser = argparse.ArgumentParser(parents=opentuner.argparsers())
 parser.add_argument('--kernel', help='kernel name to tune')
+parser.add_argument('--sync-timeout', type=float, help='seconds to wait for the other kernels before aborting')
+parser.add_argument('--resume-from-dir', help='tunerDB directory of an earlier run, each kernel resumes from its database there')
+
+# created by MultiKernelTuner once the number of kernels is known
+kernel_builder = None
+build_coordinator = None
+test_coordinator = None
 
-# sync across processes
-compile_ready_count = multiprocessing.Value(c_int, 0)
-compile_ready_count_lock = multiprocessing.Lock()
-test_ready_count = multiprocessing.Value(c_int, 0)
-test_ready_count_lock = multiprocessing.Lock()
 
 class KernelFlagsTuner(MeasurementInterface):
   def __init__(self, *pargs, **kwargs):
     super(KernelFlagsTuner, self).__init__(program_name=args.kernel, *pargs,
                                             **kwargs)
     self.kernel_name = pargs[0].kernel
-    self.total_kernel = pargs[0].total_kernel
-    self.is_executor = pargs[0].is_executor
     self.log_path = pargs[0].log_path
     self.best_res = pargs[0].best_res
     self.best_cycle = 2 ** 32
@@ -48,14 +48,9 @@ class KernelFlagsTuner(MeasurementInterface):
     self.line_number, content = get_line_number(self.stragegy_path, self.kernel_name)
     info = ""
     if self.line_number == -1:
-      compile_ready_count_lock.acquire()
-      self.line_number = len(open(self.stragegy_path, 'r').readlines())
-      content = self.kernel_name + "," + get_default_policy() + "\n"
+      self.line_number, content = get_policy_store().setdefault(self.kernel_name, get_default_policy())
       info += "New kernel found, add to the end of the file\n"
       info += "line number: " + str(self.line_number) + "\n"
-      with open(self.stragegy_path, 'a') as file:
-        file.write(content)
-      compile_ready_count_lock.release()
     self.opt_flag = get_flag_dict(content.strip().split(',')[1:])
     # to record if it's tested
     self.option_record = {}
@@ -100,30 +95,13 @@ class KernelFlagsTuner(MeasurementInterface):
       """
       # print("Compiling with configuration: ", cfg)
       self.set_opt_flag(cfg)
-      compile_ready_count_lock.acquire()
-      change_policy_file(self.line_number, self.kernel_name + "," + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
-      compile_ready_count.value += 1
-      compile_ready_count_lock.release()
-      # only one thread is allowed to compile
-      if self.is_executor:
-        build_dir = get_kernel_path() + "build/"
-        cmake_cmd = 'cmake -G Ninja -S {0} -B {1}'.format(get_kernel_path(), build_dir)
-        while compile_ready_count.value != self.total_kernel:
-          pass
-        cmake_res = self.call_program(cmake_cmd)
-        assert cmake_res['returncode'] == 0
-        print("CMake finished")
-        ninja_cmd = 'ninja -C {0} '.format(build_dir)
-        ninja_res = self.call_program(ninja_cmd)
-        print("Build finished")
-        assert ninja_res['returncode'] == 0
-        # inform all threads that the compile is done
-        compile_ready_count_lock.acquire()
-        compile_ready_count.value = 0
-        compile_ready_count_lock.release()
-      else:
-        while compile_ready_count.value != 0:
-          pass
+      get_policy_store().set(self.kernel_name, [self.opt_flag[key] for key in opt_dim])
+      # the last kernel to write its policy runs one build for all of them
+      return build_coordinator.submit(self.kernel_name, self.build_kernels)
+
+  def build_kernels(self, kernel_names):
+      # only kernels whose sources or policy flags changed are recompiled
+      kernel_builder.build(self.call_program)
       return {'returncode': 0, 'stdout': '', 'stderr': '', 'timeout': False, 'time': 0.1}
 
   def run_precompiled(self, desired_result, input, limit, compile_result, id):
@@ -133,10 +111,7 @@ class KernelFlagsTuner(MeasurementInterface):
     run_cmd = get_kernel_path() + "build/syntests/syntests -t " + self.kernel_name
     print(self.get_prefix(), "Start to run the kernel")
     run_result = self.call_program(run_cmd)
-    test_ready_count_lock.acquire()
-    test_ready_count.value += 1
-    print(self.get_prefix(), "Kernel run finished, total run: ", test_ready_count.value)
-    test_ready_count_lock.release()
+    print(self.get_prefix(), "Kernel run finished")
     cycle, succ, result_lines = diagnose_run_result(run_result['stderr'].decode().split('\n'))
     assert succ
     if self.old_better and cycle < self.old_performance:
@@ -182,26 +157,13 @@ class KernelFlagsTuner(MeasurementInterface):
       print(self.get_prefix() + "Testing current setting")
       self.old_performance = self.run_precompiled(Result(time = 0), None, 0, 0, 0).time
       self.best_cycle = self.old_performance
-      if self.is_executor:
-        while test_ready_count.value != self.total_kernel:
-          pass
-        test_ready_count_lock.acquire()
-        test_ready_count.value = 0
-        test_ready_count_lock.release()
-      else:
-        while test_ready_count.value != 0:
-          pass
+      test_coordinator.submit(self.kernel_name)
       
   def post_process(self):
-    if self.is_executor:
-      while test_ready_count.value != self.total_kernel:
-        pass
-      test_ready_count_lock.acquire()
-      test_ready_count.value = 0
-      test_ready_count_lock.release()
-    else:
-      while test_ready_count.value != 0:
-        pass
+    # this kernel builds nothing more this generation while the others may
+    # still be taking samples, nobody rebuilds until every kernel finished
+    build_coordinator.pause()
+    test_coordinator.submit(self.kernel_name, resume_builds)
   
   def save_final_config(self, configuration):
     """called at the end of tuning"""
@@ -219,9 +181,8 @@ class KernelFlagsTuner(MeasurementInterface):
         f.write("Find a better setting\n")
       f.write("The best setting is: " + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
       f.write("The performance is: " + str(self.best_cycle) + "\n")
-    compile_ready_count_lock.acquire()
-    change_policy_file(self.line_number, self.kernel_name + "," + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
-    compile_ready_count_lock.release()
+    get_policy_store().set(self.kernel_name, [self.opt_flag[key] for key in opt_dim])
+    get_policy_store().write()
     
   def set_opt_flag(self, configuration):
     for key in configuration:
@@ -247,10 +208,18 @@ class KernelFlagsTuner(MeasurementInterface):
     return "[" + self.kernel_name + "]"
 
 
+def resume_builds(kernel_names):
+  build_coordinator.resume_all()
+
+
 class MultiKernelTuner():
   def __init__(self, *pargs, **kwargs):
+    global kernel_builder, build_coordinator, test_coordinator
     self.kernel_names = pargs[0].kernel.split(',')
     self.thread_pool = ThreadPool(len(self.kernel_names))
+    kernel_builder = IncrementalKernelBuilder(install=False)
+    build_coordinator = BatchCoordinator(len(self.kernel_names), pargs[0].sync_timeout, "build")
+    test_coordinator = BatchCoordinator(len(self.kernel_names), pargs[0].sync_timeout, "test")
     self.kernel_params = []
     self.db_path = pargs[0].database
     print(len(self.kernel_names), "kernels to tune")
@@ -260,29 +229,40 @@ class MultiKernelTuner():
       single_parg = copy.copy(pargs[0])
       single_parg.kernel = kernel_name
       single_parg.database = self.db_path + "/" + kernel_name + ".db"
+      single_parg.resume_from = get_resume_database(pargs[0].resume_from_dir, kernel_name)
       single_parg.log_path = self.db_path + "/" + kernel_name + "_log.txt"
       single_parg.best_res = self.db_path + "/" + kernel_name + "_best.txt"
-      single_parg.total_kernel = len(self.kernel_names)
-      if i == 0:
-        single_parg.is_executor = True
-      else:
-        single_parg.is_executor = False
       os.system("touch " + single_parg.database)
       os.system("touch " + single_parg.log_path)
       os.system("touch " + single_parg.best_res)
       self.kernel_params.append(single_parg)
       
   def main(self):
-    self.thread_pool.map(KernelFlagsTuner.main, self.kernel_params)
-    self.thread_pool.close()      
+    self.thread_pool.map(self.tune_kernel, self.kernel_params)
+    self.thread_pool.close()
+
+  def tune_kernel(self, kernel_args):
+    try:
+      KernelFlagsTuner.main(kernel_args)
+    except BaseException as e:
+      # wake up the other kernels instead of leaving them waiting forever
+      build_coordinator.abort(e)
+      test_coordinator.abort(e)
+      raise
+    finally:
+      build_coordinator.leave()
+      test_coordinator.leave()
     
 def signal_handler(self, sig):
   print(self.get_prefix(), "Caught signal", sig, "write the original setting back")
-  with open(get_policy_path(), 'w') as file:
-    file.writelines(original_setting)
+  get_policy_store().reset(original_setting)
+  get_policy_store().write()
 
 if __name__ == '__main__':
   args = parser.parse_args()
+  if args.measurement_cache:
+    # a cache hit skips compile(), the other kernels would wait for it at the build barrier
+    parser.error("--measurement-cache is not supported, use multi-tune-hw.py")
   args.parallelism = 1
   args.test_limit = 12
   args.stop_after = 3 * 60 # 3min
@@ -18,35 +18,40 @@ from opentuner.search.driver import SearchDriver
 import argparse
 from multiprocessing.pool import ThreadPool
 from multiprocessing import Manager
-import multiprocessing
 from dlcutils import *
-from ctypes import c_int
+from buildcoordinator import BatchCoordinator
+from kernelcache import IncrementalKernelBuilder
 import copy
 import os
 import signal
 import subprocess
+import threading
 
 
 parser = argparse.ArgumentParser(parents=opentuner.argparsers())
 parser.add_argument('--kernel', help='kernel name to tune')
+parser.add_argument('--sync-timeout', type=float, help='seconds to wait for the other kernels before aborting')
+parser.add_argument('--resume-from-dir', help='tunerDB directory of an earlier run, each kernel resumes from its database there')
+parser.add_argument('--early-stop-ci', type=float,
+                    help='stop a model run once the per launch cycles of every tuned kernel are known to within this relative confidence interval (e.g. 0.02)')
+parser.add_argument('--early-stop-min-launches', type=int, default=30,
+                    help='launches of each tuned kernel to see before stopping a model run early')
 
-# manager = Manager()
-test_res_list = {}
-
-# sync across processes
-compile_ready_count = multiprocessing.Value(c_int, 0)
-compile_ready_count_lock = multiprocessing.Lock()
-test_ready_count = multiprocessing.Value(c_int, 0)
-test_ready_count_lock = multiprocessing.Lock()
-iteration_count = multiprocessing.Value(c_int, 0)
+# sync across the kernel tuner threads
+# created by MultiKernelTuner once the number of kernels is known
+kernel_builder = None
+build_coordinator = None
+model_coordinator = None
+policy_coordinator = None
+iteration_count = 0
+# launches per kernel of the last complete model run, to scale early stopped runs
+reference_launch_counts = None
 
 class KernelFlagsTuner(MeasurementInterface):
   def __init__(self, *pargs, **kwargs):
     super(KernelFlagsTuner, self).__init__(program_name=args.kernel, *pargs,
                                             **kwargs)
     self.kernel_name = pargs[0].kernel
-    self.total_kernel = pargs[0].total_kernel
-    self.is_executor = pargs[0].is_executor
     self.log_root = pargs[0].log_root
     self.log_path = pargs[0].log_path
     self.best_res = pargs[0].best_res
@@ -55,14 +60,9 @@ class KernelFlagsTuner(MeasurementInterface):
     self.line_number, content = get_line_number(self.stragegy_path, self.kernel_name)
     info = ""
     if self.line_number == -1:
-      compile_ready_count_lock.acquire()
-      self.line_number = len(open(self.stragegy_path, 'r').readlines())
-      content = self.kernel_name + "," + get_default_policy() + "\n"
+      self.line_number, content = get_policy_store().setdefault(self.kernel_name, get_default_policy())
       info += "New kernel found, add to the end of the file\n"
       info += "line number: " + str(self.line_number) + "\n"
-      with open(self.stragegy_path, 'a') as file:
-        file.write(content)
-      compile_ready_count_lock.release()
     self.opt_flag = get_flag_dict(content.strip().split(',')[1:])
     self.best_opt_flag = self.opt_flag.copy()
     # to record if it's tested
@@ -108,96 +108,64 @@ class KernelFlagsTuner(MeasurementInterface):
       """
       # print("Compiling with configuration: ", cfg)
       self.set_opt_flag(cfg)
-      compile_ready_count_lock.acquire()
-      change_policy_file(self.line_number, self.kernel_name + "," + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
-      compile_ready_count.value += 1
-      # print(self.get_prefix(), "Compile ready count: ", compile_ready_count.value)
-      compile_ready_count_lock.release()
-      # only one thread is allowed to compile
-      if self.is_executor:
-        build_dir = get_kernel_path() + "build/"
-        cmake_cmd = 'cmake -G Ninja -S {0} -B {1}'.format(get_kernel_path(), build_dir)
-        while compile_ready_count.value != self.total_kernel:
-          pass
-        cmake_res = self.call_program(cmake_cmd)
-        assert cmake_res['returncode'] == 0
-        print("CMake finished")
-        ninja_cmd = 'ninja -C {0} '.format(build_dir)
-        ninja_res = self.call_program(ninja_cmd)
-        print("Build finished")
-        assert ninja_res['returncode'] == 0
-        self.call_program('ninja -C {0} install'.format(build_dir))
-        # inform all threads that the compile is done
-        compile_ready_count_lock.acquire()
-        compile_ready_count.value = 0
-        compile_ready_count_lock.release()
-      else:
-        while compile_ready_count.value != 0:
-          pass
+      get_policy_store().set(self.kernel_name, [self.opt_flag[key] for key in opt_dim])
+      # the last kernel to write its policy runs one build for all of them
+      return build_coordinator.submit(self.kernel_name, self.build_kernels)
+
+  def build_kernels(self, kernel_names):
+      # only kernels whose sources or policy flags changed are recompiled
+      kernel_builder.build(self.call_program)
       return {'returncode': 0, 'stdout': '', 'stderr': '', 'timeout': False, 'time': 0.1}
 
   def run_precompiled(self, desired_result, input, limit, compile_result, id):
     """
     Run a compile_result from compile() sequentially and return performance
     """
-    global test_res_list
-    test_ready_count_lock.acquire()
-    # only one thread is allowed to run the model
-    if self.is_executor:
-      run_cmd = "ACCELERATE_TORCH_DEVICE=dlc python sft_trainer.py --device=dlc"
-      print("Executor starts to run the model")
-      os.chdir(get_llama_path())
-      # try:
-      #   with open(self.log_root + "log.ansi", 'r') as f:
-      #     run_result = f.read()
-      # except:
-      #   run_result = ""
-      #   print("No log file found")
-      # popen = subprocess.Popen(run_cmd, stdout=subprocess.PIPE, universal_newlines=True, shell=True)
-      # for stdout_line in iter(popen.stdout.readline, ""):
-      #     print(stdout_line, end="")
-      #     run_result += stdout_line
-      # popen.stdout.close()
-      # return_code = popen.wait()
-      # if return_code:
-      #     raise subprocess.CalledProcessError(return_code, run_cmd)
-      
-      run_result = ""
-      with subprocess.Popen(run_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, universal_newlines=True, shell=True) as p:
+    # one model run measures every kernel
+    kernel_to_cycle = model_coordinator.submit(self.kernel_name, self.run_model)
+    cycle = self.handle_results(kernel_to_cycle[self.kernel_name])
+    return Result(time = cycle)
+
+  def run_model(self, kernel_names):
+    global iteration_count, reference_launch_counts
+    run_cmd = "ACCELERATE_TORCH_DEVICE=dlc python sft_trainer.py --device=dlc"
+    print("Start to run the model")
+    os.chdir(get_llama_path())
+    # early stopping needs a complete run first to know how often each kernel launches
+    watched = None
+    if self.args.early_stop_ci is not None and reference_launch_counts is not None:
+      name_to_kernel = get_register_name_to_kernel()
+      watched = [name for name in reference_launch_counts if get_launch_kernel(name, name_to_kernel) in kernel_names]
+    stopped = False
+    # the log is parsed and saved while it streams, never held in memory
+    log_path = self.log_root + "llama_iter" + str(iteration_count) + ".log"
+    parser = LlamaLogParser()
+    with open(log_path, 'w', buffering=1 << 20) as log:
+      with subprocess.Popen(run_cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, bufsize=1, universal_newlines=True, shell=True, start_new_session=True) as p:
+        checked = 0
         for line in p.stdout:
             print(line, end='') # process line here
-            run_result += line
-      print("Model run finished")
-      
-      # save the log
-      subprocess.call("touch " + self.log_root + "llama_iter" + str(iteration_count.value) + ".log", shell=True)
-      with open(self.log_root + "llama_iter" + str(iteration_count.value) + ".log", 'w') as f:
-        f.write(run_result)
-      print("Log saved")
-      # with open('/home/test/lanhu/autotune/logs/1727544383/llama_iter0.log') as f:
-      #   run_result = f.read()
-      iteration_count.value += 1
-      
-      # analyze the result
-      kernel_to_cycle, total_cycle = diagnose_llama_result(run_result)
-      test_res_list = kernel_to_cycle.copy()
-      print("Total cycle: ", total_cycle)
+            log.write(line)
+            parser.feed(line)
+            if watched is not None and parser.cycle_count != checked:
+              checked = parser.cycle_count
+              if parser.stable(watched, self.args.early_stop_min_launches, self.args.early_stop_ci):
+                print("Kernel cycles are stable, stopping the model run")
+                os.killpg(p.pid, signal.SIGTERM)
+                stopped = True
+                break
+    print("Model run finished")
+    print("Log saved")
+    iteration_count += 1
     
-    test_ready_count.value += 1
-    # print(self.get_prefix(), "Test ready count: ", test_ready_count.value)
-    test_ready_count_lock.release()
-    
-    if self.is_executor:
-      while test_ready_count.value != self.total_kernel:
-        pass
-      test_ready_count_lock.acquire()
-      test_ready_count.value = 0
-      test_ready_count_lock.release()
+    # analyze the result
+    if stopped:
+      kernel_to_cycle, total_cycle = diagnose_llama_log(parser, reference_launch_counts)
     else:
-      while test_ready_count.value != 0:
-        pass
-    cycle = self.handle_results(test_res_list[self.kernel_name])
-    return Result(time = cycle)
+      reference_launch_counts = dict((name, stats.count) for name, stats in parser.launch_stats.items())
+      kernel_to_cycle, total_cycle = diagnose_llama_log(parser)
+    print("Total cycle: ", total_cycle)
+    return kernel_to_cycle
 
   def compile_and_run(self, desired_result, input, limit):
     """
@@ -226,21 +194,17 @@ class KernelFlagsTuner(MeasurementInterface):
       
   def post_process(self):
     # every_iteraton, we need to save the best result
-    compile_ready_count_lock.acquire()
-    change_policy_file(self.line_number, self.kernel_name + "," + ",".join([str(self.best_opt_flag[key]) for key in opt_dim]) + "\n")
-    compile_ready_count.value += 1
-    compile_ready_count_lock.release()
-    
-    if self.is_executor:
-      while compile_ready_count.value != self.total_kernel:
-        pass
-      subprocess.call("cp " + get_policy_path() + " " + self.log_root +  "strategy_iter" + str(iteration_count.value - 1) + ".csv", shell=True)
-      compile_ready_count_lock.acquire()
-      compile_ready_count.value = 0
-      compile_ready_count_lock.release()
-    else:
-      while compile_ready_count.value != 0:
-        pass
+    get_policy_store().set(self.kernel_name, [self.best_opt_flag[key] for key in opt_dim])
+    # the other kernels may still be taking samples, they build and run the
+    # model without this one until every kernel finished the generation
+    build_coordinator.pause()
+    model_coordinator.pause()
+    policy_coordinator.submit(self.kernel_name, self.save_policy)
+
+  def save_policy(self, kernel_names):
+    get_policy_store().write(self.log_root + "strategy_iter" + str(iteration_count - 1) + ".csv")
+    build_coordinator.resume_all()
+    model_coordinator.resume_all()
       
   def execute(cmd):
     popen = subprocess.Popen(cmd, stdout=subprocess.PIPE, universal_newlines=True, shell=True)
@@ -268,9 +232,8 @@ class KernelFlagsTuner(MeasurementInterface):
         f.write("Find a better setting\n")
       f.write("The best setting is: " + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
       f.write("The performance is: " + str(self.best_cycle) + "\n")
-    compile_ready_count_lock.acquire()
-    change_policy_file(self.line_number, self.kernel_name + "," + ",".join([str(self.opt_flag[key]) for key in opt_dim]) + "\n")
-    compile_ready_count_lock.release()
+    get_policy_store().set(self.kernel_name, [self.opt_flag[key] for key in opt_dim])
+    get_policy_store().write()
     
   def set_opt_flag(self, configuration):
     for key in configuration:
@@ -312,8 +275,13 @@ class KernelFlagsTuner(MeasurementInterface):
 
 class MultiKernelTuner():
   def __init__(self, *pargs, **kwargs):
+    global kernel_builder, build_coordinator, model_coordinator, policy_coordinator
     self.kernel_names = pargs[0].kernel.split(',')
     self.thread_pool = ThreadPool(len(self.kernel_names))
+    kernel_builder = IncrementalKernelBuilder(install=True)
+    build_coordinator = BatchCoordinator(len(self.kernel_names), pargs[0].sync_timeout, "build")
+    model_coordinator = BatchCoordinator(len(self.kernel_names), pargs[0].sync_timeout, "model")
+    policy_coordinator = BatchCoordinator(len(self.kernel_names), pargs[0].sync_timeout, "policy")
     self.kernel_params = []
     self.db_path = pargs[0].database
     print(len(self.kernel_names), "kernels to tune")
@@ -324,29 +292,41 @@ class MultiKernelTuner():
       single_parg.kernel = kernel_name
       single_parg.log_root = self.db_path + "/../"
       single_parg.database = self.db_path + "/" + kernel_name + ".db"
+      single_parg.resume_from = get_resume_database(pargs[0].resume_from_dir, kernel_name)
       single_parg.log_path = self.db_path + "/" + kernel_name + "_log.txt"
       single_parg.best_res = self.db_path + "/" + kernel_name + "_best.txt"
-      single_parg.total_kernel = len(self.kernel_names)
-      if i == 0:
-        single_parg.is_executor = True
-      else:
-        single_parg.is_executor = False
       os.system("touch " + single_parg.database)
       os.system("touch " + single_parg.log_path)
       os.system("touch " + single_parg.best_res)
       self.kernel_params.append(single_parg)
       
   def main(self):
-    self.thread_pool.map(KernelFlagsTuner.main, self.kernel_params)
-    self.thread_pool.close()      
+    self.thread_pool.map(self.tune_kernel, self.kernel_params)
+    self.thread_pool.close()
+
+  def tune_kernel(self, kernel_args):
+    coordinators = [build_coordinator, model_coordinator, policy_coordinator]
+    try:
+      KernelFlagsTuner.main(kernel_args)
+    except BaseException as e:
+      # wake up the other kernels instead of leaving them waiting forever
+      for coordinator in coordinators:
+        coordinator.abort(e)
+      raise
+    finally:
+      for coordinator in coordinators:
+        coordinator.leave()
     
 def signal_handler(self, sig):
   print(self.get_prefix(), "Caught signal", sig, "write the original setting back")
-  with open(get_policy_path(), 'w') as file:
-    file.writelines(original_setting)
+  get_policy_store().reset(original_setting)
+  get_policy_store().write()
 
 if __name__ == '__main__':
   args = parser.parse_args()
+  if args.measurement_cache:
+    # a cache hit skips compile(), the other kernels would wait for it at the build barrier
+    parser.error("--measurement-cache is not supported, use multi-tune-hw.py")
   args.parallelism = 1
   args.test_limit = 12
   # args.stop_after = 3 * 60 # 3min
@@ -555,10 +555,10 @@ class ComputeAtStoreAtParser(object):
 
 class HalideConfigurationManipulator(ConfigurationManipulator):
     def __init__(self, halide_tuner):
-        super(HalideConfigurationManipulator, self).__init__()
+        super(HalideConfigurationManipulator, self).__init__(hash_cache_size=10000)
         self.halide_tuner = halide_tuner
 
-    def hash_config(self, config):
+    def _hash_config(self, config):
         """
         Multiple configs can lead to the same schedule, so we provide a custom
         hash function that hashes the resulting schedule instead of the raw config.
@@ -570,7 +570,7 @@ class HalideConfigurationManipulator(ConfigurationManipulator):
             return hashlib.sha256(schedule).hexdigest()
         except:
             log.warning('error hashing config', exc_info=True)
-            return super(HalideConfigurationManipulator, self).hash_config(config)
+            return super(HalideConfigurationManipulator, self)._hash_config(config)
 
 
 class HalideComputeAtScheduleParameter(ScheduleParameter):
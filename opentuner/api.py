@@ -1,7 +1,10 @@
+import logging
 from datetime import datetime
 
 from opentuner import tuningrunmain
 
+log = logging.getLogger(__name__)
+
 
 class TuningRunManager(tuningrunmain.TuningRunMain):
     """
@@ -84,3 +87,122 @@ class TuningRunManager(tuningrunmain.TuningRunMain):
         self.tuning_run.end_date = datetime.now()
         self.commit(force=True)
         self.session.close()
+        self.measurement_driver.close()
+
+    def abort(self):
+        """
+        Mark the tuning run as aborted and close database connections.
+        """
+        self.tuning_run.state = 'ABORTED'
+        self.tuning_run.end_date = datetime.now()
+        self.commit(force=True)
+        self.session.close()
+        self.measurement_driver.close()
+
+
+class MultiTuningRunManager(object):
+    """
+    This class tunes several programs in lock step in one process, with one
+    TuningRunManager per measurement interface (each with its own args and
+    database).  Every generation takes the next test of each program that is
+    still tuning and measures them with one compile_batch() and one
+    run_batch() call, e.g. so that one build covers all of the programs.
+    """
+
+    def __init__(self, measurement_interfaces):
+        self.managers = [TuningRunManager(interface, interface.args)
+                         for interface in measurement_interfaces]
+
+    def compile_batch(self, batch):
+        """
+        Compile a list of (measurement_interface, desired_result, input) and
+        return a compile result for each, passed to run_batch().  By default
+        calls compile() of the interfaces with parallel_compile.
+        """
+        return [interface.compile(dr.configuration.data, dr.id)
+                if interface.parallel_compile else None
+                for interface, dr, input in batch]
+
+    def run_batch(self, batch, compile_results):
+        """
+        Measure a list of (measurement_interface, desired_result, input) and
+        return a Result for each.  By default measures them one at a time.
+        """
+        results = []
+        for (interface, dr, input), compile_result in zip(batch, compile_results):
+            if interface.parallel_compile:
+                results.append(interface.run_precompiled(
+                    dr, input, dr.limit, compile_result, dr.id))
+            else:
+                results.append(interface.compile_and_run(dr, input, dr.limit))
+        return results
+
+    def next_desired_result(self, manager):
+        """
+        The next test of manager that is not in the measurement cache, claimed
+        and with an input selected, or None.
+        """
+        while True:
+            dr = manager.get_next_desired_result()
+            if dr is None:
+                return None
+            if not manager.measurement_driver.run_cached(dr):
+                return dr, manager.measurement_driver.prepare_run(dr)
+
+    def measure(self, batch):
+        """
+        Measure a list of (manager, desired_result, input) and report the
+        Results to their managers.
+        """
+        tests = [(manager.measurement_interface, dr, input)
+                 for manager, dr, input in batch]
+        for interface, dr, input in tests:
+            interface.pre_process()
+        compile_results = self.compile_batch(tests)
+        results = self.run_batch(tests, compile_results)
+        if len(results) != len(tests):
+            raise RuntimeError('run_batch() returned %d results for %d '
+                               'desired results' % (len(results), len(tests)))
+        for interface, dr, input in tests:
+            interface.post_process()
+            if interface.parallel_compile:
+                interface.cleanup(dr.id)
+        for (manager, dr, input), result in zip(batch, results):
+            manager.measurement_driver.finish_run(dr, result, input)
+
+    def finish(self, manager):
+        manager.search_driver.process_new_results()
+        if manager.get_best_result() is None:
+            log.warning('%s: no results, aborting its tuning run',
+                        manager.measurement_interface.program_name())
+            manager.abort()
+        else:
+            manager.finish()
+
+    def main(self):
+        """
+        Tune until every program meets its convergence criteria (or has not
+        requested a test in --bail-threshold generations).
+        """
+        active = list(self.managers)
+        idle = dict((id(manager), 0) for manager in active)
+        try:
+            while active:
+                batch = []
+                for manager in list(active):
+                    done = manager.search_driver.convergence_criteria()
+                    test = None if done else self.next_desired_result(manager)
+                    if test is not None:
+                        idle[id(manager)] = 0
+                        batch.append((manager,) + test)
+                        continue
+                    idle[id(manager)] += 1
+                    if done or idle[id(manager)] > manager.args.bail_threshold:
+                        active.remove(manager)
+                        self.finish(manager)
+                if batch:
+                    self.measure(batch)
+        except:
+            for manager in active:
+                manager.abort()
+            raise
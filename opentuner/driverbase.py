@@ -1,6 +1,47 @@
 from opentuner.resultsdb.models import *
 
 
+class ResultIndex(object):
+    """
+    in-memory index of the Results and DesiredResults of a tuning run keyed
+    by Configuration hash, used to answer has_results() and duplicate
+    detection without querying the database
+    """
+
+    def __init__(self):
+        self.results = dict()  # config hash -> [Result]
+        self.requests = dict()  # config hash -> first DesiredResult
+        self.result_ids = set()
+
+    @staticmethod
+    def key(config):
+        return config.hash
+
+    def add_result(self, result):
+        """record result, returns False if it was already indexed"""
+        if result.id is not None:
+            if result.id in self.result_ids:
+                return False
+            self.result_ids.add(result.id)
+        self.results.setdefault(self.key(result.configuration), []).append(result)
+        return True
+
+    def add_request(self, desired_result):
+        """record desired_result unless its configuration was requested before"""
+        self.requests.setdefault(self.key(desired_result.configuration),
+                                 desired_result)
+
+    def has_results(self, config):
+        return self.key(config) in self.results
+
+    def results_for(self, config):
+        return self.results.get(self.key(config), [])
+
+    def first_request(self, config):
+        """the earliest DesiredResult for config, or None"""
+        return self.requests.get(self.key(config))
+
+
 class DriverBase(object):
     """
     shared base class between MeasurementDriver and SearchDriver
@@ -12,6 +53,7 @@ class DriverBase(object):
                  objective,
                  tuning_run_main,
                  args,
+                 result_index=None,
                  **kwargs):
         self.args = args
         self.objective = objective
@@ -19,11 +61,15 @@ class DriverBase(object):
         self.tuning_run_main = tuning_run_main
         self.tuning_run = tuning_run
         self.program = tuning_run.program
+        if result_index is None:
+            result_index = ResultIndex()
+        self.result_index = result_index
 
     def results_query(self,
                       generation=None,
                       objective_ordered=False,
-                      config=None):
+                      config=None,
+                      input_class=None):
         self.session.flush()
         q = self.session.query(Result)
         q = q.filter_by(tuning_run=self.tuning_run)
@@ -31,6 +77,10 @@ class DriverBase(object):
         if config:
             q = q.filter_by(configuration=config)
 
+        if input_class is not None:
+            subq = self.session.query(Input.id).filter_by(input_class=input_class)
+            q = q.filter(Result.input_id.in_(subq.subquery()))
+
         if generation is not None:
             subq = (self.session.query(DesiredResult.result_id)
                     .filter_by(tuning_run=self.tuning_run,
@@ -42,6 +92,19 @@ class DriverBase(object):
 
         return q
 
+    def is_full_fidelity(self, result):
+        """
+        False for results measured on a reduced fidelity input class (see
+        FidelityInputManager), those are only seen by the technique that
+        requested them
+        """
+        input = result.input
+        full = self.tuning_run.input_class
+        if input is None or input.input_class is None or full is None:
+            return True
+        return (input.input_class is full or
+                (full.id is not None and input.input_class.id == full.id))
+
     def requests_query(self):
         q = self.session.query(DesiredResult).filter_by(tuning_run=self.tuning_run)
         return q
@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import time
+from builtins import object
+
+log = logging.getLogger(__name__)
+
+RESULT_FIELDS = ('state', 'time', 'accuracy', 'energy', 'size', 'confidence')
+
+
+class MeasurementCache(object):
+    """
+    persistent store of measured Result fields shared between tuning runs,
+    kept in its own sqlite file so it outlives the per-run results database
+
+    entries are keyed on (program version, input class, machine class,
+    configuration hash) and expire after max_age seconds
+    """
+
+    def __init__(self, path, max_age=None):
+        self.path = path
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self.connection = sqlite3.connect(path, timeout=60)
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS measurement_cache ('
+            ' key TEXT PRIMARY KEY, collection_date REAL, {0})'.format(
+                ', '.join(RESULT_FIELDS)))
+        self.prune()
+
+    @staticmethod
+    def key(program_version, input_class, machine_class, configuration_hash):
+        """cache key for a configuration measured in the given environment"""
+        parts = (program_version.project,
+                 program_version.name,
+                 program_version.version,
+                 program_version.parameter_info,
+                 input_class.name,
+                 input_class.size,
+                 machine_class,
+                 configuration_hash)
+        return hashlib.sha256(repr(parts).encode('utf-8')).hexdigest()
+
+    def expired_before(self):
+        if self.max_age is None:
+            return None
+        return time.time() - self.max_age
+
+    def get(self, key):
+        """dict of Result fields for key, or None if missing or stale"""
+        row = self.connection.execute(
+            'SELECT collection_date, {0} FROM measurement_cache'
+            ' WHERE key = ?'.format(', '.join(RESULT_FIELDS)), (key,)).fetchone()
+        cutoff = self.expired_before()
+        if row is None or (cutoff is not None and row[0] < cutoff):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return dict(zip(RESULT_FIELDS, row[1:]))
+
+    def put(self, key, result):
+        values = [getattr(result, field) for field in RESULT_FIELDS]
+        with self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO measurement_cache'
+                ' (key, collection_date, {0}) VALUES (?, ?, {1})'.format(
+                    ', '.join(RESULT_FIELDS), ', '.join('?' * len(RESULT_FIELDS))),
+                [key, time.time()] + values)
+
+    def prune(self):
+        """delete stale entries"""
+        cutoff = self.expired_before()
+        if cutoff is not None:
+            with self.connection:
+                self.connection.execute(
+                    'DELETE FROM measurement_cache WHERE collection_date < ?',
+                    (cutoff,))
+
+    def close(self):
+        if self.hits or self.misses:
+            log.info('measurement cache: %d hits, %d misses',
+                     self.hits, self.misses)
+        self.connection.close()
@@ -2,19 +2,30 @@ from __future__ import division
 from __future__ import print_function
 
 import argparse
+import itertools
 import logging
+import math
 import os
 import socket
 import time
+from builtins import range
 from builtins import zip
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from datetime import timedelta
 from multiprocessing.pool import ThreadPool
 
+from future.moves.queue import Queue
 from past.utils import old_div
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm.exc import NoResultFound
 
 from opentuner.driverbase import DriverBase
+from opentuner.measurement.cache import MeasurementCache
+from opentuner.measurement.interface import detach_run_args
+from opentuner.measurement.interface import process_worker_init
+from opentuner.measurement.interface import process_worker_run
 from opentuner.resultsdb.models import *
 
 log = logging.getLogger(__name__)
@@ -22,6 +33,52 @@ log = logging.getLogger(__name__)
 argparser = argparse.ArgumentParser(add_help=False)
 argparser.add_argument('--machine-class',
                        help="name of the machine class being run on")
+argparser.add_argument('--measurement-cache',
+                       help="file to cache measurements in across tuning runs")
+argparser.add_argument('--measurement-cache-max-age', type=float,
+                       default=7 * 24.0,
+                       help="hours before a cached measurement is stale")
+argparser.add_argument('--external-workers', action='store_true',
+                       help="leave measurement to opentuner-worker processes "
+                            "sharing the --database")
+argparser.add_argument('--lease-timeout', type=float, default=300.0,
+                       help="seconds without a worker heartbeat before a "
+                            "running test is requeued")
+argparser.add_argument('--worker-poll-interval', type=float, default=1.0,
+                       help="seconds between database polls when waiting "
+                            "on or for external workers")
+argparser.add_argument('--pipeline', action='store_true',
+                       help="with --parallel-compile, run each test as soon as "
+                            "its compile finishes instead of waiting for the "
+                            "whole generation to compile")
+argparser.add_argument('--compile-workers', type=int,
+                       help="concurrent compiles in --pipeline mode "
+                            "(default --parallelism)")
+argparser.add_argument('--run-workers', type=int, default=1,
+                       help="concurrent runs in --pipeline mode, "
+                            "run_precompiled() is called from worker threads")
+argparser.add_argument('--run-processes', type=int, default=0,
+                       help="call run() in this many worker processes, for "
+                            "CPU-bound pure-Python objectives (without "
+                            "--parallel-compile); configs and results must "
+                            "be picklable")
+argparser.add_argument('--samples-min', type=int, default=1,
+                       help="measurements of each config before its confidence "
+                            "interval is checked")
+argparser.add_argument('--samples-max', type=int, default=1,
+                       help="measure configs up to this many times until the "
+                            "confidence interval of their time is small enough")
+argparser.add_argument('--samples-ci', type=float, default=0.05,
+                       help="stop sampling once the 95%% confidence interval of "
+                            "the mean time is within this fraction of the mean")
+argparser.add_argument('--samples-race-margin', type=float, default=0.1,
+                       help="stop sampling configs that are this fraction "
+                            "slower than the best result even at the low end "
+                            "of their confidence interval")
+argparser.add_argument('--samples-aggregate', choices=('mean', 'median', 'min'),
+                       default='mean',
+                       help="how the samples of a config are combined into "
+                            "its Result")
 
 
 class MeasurementDriver(DriverBase):
@@ -47,15 +104,33 @@ class MeasurementDriver(DriverBase):
         self.laptime = time.time()
         self.machine = self.get_machine()
 
+        if self.args.measurement_cache:
+            self.measurement_cache = MeasurementCache(
+                self.args.measurement_cache,
+                self.args.measurement_cache_max_age * 3600.0)
+        else:
+            self.measurement_cache = None
+
+        self.compile_pool = None
+        self.run_pool = None
+        self.cleanup_pool = None
+        self.process_pool = None
+        self.pipeline_events = Queue()
+        self.pipeline_outstanding = 0
+        self.pipeline_samples = dict()
+        self.prune_bounds = dict()  # desired result id -> best time at start
+        self.selected_inputs = dict()  # desired result id -> Input, see select_input
+
     def get_machine(self):
         """
         get (or create) the machine we are currently running on
         """
         hostname = socket.gethostname()
-        try:
-            self.session.flush()
-            return self.session.query(Machine).filter_by(name=hostname).one()
-        except sqlalchemy.orm.exc.NoResultFound:
+        self.session.flush()
+        # workers started together on one host may each have added a row
+        m = (self.session.query(Machine).filter_by(name=hostname)
+             .order_by(Machine.id).first())
+        if m is None:
             m = Machine(name=hostname,
                         cpu=_cputype(),
                         cores=_cpucount(),
@@ -63,7 +138,7 @@ class MeasurementDriver(DriverBase):
                                 1024.0 ** 3)) if _memorysize() else 0,
                         machine_class=self.get_machine_class())
             self.session.add(m)
-            return m
+        return m
 
     def get_machine_class(self):
         """
@@ -71,9 +146,17 @@ class MeasurementDriver(DriverBase):
         """
         return MachineClass.get(self.session, name=self.args.machine_class)
 
+    def best_result(self, desired_result):
+        """the best Result so far at the fidelity desired_result is run at"""
+        input_class = desired_result.input_class
+        if input_class is None and getattr(self.input_manager, 'fidelities', None):
+            input_class = self.tuning_run.input_class
+        return self.results_query(objective_ordered=True,
+                                  input_class=input_class).first()
+
     def run_time_limit(self, desired_result, default=3600.0 * 24 * 365 * 10):
         """return a time limit to apply to a test run (in seconds)"""
-        best = self.results_query(objective_ordered=True).first()
+        best = self.best_result(desired_result)
         if best is None:
             if desired_result.limit:
                 return desired_result.limit
@@ -86,55 +169,421 @@ class MeasurementDriver(DriverBase):
             return self.default_limit_multiplier * best.time
 
     def report_result(self, desired_result, result, input=None):
-        result.configuration = desired_result.configuration
-        result.input = input
-        result.machine = self.machine
-        result.tuning_run = self.tuning_run
-        result.collection_date = datetime.now()
-        self.session.add(result)
-        desired_result.result = result
-        desired_result.state = 'COMPLETE'
-        self.input_manager.after_run(desired_result, input)
-        result.collection_cost = self.lap_timer()
+        self.report_results([(desired_result, result, input)])
+
+    def report_results(self, reports):
+        """
+        store a list of (desired_result, result, input) with one flush and
+        commit, the time since the last report is split between them
+        """
+        collection_cost = self.lap_timer() / len(reports)
+        for desired_result, result, input in reports:
+            result.configuration = desired_result.configuration
+            result.input = input
+            result.machine = self.machine
+            result.tuning_run = self.tuning_run
+            result.collection_date = datetime.now()
+            self.session.add(result)
+            desired_result.result = result
+            desired_result.state = 'COMPLETE'
+            self.input_manager.after_run(desired_result, input)
+            result.collection_cost = collection_cost
         self.session.flush()  # populate result.id
-        log.debug(
-            'Result(id=%d, cfg=%d, time=%.4f, accuracy=%.2f, collection_cost=%.2f)',
-            result.id,
-            result.configuration.id,
-            result.time,
-            result.accuracy if result.accuracy is not None else float('NaN'),
-            result.collection_cost)
+        for desired_result, result, input in reports:
+            if self.is_full_fidelity(result):
+                self.result_index.add_result(result)
+            log.debug(
+                'Result(id=%d, cfg=%d, time=%.4f, accuracy=%.2f, collection_cost=%.2f)',
+                result.id,
+                result.configuration.id,
+                result.time,
+                result.accuracy if result.accuracy is not None else float('NaN'),
+                result.collection_cost)
         self.commit()
 
-    def run_desired_result(self, desired_result, compile_result=None,
-                           exec_id=None):
+    def cache_key(self, desired_result, input):
+        return MeasurementCache.key(self.tuning_run.program_version,
+                                    input.input_class,
+                                    self.args.machine_class,
+                                    desired_result.configuration.hash)
+
+    def run_cached(self, desired_result):
         """
-        create a new Result using input manager and measurment interface
-        Optional compile_result paramater can be passed to run_precompiled as
-        the return value of compile()
-        Optional exec_id paramater can be passed to run_precompiled in case of
-        locating a specific executable
+        report a Result for desired_result from the measurement cache
+        return True on a cache hit, in which case nothing needs to be compiled
         """
+        if self.measurement_cache is None:
+            return False
+        input = self.select_input(desired_result)
+        fields = self.measurement_cache.get(self.cache_key(desired_result, input))
+        if fields is None:
+            # measured (and cached) with this input, see prepare_run()
+            self.selected_inputs[desired_result.id] = input
+            return False
+        log.debug('measurement cache hit for desired result %s',
+                  desired_result.id)
         desired_result.limit = self.run_time_limit(desired_result)
+        self.input_manager.before_run(desired_result, input)
+        self.report_result(desired_result, Result(**fields), input)
+        return True
 
-        input = self.input_manager.select_input(desired_result)
-        self.session.add(input)
-        self.session.flush()
+    def select_input(self, desired_result):
+        """
+        the input for desired_result, the one run_cached() selected for it on
+        a cache miss if any, so it is measured with the input it is cached for
+        """
+        input = self.selected_inputs.pop(desired_result.id, None)
+        if input is None:
+            input = self.input_manager.select_input(desired_result)
+            self.session.add(input)
+            self.session.flush()
+        return input
+
+    def prepare_run(self, desired_result):
+        """set the limit and select an input for desired_result"""
+        desired_result.limit = self.run_time_limit(desired_result)
+        best = self.best_result(desired_result)
+        self.prune_bounds[desired_result.id] = best.time if best else None
+
+        input = self.select_input(desired_result)
 
         log.debug('running desired result %s on input %s', desired_result.id,
                   input.id)
 
         self.input_manager.before_run(desired_result, input)
+        return input
 
-        if self.interface.parallel_compile:
-            result = self.interface.run_precompiled(desired_result, input,
-                                                    desired_result.limit,
-                                                    compile_result, exec_id)
+    def prune_bound(self, desired_result):
+        """
+        time of the best result when desired_result started running, a run
+        whose partial time exceeds it can be aborted (see ProgressPruner),
+        None if there is no result to beat yet; safe to call from run threads
+        """
+        return self.prune_bounds.get(getattr(desired_result, 'id', None))
+
+    def sample_stats(self, samples):
+        """(mean, half width of the 95% confidence interval) of sample times"""
+        times = [s.time for s in samples]
+        n = len(times)
+        mean = math.fsum(times) / n
+        if n < 2:
+            return mean, float('inf')
+        var = math.fsum((t - mean) ** 2 for t in times) / (n - 1)
+        return mean, 1.96 * math.sqrt(var / n)
+
+    def sample_failed(self, sample):
+        """True if sample is not OK or has no finite time"""
+        # state is only defaulted to 'OK' when the Result is flushed
+        return (sample.state not in (None, 'OK') or sample.time is None or
+                not math.isfinite(sample.time))
+
+    def needs_sample(self, samples):
+        """
+        True if the config measured in samples should be measured again:
+        until --samples-min is reached, then while the confidence interval is
+        wider than --samples-ci and the config could still beat the best
+        result, so configs close to the best get the most samples
+        """
+        n = len(samples)
+        if n >= self.args.samples_max:
+            return False
+        if any(self.sample_failed(s) for s in samples):
+            return False
+        if n < self.args.samples_min:
+            return True
+        mean, half_width = self.sample_stats(samples)
+        if mean <= 0 or half_width <= self.args.samples_ci * mean:
+            return False
+        best = self.results_query(objective_ordered=True).first()
+        if (best is not None and best.time is not None and
+                mean - half_width > best.time * (1.0 + self.args.samples_race_margin)):
+            return False
+        return True
+
+    def aggregate_samples(self, samples):
+        """combine the samples of one config into the Result to report"""
+        if len(samples) == 1:
+            return samples[0]
+        failed = [s for s in samples if self.sample_failed(s)]
+        if failed:
+            # a config that failed once is reported as failed
+            return failed[0]
+        mean, half_width = self.sample_stats(samples)
+        if self.args.samples_aggregate == 'median':
+            ordered = sorted(samples, key=lambda s: s.time)
+            aggregate = ordered[(len(ordered) - 1) // 2]
+        elif self.args.samples_aggregate == 'min':
+            aggregate = min(samples, key=lambda s: s.time)
         else:
-            result = self.interface.compile_and_run(desired_result, input,
-                                                    desired_result.limit)
+            aggregate = None
+        result = Result(state='OK',
+                        confidence=old_div(half_width, mean) if mean else 0.0)
+        for field in ('time', 'accuracy', 'energy', 'size'):
+            if aggregate is not None:
+                setattr(result, field, getattr(aggregate, field))
+            else:
+                values = [getattr(s, field) for s in samples]
+                if None not in values:
+                    setattr(result, field, math.fsum(values) / len(values))
+        return result
+
+    def measure_samples(self, measure):
+        """call measure() until needs_sample() is satisfied"""
+        samples = [measure()]
+        while self.needs_sample(samples):
+            samples.append(measure())
+        if len(samples) > 1:
+            log.debug('measured %d samples', len(samples))
+        return samples
+
+    def finish_run(self, desired_result, result, input, samples=None):
+        """
+        report a Result returned by the measurement interface, or the
+        aggregate of several samples
+        """
+        self.finish_runs([(desired_result, result, input, samples)])
+
+    def finish_runs(self, runs):
+        """finish_run() for a list of its arguments, reported together"""
+        for desired_result, result, input, samples in runs:
+            self.prune_bounds.pop(desired_result.id, None)
+            if samples is not None and len(samples) > 1:
+                for number, sample in enumerate(samples):
+                    self.session.add(ResultSample(result=result,
+                                                  number=number,
+                                                  state=sample.state,
+                                                  time=sample.time,
+                                                  accuracy=sample.accuracy,
+                                                  energy=sample.energy,
+                                                  size=sample.size))
+        self.report_results([(desired_result, result, input)
+                             for desired_result, result, input, samples in runs])
+        if self.measurement_cache is not None:
+            for desired_result, result, input, samples in runs:
+                if result.state == 'OK':
+                    self.measurement_cache.put(
+                        self.cache_key(desired_result, input), result)
 
-        self.report_result(desired_result, result, input)
+    def run_desired_result(self, desired_result, compile_result=None,
+                           exec_id=None):
+        """
+        create a new Result using input manager and measurment interface
+        Optional compile_result paramater can be passed to run_precompiled as
+        the return value of compile()
+        Optional exec_id paramater can be passed to run_precompiled in case of
+        locating a specific executable
+        """
+        input = self.prepare_run(desired_result)
+
+        def measure():
+            if self.interface.parallel_compile:
+                return self.interface.run_precompiled(desired_result, input,
+                                                      desired_result.limit,
+                                                      compile_result, exec_id)
+            return self.interface.compile_and_run(desired_result, input,
+                                                  desired_result.limit)
+
+        samples = self.measure_samples(measure)
+        self.finish_run(desired_result, self.aggregate_samples(samples), input,
+                        samples)
+
+    def init_pools(self):
+        if self.compile_pool is None:
+            self.compile_pool = ThreadPool(self.args.compile_workers or
+                                           self.args.parallelism)
+            self.run_pool = ThreadPool(max(1, self.args.run_workers))
+            self.cleanup_pool = ThreadPool(1)
+
+    def init_process_pool(self):
+        if self.process_pool is None:
+            self.process_pool = ProcessPoolExecutor(
+                self.args.run_processes,
+                initializer=process_worker_init,
+                initargs=(self.interface,))
+
+    def batch_measure(self):
+        """
+        the measure function of run_desired_results() used for tests without
+        --parallel-compile, None to measure them one at a time
+        """
+        if self.interface.has_run_batch():
+            return self.run_batch_measure
+        if self.args.run_processes:
+            return self.process_pool_measure
+        return None
+
+    def run_desired_results(self, desired_results, measure):
+        """
+        measure desired_results together, measure(desired_results, inputs)
+        returns one sample Result for each, in order; rounds repeat for the
+        tests needing more samples and all Results are reported at once
+        """
+        if not desired_results:
+            return
+        inputs = dict()
+        samples = dict()
+        for dr in desired_results:
+            inputs[dr.id] = self.prepare_run(dr)
+            samples[dr.id] = []
+        todo = list(desired_results)
+        while todo:
+            results = measure(todo, [inputs[dr.id] for dr in todo])
+            for dr, result in zip(todo, results):
+                samples[dr.id].append(result)
+            todo = [dr for dr in todo if self.needs_sample(samples[dr.id])]
+        self.finish_runs([(dr, self.aggregate_samples(samples[dr.id]),
+                           inputs[dr.id], samples[dr.id])
+                          for dr in desired_results])
+
+    def process_pool_measure(self, desired_results, inputs):
+        """
+        measure with run() in --run-processes worker processes, each worker
+        gets a couple of batches of tests
+        """
+        self.init_process_pool()
+        run_args = [detach_run_args(dr, input) + (dr.limit,)
+                    for dr, input in zip(desired_results, inputs)]
+        size = int(math.ceil(len(run_args) / (2.0 * self.args.run_processes)))
+        batches = [run_args[i:i + size] for i in range(0, len(run_args), size)]
+        fields = itertools.chain.from_iterable(
+            self.process_pool.map(process_worker_run, batches))
+        return [Result(**result_fields) for result_fields in fields]
+
+    def run_batch_measure(self, desired_results, inputs):
+        """measure with one run_batch() call per distinct input"""
+        by_input = OrderedDict()
+        for dr, input in zip(desired_results, inputs):
+            by_input.setdefault(input.id, (input, []))[1].append(dr)
+        results = dict()
+        for input, batch in by_input.values():
+            batch_results = self.interface.run_batch(batch, input)
+            if len(batch_results) != len(batch):
+                raise RuntimeError('run_batch() returned %d results for %d '
+                                   'desired results' % (len(batch_results),
+                                                        len(batch)))
+            for dr, result in zip(batch, batch_results):
+                results[dr.id] = result
+        return [results[dr.id] for dr in desired_results]
+
+    def claim_all(self, q):
+        """claim the desired results of q that are not in the measurement cache"""
+        desired_results = []
+        for dr in q.all():
+            if self.claim_desired_result(dr) and not self.run_cached(dr):
+                desired_results.append(dr)
+        return desired_results
+
+    def pipeline_submit(self, desired_result):
+        """
+        start compiling a claimed desired_result in the compile pool, its run
+        is started by pipeline_step() once the compile finishes
+        """
+        self.init_pools()
+        self.pipeline_outstanding += 1
+        events = self.pipeline_events
+        self.compile_pool.apply_async(
+            self.interface.compile,
+            (desired_result.configuration.data, desired_result.id),
+            callback=lambda r: events.put(('compiled', desired_result, r)),
+            error_callback=lambda e: events.put(('error', desired_result, e)))
+
+    def pipeline_step(self):
+        """
+        wait for and handle one compile or run completion, session work all
+        happens here in the calling thread
+        returns the DesiredResult if a result was reported, otherwise None
+        """
+        event, desired_result, value = self.pipeline_events.get()
+        if event == 'error':
+            self.pipeline_outstanding -= 1
+            raise value
+        if event == 'compiled':
+            input = self.prepare_run(desired_result)
+            self.pipeline_run(desired_result, input, value)
+            return None
+        result, input, compile_result = value
+        samples = self.pipeline_samples.setdefault(desired_result.id, [])
+        samples.append(result)
+        if self.needs_sample(samples):
+            self.pipeline_run(desired_result, input, compile_result)
+            return None
+        del self.pipeline_samples[desired_result.id]
+        self.pipeline_outstanding -= 1
+        self.finish_run(desired_result, self.aggregate_samples(samples), input,
+                        samples)
+        self.cleanup_pool.apply_async(
+            self.interface.cleanup, (desired_result.id,),
+            error_callback=lambda e: log.warning('cleanup(%s) failed: %s',
+                                                 desired_result.id, e))
+        return desired_result
+
+    def pipeline_run(self, desired_result, input, compile_result):
+        """start one run of a compiled desired_result in the run pool"""
+        events = self.pipeline_events
+        # the pool thread must not touch the session (not thread safe), which
+        # this thread keeps committing
+        detached_result, detached_input = detach_run_args(desired_result, input)
+        self.run_pool.apply_async(
+            self.interface.run_precompiled,
+            (detached_result, detached_input, desired_result.limit,
+             compile_result, desired_result.id),
+            callback=lambda r: events.put(
+                ('ran', desired_result, (r, input, compile_result))),
+            error_callback=lambda e: events.put(('error', desired_result, e)))
+
+    def pipeline_drain(self):
+        """wait for all submitted desired results to be reported"""
+        try:
+            while self.pipeline_outstanding > 0:
+                self.pipeline_step()
+        except Exception:
+            # compiles and runs in other threads would keep going otherwise
+            self.interface.kill_all()
+            raise
+
+    def process_async(self):
+        """
+        start all pending desired results and return once at least one new
+        result has been reported, used by --async-search
+        """
+        q = self.query_pending_desired_results()
+        if not self.interface.parallel_compile and self.batch_measure():
+            self.run_desired_results(self.claim_all(q), self.batch_measure())
+            return
+        if not self.interface.parallel_compile:
+            # compile_and_run() is sequential, so measure one test at a time
+            for dr in q:
+                if self.claim_desired_result(dr):
+                    if not self.run_cached(dr):
+                        self.run_desired_result(dr)
+                    return
+            return
+
+        reported = 0
+        for dr in q.all():
+            if self.claim_desired_result(dr):
+                if self.run_cached(dr):
+                    reported += 1
+                else:
+                    self.pipeline_submit(dr)
+        try:
+            while reported == 0 and self.pipeline_outstanding > 0:
+                if self.pipeline_step() is not None:
+                    reported += 1
+        except Exception:
+            self.interface.kill_all()
+            raise
+
+    def close(self):
+        """called at the end of the tuning run"""
+        for pool in (self.compile_pool, self.run_pool, self.cleanup_pool):
+            if pool is not None:
+                pool.close()
+                pool.join()
+        if self.process_pool is not None:
+            self.process_pool.shutdown()
+        if self.measurement_cache is not None:
+            self.measurement_cache.close()
 
     def lap_timer(self):
         """return the time elapsed since the last call to lap_timer"""
@@ -150,22 +599,69 @@ class MeasurementDriver(DriverBase):
         """
         self.commit()
         try:
-            self.session.refresh(desired_result)
-            if desired_result.state == 'REQUESTED':
-                desired_result.state = 'RUNNING'
-                desired_result.start_date = datetime.now()
-                self.commit()
+            # conditional update so only one of several workers can win
+            claimed = (self.session.query(DesiredResult)
+                       .filter_by(id=desired_result.id, state='REQUESTED')
+                       .update({'state': 'RUNNING',
+                                'start_date': self.lease_date()},
+                               synchronize_session=False))
+            self.commit()
+            if claimed:
+                self.session.refresh(desired_result)
                 return True
         except SQLAlchemyError:
             self.session.rollback()
         return False
 
+    @staticmethod
+    def lease_date():
+        """
+        start_date for a lease, whole seconds so it compares equal after a
+        round trip through any database (e.g. mysql DATETIME drops fractions)
+        """
+        return datetime.now().replace(microsecond=0)
+
+    def renew_lease(self, desired_result_id, lease, session=None):
+        """
+        move the lease (start_date) on a running desired result from lease
+        to now, return the new lease or None if the lease was lost (it
+        expired and the desired result was requeued)
+        """
+        if session is None:
+            session = self.session
+        now = self.lease_date()
+        renewed = (session.query(DesiredResult)
+                   .filter_by(id=desired_result_id, state='RUNNING',
+                              start_date=lease.replace(microsecond=0))
+                   .update({'start_date': now}, synchronize_session=False))
+        if renewed:
+            return now
+        return None
+
+    def requeue_expired(self):
+        """
+        return running desired results whose lease (start_date, renewed by
+        the worker heartbeat) is older than --lease-timeout to REQUESTED
+        """
+        cutoff = datetime.now() - timedelta(seconds=self.args.lease_timeout)
+        count = (self.session.query(DesiredResult)
+                 .filter_by(tuning_run_id=self.tuning_run.id, state='RUNNING')
+                 .filter(DesiredResult.start_date < cutoff)
+                 .update({'state': 'REQUESTED', 'start_date': None},
+                         synchronize_session=False))
+        if count:
+            log.warning('requeued %d desired results with expired leases', count)
+        return count
+
     def query_pending_desired_results(self):
         q = (self.session.query(DesiredResult)
              .filter_by(tuning_run=self.tuning_run,
                         state='REQUESTED')
              .order_by(DesiredResult.generation,
                        DesiredResult.priority.desc()))
+        Configuration.prefetch(self.session,
+                               [id for id, in q.with_entities(
+                                   DesiredResult.configuration_id)])
         return q
 
     def process_all(self):
@@ -175,7 +671,12 @@ class MeasurementDriver(DriverBase):
         self.lap_timer()  # reset timer
         q = self.query_pending_desired_results()
 
-        if self.interface.parallel_compile:
+        if self.interface.parallel_compile and self.args.pipeline:
+            for dr in q.all():
+                if self.claim_desired_result(dr) and not self.run_cached(dr):
+                    self.pipeline_submit(dr)
+            self.pipeline_drain()
+        elif self.interface.parallel_compile:
             desired_results = []
             thread_args = []
 
@@ -184,7 +685,7 @@ class MeasurementDriver(DriverBase):
                 return interface.compile(data, result_id)
 
             for dr in q.all():
-                if self.claim_desired_result(dr):
+                if self.claim_desired_result(dr) and not self.run_cached(dr):
                     desired_results.append(dr)
                     thread_args.append((self.interface, dr.configuration.data, dr.id))
             if len(desired_results) == 0:
@@ -211,9 +712,11 @@ class MeasurementDriver(DriverBase):
                     print(e)
                     # print 'Done!'
             thread_pool.close()
+        elif self.batch_measure():
+            self.run_desired_results(self.claim_all(q), self.batch_measure())
         else:
             for dr in q.all():
-                if self.claim_desired_result(dr):
+                if self.claim_desired_result(dr) and not self.run_cached(dr):
                     self.run_desired_result(dr)
 
 
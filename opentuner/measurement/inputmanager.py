@@ -68,3 +68,39 @@ class FixedInputManager(InputManager):
         if self.the_input is None:
             self.the_input = self.create_input(desired_result)
         return self.the_input
+
+
+class FidelityInputManager(InputManager):
+    """
+    an input manager for programs with a fidelity knob (iterations, input
+    size, training steps, ...): one InputClass per fidelity, all named
+    input_class_name with the fidelity as size
+
+    tests are measured at the fidelity their DesiredResult requests
+    (DesiredResult.input_class, set by multi-fidelity techniques such as
+    SuccessiveHalving) and at the highest fidelity otherwise, the measurement
+    interface reads it from input.input_class.size
+    """
+
+    def __init__(self, sizes, input_class_name='fidelity'):
+        self.sizes = sorted(sizes)
+        self.input_class_name = input_class_name
+        self.inputs = dict()  # size -> Input
+        super(FidelityInputManager, self).__init__()
+
+    def fidelities(self):
+        """InputClasses from lowest to highest (full) fidelity"""
+        return [InputClass.get(self.session,
+                               program=self.program,
+                               name=self.input_class_name,
+                               size=size)
+                for size in self.sizes]
+
+    def get_input_class(self):
+        return self.fidelities()[-1]
+
+    def select_input(self, desired_result):
+        input_class = desired_result.input_class or self.get_input_class()
+        if input_class.size not in self.inputs:
+            self.inputs[input_class.size] = Input(input_class=input_class)
+        return self.inputs[input_class.size]
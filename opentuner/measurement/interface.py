@@ -4,8 +4,10 @@ import errno
 import hashlib
 import logging
 import os
+import selectors
 import signal
 import subprocess
+import tempfile
 import threading
 import time
 from builtins import range
@@ -25,6 +27,7 @@ except ImportError:
 
 import opentuner
 from opentuner import resultsdb
+from opentuner.measurement.cache import RESULT_FIELDS
 from opentuner.resultsdb.models import *
 
 log = logging.getLogger(__name__)
@@ -137,6 +140,28 @@ class MeasurementInterface(with_metaclass(abc.ABCMeta, object)):
         """
         return opentuner.resultdb.models.Result()
 
+    def run_batch(self, desired_results, input):
+        """
+        optional: measure several desired_results on input at once and
+        return a list with a Result() for each of them, in order, for
+        objectives that can evaluate many configurations in one call
+        each desired_result.limit is set; when overridden, the driver calls
+        this instead of run() for everything it claims (without
+        --parallel-compile)
+        """
+        return [self.run(dr, input, dr.limit) for dr in desired_results]
+
+    def has_run_batch(self):
+        """True if a subclass implements run_batch()"""
+        return type(self).run_batch is not MeasurementInterface.run_batch
+
+    def worker_init(self):
+        """
+        called once in each --run-processes worker before its first run(),
+        for expensive per-process setup such as loading data or warming caches
+        """
+        pass
+
     def save_final_config(self, config):
         """
         called at the end of autotuning with the best resultsdb.models.Configuration
@@ -163,6 +188,18 @@ class MeasurementInterface(with_metaclass(abc.ABCMeta, object)):
     def set_driver(self, measurement_driver):
         self.driver = measurement_driver
 
+    def __getstate__(self):
+        # sent to --run-processes workers without the driver and its session
+        state = self.__dict__.copy()
+        for name in ('driver', 'pids', 'pid_lock'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.pids = []
+        self.pid_lock = threading.Lock()
+
     def project_name(self):
         if self._project is not None:
             return self._project
@@ -227,21 +264,29 @@ class MeasurementInterface(with_metaclass(abc.ABCMeta, object)):
         self.pids = []
         self.pid_lock.release()
 
-    def call_program(self, cmd, limit=None, memory_limit=None, **kwargs):
+    def call_program(self, cmd, limit=None, memory_limit=None,
+                     progress_callback=None, progress_stream='stdout',
+                     max_output=None, spill_output=False, **kwargs):
         """
         call cmd and kill it if it runs for longer than limit
 
+        if given, progress_callback(line) is called with each line of
+        progress_stream ('stdout' or 'stderr') as it is produced, the program
+        is killed as soon as it returns True (see ProgressPruner)
+
+        max_output caps the bytes of each stream that are returned, with
+        spill_output the complete streams are also written to temporary files
+        named by 'stdout_file' and 'stderr_file' (None if the cap was not hit)
+
         returns dictionary like
           {'returncode': 0,
            'stdout': '', 'stderr': '',
-           'timeout': False, 'time': 1.89}
+           'timeout': False, 'aborted': False, 'time': 1.89}
         """
-        the_io_thread_pool_init(self.args.parallelism)
-        if limit is float('inf'):
+        if limit == float('inf'):
             limit = None
         if type(cmd) in (str, str):
             kwargs['shell'] = True
-        killed = False
         t0 = time.time()
         p = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
                              preexec_fn=preexec_setpgid_setrlimit(memory_limit),
@@ -251,27 +296,14 @@ class MeasurementInterface(with_metaclass(abc.ABCMeta, object)):
         self.pids.append(p.pid)
         self.pid_lock.release()
 
+        streams = dict()
+        for name, pipe in (('stdout', p.stdout), ('stderr', p.stderr)):
+            streams[name] = OutputStream(
+                name, pipe, max_output, spill_output,
+                progress_callback if name == progress_stream else None)
         try:
-            stdout_result = the_io_thread_pool.apply_async(p.stdout.read)
-            stderr_result = the_io_thread_pool.apply_async(p.stderr.read)
-            while p.returncode is None:
-                if limit is None:
-                    goodwait(p)
-                elif limit and time.time() > t0 + limit:
-                    killed = True
-                    goodkillpg(p.pid)
-                    goodwait(p)
-                else:
-                    # still waiting...
-                    sleep_for = limit - (time.time() - t0)
-                    if not stdout_result.ready():
-                        stdout_result.wait(sleep_for)
-                    elif not stderr_result.ready():
-                        stderr_result.wait(sleep_for)
-                    else:
-                        # TODO(jansel): replace this with a portable waitpid
-                        time.sleep(0.001)
-                p.poll()
+            killed, aborted = wait_program(p, list(streams.values()),
+                                           None if limit is None else t0 + limit)
         except:
             if p.returncode is None:
                 goodkillpg(p.pid)
@@ -282,13 +314,20 @@ class MeasurementInterface(with_metaclass(abc.ABCMeta, object)):
             if p.pid in self.pids:
                 self.pids.remove(p.pid)
             self.pid_lock.release()
+            for stream in streams.values():
+                stream.close()
 
         t1 = time.time()
-        return {'time': float('inf') if killed else (t1 - t0),
-                'timeout': killed,
-                'returncode': p.returncode,
-                'stdout': stdout_result.get(),
-                'stderr': stderr_result.get()}
+        rv = {'time': float('inf') if killed or aborted else (t1 - t0),
+              'timeout': killed or aborted,
+              'aborted': aborted,
+              'returncode': p.returncode,
+              'stdout': streams['stdout'].value(),
+              'stderr': streams['stderr'].value()}
+        if spill_output:
+            rv['stdout_file'] = streams['stdout'].spill_path
+            rv['stderr_file'] = streams['stderr'].spill_path
+        return rv
 
     def prefix_hook(self, session):
         pass
@@ -305,6 +344,86 @@ class DefaultMeasurementInterface(MeasurementInterface):
         raise RuntimeError('MeasurementInterface.run() not implemented')
 
 
+class ProgressPruner(object):
+    """
+    progress_callback for call_program() that aborts a run once its partial
+    cost provably exceeds the best result
+
+    parse(line) returns the cost contributed by an output line (or None),
+    the run is aborted when the sum exceeds bound; total is then a lower bound
+    on the cost of the run, report it as Result(state='TIMEOUT', time=total)
+    """
+
+    def __init__(self, parse, bound):
+        self.parse = parse
+        self.bound = bound
+        self.total = 0
+
+    def __call__(self, line):
+        cost = self.parse(line)
+        if cost is not None:
+            self.total += cost
+        return self.bound is not None and self.total > self.bound
+
+
+class DetachedRecord(object):
+    """
+    picklable copy of some columns of a resultsdb record, passed to run()
+    in place of the record in --run-processes workers
+    """
+
+    def __init__(self, record, fields, **related):
+        for field in fields:
+            setattr(self, field, getattr(record, field))
+        for name, value in related.items():
+            setattr(self, name, value)
+
+    @classmethod
+    def copy(cls, record, fields, **related):
+        if record is None:
+            return None
+        return cls(record, fields, **related)
+
+
+def detach_run_args(desired_result, input):
+    """picklable (desired_result, input) for run() in a worker process"""
+    input_class_fields = ('id', 'name', 'size')
+    configuration = DetachedRecord.copy(desired_result.configuration,
+                                        ('id', 'hash', 'data'))
+    detached_result = DetachedRecord.copy(
+        desired_result, ('id', 'generation', 'requestor', 'limit'),
+        configuration=configuration,
+        input_class=DetachedRecord.copy(desired_result.input_class,
+                                        input_class_fields))
+    detached_input = DetachedRecord.copy(
+        input, ('id', 'path', 'extra'),
+        input_class=DetachedRecord.copy(input.input_class, input_class_fields))
+    return detached_result, detached_input
+
+
+the_worker_interface = None
+
+
+def process_worker_init(interface):
+    """ProcessPoolExecutor initializer of --run-processes workers"""
+    global the_worker_interface
+    the_worker_interface = interface
+    interface.worker_init()
+
+
+def process_worker_run(batch):
+    """
+    call run() for a batch of (desired_result, input, limit) in a worker,
+    returns a list of Result field dictionaries
+    """
+    results = []
+    for desired_result, input, limit in batch:
+        result = the_worker_interface.run(desired_result, input, limit)
+        results.append(dict((field, getattr(result, field))
+                            for field in RESULT_FIELDS))
+    return results
+
+
 def preexec_setpgid_setrlimit(memory_limit):
     if resource is not None:
         def _preexec():
@@ -324,6 +443,140 @@ def preexec_setpgid_setrlimit(memory_limit):
         return _preexec
 
 
+class OutputStream(object):
+    """
+    one output pipe of a call_program() process, read as data arrives
+    """
+
+    def __init__(self, name, pipe, max_output=None, spill_output=False,
+                 progress_callback=None):
+        self.name = name
+        self.pipe = pipe
+        self.max_output = max_output
+        self.spill_output = spill_output
+        self.progress_callback = progress_callback
+        self.chunks = []
+        self.size = 0
+        self.spill_file = None
+        self.spill_path = None
+        self.partial_line = b''
+        self.aborted = False
+
+    def fileno(self):
+        return self.pipe.fileno()
+
+    def feed(self, data):
+        """store data read from the pipe, returns True to abort the program"""
+        if (self.spill_output and self.spill_file is None and
+                self.max_output is not None and
+                self.size + len(data) > self.max_output):
+            self.spill_file = tempfile.NamedTemporaryFile(
+                prefix='opentuner-%s-' % self.name, delete=False)
+            self.spill_path = self.spill_file.name
+            self.spill_file.writelines(self.chunks)
+        if self.spill_file is not None:
+            self.spill_file.write(data)
+        if self.max_output is None:
+            self.chunks.append(data)
+            self.size += len(data)
+        elif self.size < self.max_output:
+            data_kept = data[:self.max_output - self.size]
+            self.chunks.append(data_kept)
+            self.size += len(data_kept)
+        if self.progress_callback is not None and not self.aborted:
+            lines = (self.partial_line + data).split(b'\n')
+            self.partial_line = lines.pop()
+            for line in lines:
+                if self.progress_callback(line + b'\n'):
+                    self.aborted = True
+                    return True
+        return False
+
+    def feed_eof(self):
+        """pass an unterminated last line to the progress callback"""
+        if self.progress_callback is not None and not self.aborted and self.partial_line:
+            self.aborted = bool(self.progress_callback(self.partial_line))
+        self.partial_line = b''
+        return self.aborted
+
+    def value(self):
+        return b''.join(self.chunks)
+
+    def close(self):
+        self.pipe.close()
+        if self.spill_file is not None:
+            self.spill_file.close()
+
+
+def wait_program(p, streams, deadline=None):
+    """
+    read streams until they are closed and wait for p to exit, killing it at
+    deadline (a time.time() value) or when a stream asks to abort
+
+    pipes are read without threads through a selector, the deadline is the
+    select() timeout; where os.pidfd_open() exists the process exit is an
+    event too, otherwise a timer kills the process if it outlives its pipes
+    returns (killed by the deadline, aborted by a stream)
+    """
+    killed = False
+    aborted = False
+    selector = selectors.DefaultSelector()
+    for stream in streams:
+        selector.register(stream, selectors.EVENT_READ)
+    pidfd = None
+    if hasattr(os, 'pidfd_open'):
+        try:
+            pidfd = os.pidfd_open(p.pid)
+            selector.register(pidfd, selectors.EVENT_READ)
+        except OSError:
+            pidfd = None
+    try:
+        while selector.get_map():
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - time.time())
+            events = selector.select(timeout)
+            if not events:
+                if deadline is not None and time.time() >= deadline:
+                    killed = True
+                    deadline = None
+                    goodkillpg(p.pid)
+                continue
+            for key, mask in events:
+                if key.fileobj is pidfd:
+                    selector.unregister(pidfd)
+                    continue
+                stream = key.fileobj
+                data = os.read(stream.fileno(), 65536)
+                if data:
+                    abort = stream.feed(data)
+                else:
+                    selector.unregister(stream)
+                    abort = stream.feed_eof()
+                if abort and not aborted:
+                    aborted = True
+                    deadline = None
+                    goodkillpg(p.pid)
+    finally:
+        selector.close()
+        if pidfd is not None:
+            os.close(pidfd)
+
+    if p.poll() is None and deadline is not None:
+        # no pidfd: the pipes are closed but the process is still running
+        timer = threading.Timer(max(0.0, deadline - time.time()),
+                                goodkillpg, (p.pid,))
+        timer.start()
+        try:
+            goodwait(p)
+        finally:
+            timer.cancel()
+        killed = killed or p.returncode == -signal.SIGKILL
+    else:
+        goodwait(p)
+    return killed, aborted
+
+
 def the_io_thread_pool_init(parallelism=1):
     global the_io_thread_pool
     if the_io_thread_pool is None:
@@ -0,0 +1,206 @@
+"""
+standalone measurement worker, several workers (on one or many machines) can
+serve a single search process that was started with --external-workers, as
+long as they share its --database
+
+  opentuner-worker --database DB --tuning-run UUID --interface module:Class
+"""
+from __future__ import print_function
+
+import argparse
+import copy
+import logging
+import threading
+import time
+from builtins import object
+from importlib import import_module
+
+from opentuner import resultsdb
+from opentuner.measurement.driver import MeasurementDriver
+from opentuner.resultsdb.models import TuningRun
+from opentuner.tuningrunmain import init_logging
+
+log = logging.getLogger(__name__)
+
+argparser = argparse.ArgumentParser(add_help=False)
+argparser.add_argument('--database', required=True,
+                       help="database shared with the search process")
+argparser.add_argument('--tuning-run', metavar='UUID',
+                       help="uuid of the TuningRun to measure tests for, "
+                            "default is the newest running TuningRun")
+argparser.add_argument('--interface', required=True, metavar='MODULE:CLASS',
+                       help="MeasurementInterface subclass to measure with")
+argparser.add_argument('--machine-class',
+                       help="name of the machine class being run on")
+argparser.add_argument('--lease-timeout', type=float,
+                       help="override the --lease-timeout of the search")
+argparser.add_argument('--worker-poll-interval', type=float,
+                       help="override the --worker-poll-interval of the search")
+
+
+def load_interface_class(name):
+    """import a 'module:Class' (or 'module.Class') name"""
+    if ':' in name:
+        module_name, class_name = name.split(':', 1)
+    else:
+        module_name, class_name = name.rsplit('.', 1)
+    return getattr(import_module(module_name), class_name)
+
+
+class MeasurementWorker(object):
+    """
+    claims REQUESTED DesiredResults of an existing TuningRun and measures them
+    one at a time, until the TuningRun is no longer running
+
+    the interface is created with the args stored with the TuningRun, so it
+    sees the same options as the search process
+    """
+
+    def __init__(self, interface_cls, worker_args):
+        init_logging()
+        database = worker_args.database
+        if '://' not in database:
+            database = 'sqlite:///' + database
+        self.engine, self.Session = resultsdb.connect(database)
+        self.session = self.Session()
+        self.tuning_run = self.find_tuning_run(worker_args)
+
+        args = copy.copy(self.tuning_run.args)
+        args.database = database
+        for name in ('machine_class', 'lease_timeout', 'worker_poll_interval'):
+            if getattr(worker_args, name) is not None:
+                setattr(args, name, getattr(worker_args, name))
+        args.external_workers = False
+        self.args = args
+
+        self.interface = interface_cls(args)
+        self.input_manager = self.interface.input_manager()
+        self.driver = MeasurementDriver(
+            measurement_interface=self.interface,
+            input_manager=self.input_manager,
+            args=args,
+            objective=self.interface.objective(),
+            session=self.session,
+            tuning_run=self.tuning_run,
+            tuning_run_main=self)
+        self.interface.set_driver(self.driver)
+        self.input_manager.set_driver(self.driver)
+        self.commit()
+
+    def find_tuning_run(self, worker_args):
+        if worker_args.tuning_run:
+            return (self.session.query(TuningRun)
+                    .filter_by(uuid=worker_args.tuning_run).one())
+        while True:
+            tuning_run = (self.session.query(TuningRun)
+                          .filter_by(state='RUNNING')
+                          .order_by(TuningRun.start_date.desc()).first())
+            if tuning_run is not None:
+                return tuning_run
+            self.session.commit()
+            time.sleep(worker_args.worker_poll_interval or 1.0)
+
+    def commit(self, force=False):
+        # other processes must see claims and results right away
+        self.session.commit()
+
+    def heartbeat(self, desired_result_id, lease, stop):
+        """renew the lease (a list of its start_date) until stop is set"""
+        session = self.Session()  # thread local session
+        try:
+            while not stop.wait(self.args.lease_timeout / 3.0):
+                renewed = self.driver.renew_lease(desired_result_id, lease[0],
+                                                  session)
+                session.commit()
+                if renewed is None:
+                    log.warning('lost the lease on desired result %d',
+                                desired_result_id)
+                    break
+                lease[0] = renewed
+        finally:
+            self.Session.remove()
+
+    def measure(self, desired_result):
+        """measure a claimed desired_result and report its Result"""
+        driver = self.driver
+        if driver.run_cached(desired_result):
+            return
+        input = driver.prepare_run(desired_result)
+        # release the database while measuring, sqlite locks it for writers
+        self.commit()
+        stop = threading.Event()
+        lease = [desired_result.start_date]
+        heartbeat = threading.Thread(target=self.heartbeat,
+                                     args=(desired_result.id, lease, stop))
+        heartbeat.daemon = True
+        heartbeat.start()
+        try:
+            if self.interface.parallel_compile:
+                compile_result = self.interface.compile(
+                    desired_result.configuration.data, desired_result.id)
+                samples = driver.measure_samples(
+                    lambda: self.interface.run_precompiled(
+                        desired_result, input, desired_result.limit,
+                        compile_result, desired_result.id))
+            else:
+                samples = driver.measure_samples(
+                    lambda: self.interface.compile_and_run(
+                        desired_result, input, desired_result.limit))
+        finally:
+            stop.set()
+            heartbeat.join()
+        # once the lease expired another worker may measure the desired
+        # result again, only report it while holding the lease (the renewed
+        # lease stays locked until finish_run commits)
+        if driver.renew_lease(desired_result.id, lease[0]) is not None:
+            driver.finish_run(desired_result, driver.aggregate_samples(samples),
+                              input, samples)
+        else:
+            log.warning('lease on desired result %d expired, dropping its '
+                        'result', desired_result.id)
+        if self.interface.parallel_compile:
+            try:
+                self.interface.cleanup(desired_result.id)
+            except RuntimeError as e:
+                log.warning('cleanup(%s) failed: %s', desired_result.id, e)
+
+    def process_one(self):
+        """measure one pending desired result, returns False if none were pending"""
+        self.driver.requeue_expired()
+        self.commit()
+        for dr in self.driver.query_pending_desired_results().all():
+            if self.driver.claim_desired_result(dr):
+                log.debug('worker claimed desired result %d', dr.id)
+                self.measure(dr)
+                return True
+        return False
+
+    def main(self):
+        count = 0
+        try:
+            while True:
+                if self.process_one():
+                    count += 1
+                    continue
+                self.session.refresh(self.tuning_run)
+                if self.tuning_run.state != 'RUNNING':
+                    break
+                time.sleep(self.args.worker_poll_interval)
+        finally:
+            log.info('worker measured %d tests for tuning run %s', count,
+                     self.tuning_run.uuid)
+            self.commit()
+            self.session.close()
+            self.driver.close()
+        return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(parents=[argparser])
+    worker_args = parser.parse_args(argv)
+    interface_cls = load_interface_class(worker_args.interface)
+    return MeasurementWorker(interface_cls, worker_args).main()
+
+
+if __name__ == '__main__':
+    main()
@@ -5,13 +5,22 @@ import time
 from pprint import pprint
 
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import scoped_session, sessionmaker
 
 from .models import Base, _Meta
 
 log = logging.getLogger(__name__)
 
-DB_VERSION = "0.0"
+DB_VERSION = "0.1"
+
+# statements upgrading a database from version to the next one
+MIGRATIONS = [
+    ("0.0", "0.1", ["ALTER TABLE desired_result ADD COLUMN input_class_id "
+                    "INTEGER REFERENCES input_class (id)"]),
+]
 
 if False:  # profiling of queries
     import atexit
@@ -40,8 +49,34 @@ if False:  # profiling of queries
         pprint(the_query_totals.most_common(10))
 
 
-def connect(dbstr):
-    engine = create_engine(dbstr, echo=False)
+def migrate(engine, version):
+    """upgrade a database at version to DB_VERSION with MIGRATIONS"""
+    for old, new, statements in MIGRATIONS:
+        if version != old:
+            continue
+        log.warning('upgrading opentuner database from version %s to %s',
+                    old, new)
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+            connection.execute(text("UPDATE _meta SET db_version = :new"),
+                               {'new': new})
+        version = new
+    return version
+
+
+def connect(dbstr, readonly=False):
+    """
+    engine and Session of the database dbstr, creating or upgrading it as
+    needed; readonly only opens an existing database (of this or an older
+    version, left as it is) and never writes to it
+    """
+    url = make_url(dbstr)
+    if readonly and url.get_backend_name() == 'sqlite' and url.database:
+        # sqlite would create a missing file
+        url = url.set(database='file:' + url.database,
+                      query={'mode': 'ro', 'uri': 'true'})
+    engine = create_engine(url, echo=False)
     connection = engine.connect()
 
     # handle case that the db was initialized before a version table existed yet
@@ -58,12 +93,32 @@ def connect(dbstr):
                                               autoflush=False,
                                               bind=engine))
         version = _Meta.get_version(Session)
+        Session.remove()
+        if readonly:
+            # migrations only add columns, so older versions are readable
+            if version in [old for old, new, statements in MIGRATIONS]:
+                version = DB_VERSION
+        elif version != DB_VERSION:
+            version = migrate(engine, version)
         if not DB_VERSION == version:
             raise Exception(
                 'Your opentuner database version {} is out of date with the current version {}'.format(version,
                                                                                                        DB_VERSION))
-
-    Base.metadata.create_all(engine)
+    elif readonly:
+        connection.close()
+        raise Exception("No opentuner database in {}".format(dbstr))
+    connection.close()
+
+    if readonly:
+        return engine, scoped_session(sessionmaker(autocommit=False,
+                                                   autoflush=False,
+                                                   bind=engine))
+
+    try:
+        Base.metadata.create_all(engine)
+    except OperationalError:
+        # another process (e.g. an opentuner-worker) created the tables first
+        Base.metadata.create_all(engine)
 
     Session = scoped_session(sessionmaker(autocommit=False,
                                           autoflush=False,
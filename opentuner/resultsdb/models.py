@@ -2,10 +2,13 @@ from future import standard_library
 
 standard_library.install_aliases()
 from builtins import object
+from builtins import range
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.ext.declarative import declared_attr
 from sqlalchemy import create_engine
+from sqlalchemy.orm import deferred
 from sqlalchemy.orm import relationship
+from sqlalchemy.orm import synonym
 from sqlalchemy import (
     Column, Integer, String, DateTime, Boolean, Enum,
     Float, PickleType, ForeignKey, Text, func, Index)
@@ -15,12 +18,17 @@ import re
 from pickle import dumps, loads
 from gzip import zlib
 
+from opentuner.utils.lrucache import LRUCache
+
 
 class CompressedPickler(object):
+    # zlib level of new blobs (--compression-level), loads() reads any level
+    level = 1
+
     @classmethod
     def dumps(cls, obj, protocol=2):
         s = dumps(obj, protocol)
-        sz = zlib.compress(s, 9)
+        sz = zlib.compress(s, cls.level)
         if len(sz) < len(s):
             return sz
         else:
@@ -126,7 +134,53 @@ class Configuration(Base):
     program_id = Column(ForeignKey(Program.id))
     program = relationship(Program)
     hash = Column(String(64))
-    data = Column(PickleType(pickler=CompressedPickler))
+    # loaded on first use and decoded once per session, see data_cache()
+    _data = deferred(Column('data', PickleType(pickler=CompressedPickler)))
+
+    # default size of data_cache()
+    data_cache_size = 10000
+
+    def _get_data(self):
+        state = sqlalchemy.inspect(self)
+        if state.session is None or state.identity is None:
+            return self._data
+        cache = self.data_cache(state.session)
+        key = state.identity[0]
+        data = cache.get(key, cache)
+        if data is cache:
+            data = self._data
+            cache.put(key, data)
+        return data
+
+    def _set_data(self, data):
+        state = sqlalchemy.inspect(self)
+        if state.session is not None and state.identity is not None:
+            self.data_cache(state.session).pop(state.identity[0])
+        self._data = data
+
+    data = synonym('_data', descriptor=property(_get_data, _set_data))
+
+    @classmethod
+    def data_cache(cls, session, size=None):
+        """
+        LRUCache of decoded data by configuration id kept in session.info,
+        commits expire configurations but their (immutable) data stays here
+        """
+        cache = session.info.get('configuration_data')
+        if cache is None or (size is not None and cache.max_size != size):
+            cache = LRUCache(size or cls.data_cache_size)
+            session.info['configuration_data'] = cache
+        return cache
+
+    @classmethod
+    def prefetch(cls, session, ids, chunk_size=500):
+        """load and decode the data of the configuration ids not yet cached"""
+        cache = cls.data_cache(session)
+        ids = sorted(set(i for i in ids if i is not None and i not in cache))
+        for start in range(0, len(ids), chunk_size):
+            for id, data in (session.query(cls.id, cls._data)
+                             .filter(cls.id.in_(ids[start:start + chunk_size]))):
+                cache.put(id, data)
 
     @classmethod
     def get(cls, session, program, hashv, datav):
@@ -139,6 +193,13 @@ class Configuration(Base):
             session.add(t)
             return t
 
+    @classmethod
+    def hash_ids(cls, session, program):
+        """return a dict mapping hash to id for all configurations of program"""
+        session.flush()
+        return dict(session.query(Configuration.hash, Configuration.id)
+                    .filter_by(program=program))
+
 
 Index('ix_configuration_custom1', Configuration.program_id, Configuration.hash)
 
@@ -271,11 +332,33 @@ class Result(Base):
 Index('ix_result_custom1', Result.tuning_run_id, Result.was_new_best)
 
 
+class ResultSample(Base):
+    """
+    one measurement of a Result that was measured several times
+    (--samples-max), the Result itself holds the aggregate
+    """
+    result_id = Column(ForeignKey(Result.id), index=True)
+    result = relationship(Result, backref='samples')
+    number = Column(Integer)
+
+    state = Column(Enum('OK', 'TIMEOUT', 'ERROR',
+                        name='t_result_state'),
+                   default='OK')
+    time = Column(Float)
+    accuracy = Column(Float)
+    energy = Column(Float)
+    size = Column(Float)
+    collection_date = Column(DateTime, default=func.now())
+
+
 class DesiredResult(Base):
     # set by the technique:
     configuration_id = Column(ForeignKey(Configuration.id))
     configuration = relationship(Configuration)
     limit = Column(Float)
+    # set by multi-fidelity techniques, None means full fidelity
+    input_class_id = Column(ForeignKey(InputClass.id))
+    input_class = relationship(InputClass)
 
     # set by the search driver
     priority = Column(Float)
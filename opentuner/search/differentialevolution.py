@@ -8,6 +8,7 @@ from builtins import map
 from builtins import object
 from builtins import range
 
+import numpy
 from past.utils import old_div
 
 from .technique import SearchTechnique
@@ -46,6 +47,7 @@ class DifferentialEvolution(SearchTechnique):
         self.n_cross = n_cross
         self.information_sharing = information_sharing
         self.population = None
+        self.seed_cfgs = list()
         self.duplicate_retries = duplicate_retries
         self.limit = None
         super(DifferentialEvolution, self).__init__(*pargs, **kwargs)
@@ -54,11 +56,15 @@ class DifferentialEvolution(SearchTechnique):
     def get_hyper_parameters(cls):
         return ['population_size', 'cr', 'n_cross', 'information_sharing']
 
+    def add_seed_configurations(self, cfgs):
+        self.seed_cfgs = list(cfgs[:self.population_size])
+
     def initial_population(self):
+        cfgs = self.seed_cfgs + [self.manipulator.random() for z in
+                                 range(self.population_size - len(self.seed_cfgs))]
         self.population = [PopulationMember(
-            self.driver.get_configuration(
-                self.manipulator.random()), submitted=False)
-            for z in range(self.population_size)]
+            self.driver.get_configuration(cfg), submitted=False)
+            for cfg in cfgs]
 
     def oldest_pop_member(self):
         # since tests are run in parallel, exclude things with a replacement pending
@@ -123,9 +129,20 @@ class DifferentialEvolution(SearchTechnique):
 
         params = self.manipulator.param_names(cfg, x1, x2, x3)
         random.shuffle(params)
-        for i, k in enumerate(params):
-            if i < self.n_cross or random.random() < self.cr:
-                # cfg = x1 + use_f*(x2 - x3)
+        crossed = [k for i, k in enumerate(params)
+                   if i < self.n_cross or random.random() < self.cr]
+
+        # cfg = x1 + use_f*(x2 - x3)
+        if self.manipulator.is_numeric():
+            # all parameters at once on the unit scale
+            x = self.manipulator.to_unit_array([x1, x2, x3])
+            trial = self.manipulator.array_set_linear(1.0, x[0:1], use_f, x[1:2],
+                                                      -use_f, x[2:3])
+            crossed = set(crossed)
+            self.manipulator.from_unit_array(
+                trial, [cfg], [p.name in crossed for p in self.manipulator.params])
+        else:
+            for k in crossed:
                 cfg_params[k].op4_set_linear(x1, x2, x3, 1.0, use_f, -use_f)
 
         return cfg
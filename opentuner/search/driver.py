@@ -9,6 +9,9 @@ from builtins import object
 from builtins import range
 from datetime import datetime
 
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
 from opentuner.driverbase import DriverBase
 from opentuner.resultsdb.models import BanditInfo
 from opentuner.resultsdb.models import BanditSubTechnique
@@ -30,6 +33,10 @@ argparser.add_argument('--parallelism', type=int, default=4,
                        help='how many tests to support at once')
 argparser.add_argument('--pipelining', type=int, default=0,
                        help='how long a delay (in generations) before results are available')
+argparser.add_argument('--async-search', action='store_true',
+                       help='keep --parallelism tests in flight, requesting a '
+                            'new test as soon as any result arrives instead '
+                            'of waiting for whole generations')
 argparser.add_argument('--bail-threshold', type=int, default=500,
                        help='abort if no requests have been made in X generations')
 argparser.add_argument('--no-dups', action='store_true',
@@ -48,11 +55,13 @@ class SearchDriver(DriverBase):
     DesiredResults
     """
 
-    def __init__(self, manipulator, extra_seeds=None, extra_criteria=None, **kwargs):
+    def __init__(self, manipulator, extra_seeds=None, extra_criteria=None,
+                 input_manager=None, **kwargs):
         super(SearchDriver, self).__init__(**kwargs)
         if extra_seeds is None:
             extra_seeds = []
         self.manipulator = manipulator
+        self.input_manager = input_manager
         self.wait_for_results = self.tuning_run_main.results_wait
         self.commit = self.tuning_run_main.commit
         self.extra_criteria = extra_criteria
@@ -61,6 +70,7 @@ class SearchDriver(DriverBase):
         self.test_count = 0
         self.plugins = plugin.get_enabled(self.args)
         self.pending_result_callbacks = list()  # (DesiredResult, function) tuples
+        self.in_flight = list()  # requested DesiredResults without a result
         # deepcopy is required to have multiple tuning runs in a single process
         if self.args.list_techniques:
             techniques, generators = technique.all_techniques()
@@ -87,6 +97,9 @@ class SearchDriver(DriverBase):
 
         self.objective.set_driver(self)
         self.pending_config_ids = set()
+        self.configurations = dict()  # config hash -> Configuration
+        self.configuration_ids = None  # config hash -> id, loaded on first use
+        self.new_configurations = list()  # not yet looked up, see get_configuration
         self.best_result = None
         self.new_results = []
 
@@ -102,6 +115,54 @@ class SearchDriver(DriverBase):
 
         self.plugins.sort(key = lambda x: x.priority)
 
+    def add_previous_results(self, previous, seed_count=0):
+        """
+        add results measured by earlier tuning runs (a list of configuration
+        data, Result field dicts and whether the program version was the
+        same, best first, see --resume-from) to this run as if they had been
+        requested here, so they set the best result and are never measured
+        again, and seed the techniques with the first seed_count
+        configurations
+
+        results of other program versions are not added, the first
+        seed_count of them are measured again first instead
+        """
+        stale = list()
+        for data, fields, current in previous:
+            if not current:
+                stale.append(data)
+                continue
+            config = self.get_configuration(data)
+            if self.result_index.first_request(config) is not None:
+                continue
+            result = Result(configuration=config,
+                            tuning_run=self.tuning_run,
+                            collection_date=datetime.now(),
+                            collection_cost=0.0,
+                            **fields)
+            dr = DesiredResult(configuration=config,
+                               requestor='resume',
+                               generation=self.generation,
+                               request_date=datetime.now(),
+                               tuning_run=self.tuning_run,
+                               state='COMPLETE',
+                               result=result)
+            self.session.add(dr)
+            self.result_index.add_request(dr)
+        self.resolve_configurations()
+        self.session.flush()
+        self.process_new_results()
+        if stale[:seed_count]:
+            self.add_seed_configurations(stale[:seed_count])
+        seeds = [self.manipulator.copy(data)
+                 for data, fields, current in previous[:seed_count]]
+        if seeds:
+            self.root_technique.add_seed_configurations(seeds)
+
+    def add_seed_configurations(self, cfgs):
+        """request cfgs (in order) after any --seed-configuration"""
+        self.seed_cfgs[:0] = [self.manipulator.copy(cfg) for cfg in reversed(cfgs)]
+
     def add_plugin(self, p):
         if p in self.plugins:
             return
@@ -147,9 +208,10 @@ class SearchDriver(DriverBase):
             if dr.result is not None:
                 callback(dr.result)
                 continue
-            elif self.generation - dr.generation > self.args.pipelining:
+            elif (not self.args.async_search and dr.input_class is None and
+                  self.generation - dr.generation > self.args.pipelining):
                 # see if we can find a result
-                results = self.results_query(config=dr.configuration).all()
+                results = self.result_index.results_for(dr.configuration)
                 log.warning("Result callback %d (requestor=%s) pending for "
                             "%d generations %d results available",
                             dr.id, dr.requestor, self.generation - dr.generation,
@@ -162,12 +224,51 @@ class SearchDriver(DriverBase):
             self.pending_result_callbacks.append((dr, callback))
 
     def has_results(self, config):
-        return self.results_query(config=config).count() > 0
+        return self.result_index.has_results(config)
 
-    def run_generation_techniques(self):
-        tests_this_generation = 0
+    def run_generation_techniques(self, count=None):
+        """request up to count (default --parallelism) new tests"""
+        if count is None:
+            count = self.args.parallelism
         self.plugin_proxy.before_techniques()
-        for z in range(self.args.parallelism):
+        desired_results = self.generate_desired_results(count)
+        requested = []
+        for dr in desired_results:
+            if dr.input_class is not None:
+                # reduced fidelity requests are never duplicates of full ones
+                self.session.add(dr)
+                dr.state = 'REQUESTED'
+                requested.append(dr)
+                self.test_count += 1
+                continue
+            duplicate = self.result_index.first_request(dr.configuration)
+            self.result_index.add_request(dr)
+            self.session.add(dr)
+            if duplicate is not None and duplicate is not dr:
+                if not self.args.no_dups:
+                    log.warning("duplicate configuration request #%d %s/%s %s",
+                                self.test_count,
+                                dr.requestor,
+                                duplicate.requestor,
+                                'OLD' if duplicate.result else 'PENDING')
+                self.register_result_callback(duplicate,
+                                              self.duplicate_callback(dr))
+            else:
+                dr.state = 'REQUESTED'
+                requested.append(dr)
+            self.test_count += 1
+        self.resolve_configurations()
+        self.session.flush()  # insert configurations and desired results at once
+        self.in_flight.extend(requested)
+        for dr in requested:
+            log.debug("desired result id=%d, cfg=%d", dr.id, dr.configuration_id)
+        self.plugin_proxy.after_techniques()
+        return len(desired_results)
+
+    def generate_desired_results(self, count):
+        """collect up to count DesiredResults from seeds and root_technique"""
+        desired_results = []
+        for z in range(count):
             if self.seed_cfgs:
                 config = self.get_configuration(self.seed_cfgs.pop())
                 dr = DesiredResult(configuration=config,
@@ -180,44 +281,34 @@ class SearchDriver(DriverBase):
             if dr is None or dr is False:
                 log.debug("no desired result, skipping to testing phase")
                 break
-            self.session.flush()  # populate configuration_id
-            duplicates = (self.session.query(DesiredResult)
-                          .filter_by(tuning_run=self.tuning_run,
-                                     configuration_id=dr.configuration_id)
-                          .filter(DesiredResult.id != dr.id)
-                          .order_by(DesiredResult.request_date)
-                          .limit(1).all())
-            self.session.add(dr)
-            if len(duplicates):
-                if not self.args.no_dups:
-                    log.warning("duplicate configuration request #%d %s/%s %s",
-                                self.test_count,
-                                dr.requestor,
-                                duplicates[0].requestor,
-                                'OLD' if duplicates[0].result else 'PENDING')
-                self.session.flush()
-                desired_result_id = dr.id
-
-                def callback(result):
-                    dr = self.session.query(DesiredResult).get(desired_result_id)
-                    dr.result = result
-                    dr.state = 'COMPLETE'
-                    dr.start_date = datetime.now()
-
-                self.register_result_callback(duplicates[0], callback)
-            else:
-                log.debug("desired result id=%d, cfg=%d", dr.id, dr.configuration_id)
-                dr.state = 'REQUESTED'
-            self.test_count += 1
-            tests_this_generation += 1
-        self.plugin_proxy.after_techniques()
-        return tests_this_generation
+            desired_results.append(dr)
+        return desired_results
+
+    def duplicate_callback(self, dr):
+        """complete dr with the result of an earlier request of its config"""
+
+        def callback(result):
+            dr.result = result
+            dr.state = 'COMPLETE'
+            dr.start_date = datetime.now()
+
+        return callback
 
     def process_new_results(self):
         self.new_results = []
-        for result in (self.results_query()
-                .filter_by(was_new_best=None)
-                .order_by(Result.collection_date)):
+        results = (self.results_query()
+                   .filter_by(was_new_best=None)
+                   .order_by(Result.collection_date)
+                   .all())
+        # techniques and plugins look at the new configurations next
+        Configuration.prefetch(self.session,
+                               [result.configuration_id for result in results])
+        for result in results:
+            if not self.is_full_fidelity(result):
+                # delivered to its requestor by result_callbacks() only
+                result.was_new_best = False
+                continue
+            self.result_index.add_result(result)
             self.plugin_proxy.on_result(result)
             self.new_results.append(result)
             if self.best_result is None:
@@ -229,6 +320,7 @@ class SearchDriver(DriverBase):
                 self.plugin_proxy.on_new_best_result(result)
             else:
                 result.was_new_best = False
+        self.in_flight = [dr for dr in self.in_flight if dr.result is None]
         self.result_callbacks()
 
     def run_generation_results(self, offset=0):
@@ -261,13 +353,57 @@ class SearchDriver(DriverBase):
         """called by SearchTechniques to create Configuration objects"""
         self.manipulator.normalize(cfg)
         hashv = self.manipulator.hash_config(cfg)
-        config = Configuration.get(self.session, self.program, hashv, cfg)
+        config = self.configurations.get(hashv)
+        if config is None:
+            if self.configuration_ids is None:
+                # configurations of this program stored by earlier tuning runs
+                self.configuration_ids = Configuration.hash_ids(self.session,
+                                                                self.program)
+            if hashv in self.configuration_ids:
+                config = (self.session.query(Configuration)
+                          .get(self.configuration_ids[hashv]))
+            else:
+                # another process may have stored it since the snapshot, all
+                # new configurations are looked up at once before inserting
+                config = Configuration(program=self.program, hash=hashv, data=cfg)
+                self.session.add(config)
+                self.new_configurations.append(config)
+            self.configurations[hashv] = config
         return config
 
+    def resolve_configurations(self, chunk_size=500):
+        """
+        turn the new configurations of get_configuration() that other
+        processes stored since the configuration_ids snapshot into those
+        rows (one query per chunk_size configurations), so they are not
+        inserted twice
+        """
+        # a commit may have inserted some of them already
+        new = dict((config.hash, config) for config in self.new_configurations
+                   if inspect(config).pending)
+        self.new_configurations = list()
+        hashes = sorted(new)
+        for start in range(0, len(hashes), chunk_size):
+            for hashv, id in (self.session.query(Configuration.hash,
+                                                 Configuration.id)
+                              .filter_by(program=self.program)
+                              .filter(Configuration.hash.in_(
+                                  hashes[start:start + chunk_size]))):
+                config = new[hashv]
+                self.session.expunge(config)
+                config.id = id
+                make_transient_to_detached(config)
+                self.session.add(config)
+
     def main(self):
         self.plugin_proxy.set_driver(self)
         self.plugin_proxy.before_main()
 
+        if self.args.async_search:
+            self.async_main()
+            self.plugin_proxy.after_main()
+            return
+
         no_tests_generations = 0
 
         # prime pipeline with tests
@@ -287,6 +423,37 @@ class SearchDriver(DriverBase):
 
         self.plugin_proxy.after_main()
 
+    def async_main(self):
+        """
+        keep --parallelism tests in flight, each generation requests as many
+        tests as there are free slots and then waits for any one result
+        """
+        no_tests_generations = 0
+        while not self.convergence_criteria():
+            free = self.args.parallelism - len(self.in_flight)
+            if free > 0 and self.run_generation_techniques(free) > 0:
+                no_tests_generations = 0
+            elif self.in_flight:
+                pass
+            elif no_tests_generations <= self.args.bail_threshold:
+                no_tests_generations += 1
+            else:
+                break
+            self.run_async_results()
+            self.generation += 1
+
+        # collect the tests that are still running
+        while self.in_flight:
+            self.run_async_results()
+            self.generation += 1
+
+    def run_async_results(self):
+        self.commit()
+        self.plugin_proxy.before_results_wait()
+        self.tuning_run_main.results_wait_any()
+        self.plugin_proxy.after_results_wait()
+        self.process_new_results()
+
     def external_main_begin(self):
         self.plugin_proxy.set_driver(self)
         self.plugin_proxy.before_main()
@@ -23,6 +23,8 @@ import numpy
 from future.utils import with_metaclass
 from past.utils import old_div
 
+from opentuner.utils.lrucache import LRUCache
+
 log = logging.getLogger(__name__)
 argparser = argparse.ArgumentParser(add_help=False)
 argparser.add_argument('--list-params', '-lp',
@@ -131,13 +133,24 @@ class ConfigurationManipulator(ConfigurationManipulatorBase):
     configs in a dict-like object
     """
 
-    def __init__(self, params=None, config_type=dict, seed_config=None, **kwargs):
+    def __init__(self, params=None, config_type=dict, seed_config=None,
+                 hash_cache_size=0, **kwargs):
+        """
+        hash_cache_size > 0 memoizes hash_config() for up to that many
+        distinct configs, evicting the least recently used
+        """
         if params is None:
             params = []
         self.params = list(params)
         self.config_type = config_type
         self.search_driver = None
         self._seed_config = seed_config
+        self._sorted_params = None
+        self._unit_bounds_cache = None
+        if hash_cache_size > 0:
+            self.hash_cache = LRUCache(hash_cache_size)
+        else:
+            self.hash_cache = None
         super(ConfigurationManipulator, self).__init__(**kwargs)
         for p in self.params:
             p.parent = self
@@ -145,6 +158,7 @@ class ConfigurationManipulator(ConfigurationManipulatorBase):
     def add_parameter(self, p):
         p.set_parent(self)
         self.params.append(p)
+        self._sorted_params = None
 
         # TODO sub parameters should be recursed on
         # not currently an issue since no doubly-nested sub-parameters
@@ -230,11 +244,36 @@ class ConfigurationManipulator(ConfigurationManipulatorBase):
         params = [p for p in self.params if p.parent is self]
         return param_info_to_json(self, params)
 
+    def sorted_parameters(self, config):
+        """self.parameters(config) sorted by name, computed once for self.params"""
+        params = self.parameters(config)
+        if params is not self.params:
+            return sorted(params, key=lambda x: x.name)
+        if self._sorted_params is None or len(self._sorted_params) != len(params):
+            self._sorted_params = sorted(params, key=lambda x: x.name)
+        return self._sorted_params
+
     def hash_config(self, config):
-        """produce unique hash value for the given config"""
+        """
+        produce unique hash value for the given config, memoized on the
+        pickled value of config if hash_cache_size was given
+        """
+        if self.hash_cache is None:
+            return self._hash_config(config)
+        try:
+            key = pickle.dumps(config, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return self._hash_config(config)
+        hashv = self.hash_cache.get(key)
+        if hashv is None:
+            hashv = self._hash_config(config)
+            self.hash_cache.put(key, hashv)
+        return hashv
+
+    def _hash_config(self, config):
+        """hook to compute the hash returned by hash_config()"""
         m = hashlib.sha256()
-        params = list(self.parameters(config))
-        params.sort(key = lambda x: x.name)
+        params = self.sorted_parameters(config)
         for i, p in enumerate(params):
             m.update(str(p.name).encode())
             m.update(p.hash_value(config))
@@ -271,6 +310,119 @@ class ConfigurationManipulator(ConfigurationManipulatorBase):
             param = param_dict[pname]
             getattr(param, sv_map[pname])(cfg, *args[pname], **kwargs[pname])
 
+    # Array representation for purely numeric search spaces
+    #
+    # A config maps to a float64 vector of unit values (see
+    # PrimitiveParameter.get_unit_value) with one dimension per parameter in
+    # self.params order.  A population is a 2-D array with one row per config,
+    # so the array_* operators below act on whole populations at once.
+
+    def is_numeric(self):
+        """true if every parameter is a NumericParameter stored at the top level"""
+        return all(isinstance(p, NumericParameter) and
+                   (not isinstance(p.name, str) or '/' not in p.name)
+                   for p in self.params)
+
+    def _unit_bounds(self):
+        """
+        (low, high, is_integer) arrays on the search scale, with integer
+        ranges widened to account for rounding as in set_unit_value()
+        """
+        if self._unit_bounds_cache is None or len(self._unit_bounds_cache[0]) != len(self.params):
+            if not self.is_numeric():
+                log.error('array representation requires only NumericParameters')
+                raise TypeError('array representation requires only NumericParameters')
+            low = numpy.empty(len(self.params))
+            high = numpy.empty(len(self.params))
+            is_integer = numpy.empty(len(self.params), dtype=bool)
+            for i, p in enumerate(self.params):
+                low[i], high[i] = p.legal_range(None)
+                is_integer[i] = p.is_integer_type()
+            low[is_integer] -= 0.4999
+            high[is_integer] += 0.4999
+            self._unit_bounds_cache = (low, high, is_integer)
+        return self._unit_bounds_cache
+
+    def to_unit_vector(self, config):
+        """convert config to a 1-D array of unit values"""
+        return self.to_unit_array([config])[0]
+
+    def to_unit_array(self, configs):
+        """convert a list of configs to a 2-D array of unit values"""
+        low, high, is_integer = self._unit_bounds()
+        values = numpy.array([[p.get_value(cfg) for p in self.params]
+                              for cfg in configs], dtype=numpy.float64)
+        values = values.reshape((len(configs), len(self.params)))
+        span = high - low
+        scale = numpy.where(span > 0, span, 1.0)
+        return numpy.where(span > 0, (values - low) / scale, 0.0)
+
+    def from_unit_vector(self, vector, config=None):
+        """convert a 1-D array of unit values to a config"""
+        if config is None:
+            config = self.seed_config()
+        return self.from_unit_array(numpy.array([vector]), [config])[0]
+
+    def from_unit_array(self, array, configs=None, mask=None):
+        """
+        convert a 2-D array of unit values to a list of configs, if configs is
+        given the values are written into those configs, if mask (booleans
+        for self.params) is given only the values of those parameters
+        """
+        low, high, is_integer = self._unit_bounds()
+        array = numpy.clip(numpy.asarray(array, dtype=numpy.float64), 0.0, 1.0)
+        values = array * (high - low) + low
+        values[:, is_integer] = numpy.round(values[:, is_integer])
+        values = numpy.clip(values, low, high)
+        params = self.params
+        if mask is not None:
+            mask = numpy.asarray(mask, dtype=bool)
+            params = [p for p, m in zip(self.params, mask) if m]
+            values = values[:, mask]
+        if configs is None:
+            configs = [self.seed_config() for row in values]
+        for cfg, row in zip(configs, values.tolist()):
+            for p, v in zip(params, row):
+                p.set_value(cfg, p.value_type(v))
+        return configs
+
+    def array_random(self, n):
+        """a population of n uniformly random points"""
+        low, high, is_integer = self._unit_bounds()
+        return numpy.random.uniform(size=(n, len(low)))
+
+    def array_normal_mutation(self, population, sigma=0.1):
+        """
+        apply normally distributed noise to every value of population,
+        reflecting off the edges as in PrimitiveParameter.op1_normal_mutation()
+        """
+        v = population + numpy.random.normal(0.0, sigma, size=population.shape)
+        v = numpy.where(v < 0.0, -v, v)
+        v = numpy.where(v > 1.0, 1.0 - (v % 1), v)
+        return numpy.clip(v, 0.0, 1.0)
+
+    def array_set_linear(self, a, population_a, b, population_b, c, population_c):
+        """
+        rowwise linear combination :math:`a*A + b*B + c*C` as in
+        PrimitiveParameter.op4_set_linear()
+        """
+        return numpy.clip(a * population_a + b * population_b + c * population_c,
+                          0.0, 1.0)
+
+    def array_swarm(self, position, velocity, local_best, global_best,
+                    c=1, c1=0.5, c2=0.5):
+        """
+        particle swarm step for a whole population as in
+        FloatParameter.op3_swarm(), velocities are on the unit scale
+
+        :return: (new position, new velocity)
+        """
+        r1 = numpy.random.uniform(size=position.shape)
+        r2 = numpy.random.uniform(size=position.shape)
+        v = (velocity * c + (local_best - position) * c1 * r1 +
+             (global_best - position) * c2 * r2)
+        return numpy.clip(position + v, 0.0, 1.0), v
+
 
 class Parameter(with_metaclass(abc.ABCMeta, object)):
     """
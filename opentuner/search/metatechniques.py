@@ -39,6 +39,10 @@ class MetaSearchTechnique(SearchTechniqueBase):
             t.set_driver(driver)
         self.driver = driver
 
+    def add_seed_configurations(self, cfgs):
+        for t in self.techniques:
+            t.add_seed_configurations(cfgs)
+
     def desired_result(self):
         techniques = self.select_technique_order()
         for technique in techniques:
@@ -0,0 +1,146 @@
+from __future__ import division
+
+import functools
+import logging
+import math
+from builtins import range
+
+from opentuner.search import technique
+
+log = logging.getLogger(__name__)
+
+
+class SuccessiveHalving(technique.SearchTechnique):
+    """
+    multi-fidelity search: each bracket measures a batch of random configs
+    at a low fidelity and promotes the best 1/eta of every rung to the next
+    higher fidelity, until the survivors are measured at full fidelity
+
+    the fidelities are the InputClasses of a FidelityInputManager, with any
+    other input manager there is a single (full fidelity) rung
+    """
+
+    def __init__(self, eta=3, bracket_size=None, *pargs, **kwargs):
+        super(SuccessiveHalving, self).__init__(*pargs, **kwargs)
+        self.eta = eta
+        self.bracket_size = bracket_size
+        self.fidelities = None  # InputClass per rung, None for full fidelity
+        self.bracket_iter = None
+        self.rung = 0
+        self.todo = list()  # configs still to request at self.rung
+        self.pending = dict()  # config hash -> cfg requested at self.rung
+        self.rung_results = list()  # [(result, cfg)] of self.rung
+        self.budget = list()  # per rung {'tests': n, 'cost': seconds}
+
+    @classmethod
+    def get_hyper_parameters(cls):
+        return ['eta', 'bracket_size']
+
+    def init_fidelities(self):
+        fidelities = getattr(self.driver.input_manager, 'fidelities', None)
+        if fidelities is None:
+            log.warning('%s: input manager has no fidelities, '
+                        'measuring every rung at full fidelity', self.name)
+            self.fidelities = [None]
+        else:
+            # the top rung is full fidelity, the same as a plain request
+            self.fidelities = list(fidelities()[:-1]) + [None]
+        self.budget = [{'tests': 0, 'cost': 0.0} for f in self.fidelities]
+        self.bracket_iter = self.brackets()
+
+    def top_rung(self):
+        return len(self.fidelities) - 1
+
+    def brackets(self):
+        """yield (first rung, number of configs) for each new bracket"""
+        size = self.bracket_size or self.eta ** self.top_rung()
+        while True:
+            yield 0, size
+
+    def fidelity_name(self, rung):
+        if self.fidelities[rung] is None:
+            return 'full'
+        return str(self.fidelities[rung].size)
+
+    def start_bracket(self):
+        self.rung, size = next(self.bracket_iter)
+        cfgs = dict()
+        for i in range(size * 10):
+            if len(cfgs) >= size:
+                break
+            cfg = self.manipulator.random()
+            cfgs.setdefault(self.manipulator.hash_config(cfg), cfg)
+        self.todo = list(cfgs.values())
+        log.debug('%s: new bracket of %d configs at fidelity %s', self.name,
+                  len(self.todo), self.fidelity_name(self.rung))
+
+    def finish_rung(self):
+        """promote the best of the finished rung or start a new bracket"""
+        results = self.rung_results
+        self.rung_results = list()
+        ok = [(result, cfg) for result, cfg in results if result.state == 'OK']
+        ok.sort(key=functools.cmp_to_key(
+            lambda a, b: self.objective.compare(a[0], b[0])))
+        if results:
+            budget = self.budget[self.rung]
+            log.info('%s: rung %d (fidelity %s) done, %d tests / %.1fs so far',
+                     self.name, self.rung, self.fidelity_name(self.rung),
+                     budget['tests'], budget['cost'])
+        if ok and self.rung < self.top_rung():
+            keep = max(1, int(math.floor(len(results) / self.eta)))
+            self.rung += 1
+            self.todo = [cfg for result, cfg in ok[:keep]]
+        else:
+            self.start_bracket()
+
+    def desired_configuration(self):
+        if self.fidelities is None:
+            self.init_fidelities()
+        if not self.todo:
+            if self.pending:
+                return False  # wait for the rung to finish
+            self.finish_rung()
+        if not self.todo:
+            return False
+        cfg = self.todo.pop(0)
+        self.pending[self.manipulator.hash_config(cfg)] = cfg
+        return cfg
+
+    def desired_result(self):
+        dr = super(SuccessiveHalving, self).desired_result()
+        if dr:
+            dr.input_class = self.fidelities[self.rung]
+        return dr
+
+    def handle_requested_result(self, result):
+        cfg = self.pending.pop(result.configuration.hash, None)
+        if cfg is None:
+            return
+        self.rung_results.append((result, cfg))
+        self.budget[self.rung]['tests'] += 1
+        self.budget[self.rung]['cost'] += result.collection_cost or 0.0
+
+    def after_main(self):
+        if not self.budget:
+            return
+        for rung, budget in enumerate(self.budget):
+            log.info('%s: fidelity %s used %d tests / %.1fs', self.name,
+                     self.fidelity_name(rung), budget['tests'], budget['cost'])
+
+
+class Hyperband(SuccessiveHalving):
+    """
+    successive halving over brackets that start at different fidelities,
+    hedging against low fidelities that rank configs badly
+    """
+
+    def brackets(self):
+        s_max = self.top_rung()
+        while True:
+            for s in range(s_max, -1, -1):
+                size = int(math.ceil((s_max + 1) / (s + 1) * self.eta ** s))
+                yield s_max - s, size
+
+
+technique.register(SuccessiveHalving())
+technique.register(Hyperband())
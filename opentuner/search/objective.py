@@ -40,6 +40,13 @@ class SearchObjective(with_metaclass(abc.ABCMeta, object)):
         """return None, or a relative goodness of resultsdb.models.Result"""
         return
 
+    def result_scalar(self, result):
+        """
+        return None, or a number to minimize that orders results like
+        result_compare() (e.g. for regression models)
+        """
+        return None
+
     def config_relative(self, config1, config2):
         """return None, or a relative goodness of resultsdb.models.Configuration"""
         return self.result_relative(self.driver.results_query(config=config1).one(),
@@ -173,6 +180,9 @@ class MinimizeTime(SearchObjective):
         return cmp(min(list(map(lambda x: x.time, self.driver.results_query(config=config1)))),
                    min(list(map(lambda x: x.time, self.driver.results_query(config=config2)))))
 
+    def result_scalar(self, result):
+        return result.time
+
     def result_relative(self, result1, result2):
         """return None, or a relative goodness of resultsdb.models.Result"""
         if result2.time == 0:
@@ -194,6 +204,12 @@ class MaximizeAccuracy(SearchObjective):
         # note opposite order
         return cmp(result2.accuracy, result1.accuracy)
 
+    def result_scalar(self, result):
+        # ties on accuracy are not broken by MaximizeAccuracyMinimizeSize
+        if result.accuracy is None:
+            return None
+        return -result.accuracy
+
     def result_relative(self, result1, result2):
         """return None, or a relative goodness of resultsdb.models.Result"""
         # note opposite order
@@ -293,6 +309,13 @@ class ThresholdAccuracyMinimizeTime(SearchObjective):
         """Test if a Result() meets thresholds"""
         return result.accuracy >= self.accuracy_target
 
+    def result_scalar(self, result):
+        # time and accuracy do not share a scale, only acceptable results
+        # are ordered by a single number
+        if result.accuracy is None or not self.is_acceptable(result):
+            return None
+        return result.time
+
     def result_relative(self, result1, result2):
         """return None, or a relative goodness of resultsdb.models.Result"""
         # unimplemented for now
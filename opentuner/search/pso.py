@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 
+import numpy
+
 from opentuner.search import technique
 from .manipulator import *
 
@@ -66,6 +68,11 @@ class HybridParticle(object):
         for p in self.manipulator.params:
             # Velocity as a continous value
             self.velocity[p.name] = 0
+        # float only search spaces move all parameters at once on the unit
+        # scale (integers use a different, sigmoid based, swarm step)
+        self.unit_velocity = None
+        if m.is_numeric() and not any(p.is_integer_type() for p in m.params):
+            self.unit_velocity = numpy.zeros((1, len(m.params)))
 
     def move(self, global_best):
         """
@@ -73,6 +80,13 @@ class HybridParticle(object):
         TODO: introduce operator choice map
         """
         m = self.manipulator
+        if self.unit_velocity is not None:
+            x = m.to_unit_array([self.position, self.best, global_best])
+            position, self.unit_velocity = m.array_swarm(
+                x[0:1], self.unit_velocity, x[1:2], x[2:3],
+                c=self.omega, c1=self.phi_l, c2=self.phi_g)
+            m.from_unit_array(position, [self.position])
+            return
         for p in m.params:
             self.velocity[p.name] = p.op3_swarm(self.position, global_best, self.best, c=self.omega, c1=self.phi_g,
                                                 c2=self.phi_l, xchoice=self.crossover_choice,
@@ -33,6 +33,10 @@ class SimplexTechnique(SequentialSearchTechnique):
         self.seed_cfg = seed_cfg
         self.simplex_points = []
 
+    def add_seed_configurations(self, cfgs):
+        if self.seed_cfg is None and cfgs:
+            self.seed_cfg = cfgs[0]
+
     def calculate_centroid(self):
         """
         average of all the PrimitiveParameters in self.simplex_points
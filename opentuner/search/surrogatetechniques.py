@@ -0,0 +1,292 @@
+from __future__ import division
+
+import abc
+import logging
+import math
+from builtins import object
+from builtins import range
+from collections import OrderedDict
+
+import numpy
+from future.utils import with_metaclass
+
+from opentuner.resultsdb.models import Configuration
+from opentuner.search import technique
+from opentuner.search.evolutionarytechniques import NormalGreedyMutation
+from opentuner.search.evolutionarytechniques import UniformGreedyMutation
+from opentuner.search.manipulator import BooleanParameter
+from opentuner.search.manipulator import EnumParameter
+from opentuner.search.manipulator import SwitchParameter
+
+log = logging.getLogger(__name__)
+
+
+class UnitEncoder(object):
+    """
+    maps configs to fixed length float vectors for surrogate models:
+    primitive parameters use their unit value, booleans are 0/1 and
+    switch/enum parameters are one-hot encoded.  Other complex parameters
+    (permutations, schedules, ...) are not encoded.
+    """
+
+    def __init__(self, manipulator):
+        self.manipulator = manipulator
+        self.layout = None
+
+    def build_layout(self, cfg):
+        self.layout = list()
+        skipped = list()
+        for param in self.manipulator.parameters(cfg):
+            if param.is_primitive():
+                self.layout.append((param, None))
+            elif isinstance(param, BooleanParameter):
+                self.layout.append((param, None))
+            elif isinstance(param, SwitchParameter):
+                self.layout.append((param, list(range(param.option_count))))
+            elif isinstance(param, EnumParameter):
+                self.layout.append((param, list(param.options)))
+            else:
+                skipped.append(param.name)
+        if skipped:
+            log.info('surrogate model ignores parameters %s', skipped)
+
+    def width(self):
+        return sum(1 if options is None else len(options)
+                   for param, options in self.layout)
+
+    def encode(self, cfg):
+        if self.layout is None:
+            self.build_layout(cfg)
+        row = list()
+        for param, options in self.layout:
+            if options is None:
+                if param.is_primitive():
+                    row.append(param.get_unit_value(cfg))
+                else:
+                    row.append(float(param.get_value(cfg)))
+            else:
+                onehot = [0.0] * len(options)
+                value = param._get(cfg)
+                if value in options:
+                    onehot[options.index(value)] = 1.0
+                row.extend(onehot)
+        return row
+
+    def encode_all(self, cfgs):
+        if self.manipulator.is_numeric():
+            return self.manipulator.to_unit_array(cfgs)
+        return numpy.array([self.encode(cfg) for cfg in cfgs],
+                           dtype=numpy.float64).reshape((len(cfgs), -1))
+
+
+class SurrogateModel(with_metaclass(abc.ABCMeta, object)):
+    """
+    regression model predicting the objective of encoded configs
+    """
+
+    @abc.abstractmethod
+    def fit(self, x, y):
+        """train on the rows of x and their values y"""
+        return
+
+    @abc.abstractmethod
+    def predict(self, x):
+        """return (mean, std) arrays for the rows of x"""
+        return
+
+
+class GaussianProcessModel(SurrogateModel):
+    """
+    gaussian process regression with a squared exponential kernel, the length
+    scale is set to the median distance between training points
+    """
+
+    def __init__(self, noise=0.01, length_scale=None):
+        self.noise = noise
+        self.length_scale = length_scale
+        self.x = None
+
+    def kernel(self, a, b):
+        d = (numpy.sum(a * a, axis=1)[:, None] + numpy.sum(b * b, axis=1)[None, :]
+             - 2.0 * numpy.dot(a, b.T))
+        return numpy.exp(-numpy.maximum(d, 0.0) / (2.0 * self.scale ** 2))
+
+    def fit(self, x, y):
+        self.x = x
+        self.y_mean = numpy.mean(y)
+        self.y_std = numpy.std(y) or 1.0
+        if self.length_scale is not None:
+            self.scale = self.length_scale
+        else:
+            d = numpy.sqrt(numpy.maximum(
+                numpy.sum((x[:, None, :] - x[None, :, :]) ** 2, axis=2), 0.0))
+            d = d[numpy.triu_indices(len(x), 1)]
+            d = d[d > 0]
+            self.scale = numpy.median(d) if len(d) else 1.0
+        k = self.kernel(x, x) + self.noise * numpy.eye(len(x))
+        self.chol = numpy.linalg.cholesky(k)
+        self.alpha = numpy.linalg.solve(
+            self.chol.T, numpy.linalg.solve(self.chol, (y - self.y_mean) / self.y_std))
+
+    def predict(self, x):
+        ks = self.kernel(x, self.x)
+        mean = numpy.dot(ks, self.alpha)
+        v = numpy.linalg.solve(self.chol, ks.T)
+        var = numpy.maximum(1.0 - numpy.sum(v * v, axis=0), 1e-12)
+        return (mean * self.y_std + self.y_mean,
+                numpy.sqrt(var) * self.y_std)
+
+
+class RandomForestModel(SurrogateModel):
+    """
+    random forest from scikit-learn (optional dependency), the spread of the
+    individual trees is used as the std
+    """
+
+    def __init__(self, n_estimators=50, **kwargs):
+        self.n_estimators = n_estimators
+        self.kwargs = kwargs
+        self.forest = None
+
+    def fit(self, x, y):
+        from sklearn.ensemble import RandomForestRegressor
+        self.forest = RandomForestRegressor(n_estimators=self.n_estimators,
+                                            **self.kwargs)
+        self.forest.fit(x, y)
+
+    def predict(self, x):
+        predictions = numpy.array([tree.predict(x)
+                                   for tree in self.forest.estimators_])
+        return predictions.mean(axis=0), predictions.std(axis=0)
+
+
+class SurrogateSearch(technique.SearchTechnique):
+    """
+    fits a surrogate model to every result seen so far and uses it to screen
+    candidates generated by cheap techniques, only the top_k candidates by
+    lower confidence bound are requested for measurement
+    """
+
+    def __init__(self,
+                 generators=None,
+                 model=None,
+                 candidate_count=500,
+                 top_k=4,
+                 min_results=10,
+                 max_points=500,
+                 kappa=1.0,
+                 *pargs, **kwargs):
+        super(SurrogateSearch, self).__init__(*pargs, **kwargs)
+        if generators is None:
+            generators = [technique.PureRandom(),
+                          UniformGreedyMutation(mutation_rate=0.1),
+                          NormalGreedyMutation(mutation_rate=0.1)]
+        if model is None:
+            model = GaussianProcessModel()
+        self.generators = generators
+        self.model = model
+        self.candidate_count = candidate_count
+        self.top_k = top_k
+        self.min_results = min_results
+        self.max_points = max_points
+        self.kappa = kappa
+        self.encoder = None
+        self.data = OrderedDict()  # config hash -> (value, cfg)
+        self.seen = set()
+        self.queue = list()
+        self.next_generator = 0
+
+    def set_driver(self, driver):
+        super(SurrogateSearch, self).set_driver(driver)
+        self.encoder = UnitEncoder(self.manipulator)
+        for generator in self.generators:
+            generator.set_driver(driver)
+
+    def result_value(self, result):
+        """
+        value the surrogate model predicts, lower is better, None for results
+        the objective cannot order by a single number
+        """
+        return self.objective.result_scalar(result)
+
+    def on_result(self, result):
+        h = result.configuration.hash
+        self.seen.add(h)
+        if result.state != 'OK':
+            return
+        value = self.result_value(result)
+        if value is None or not math.isfinite(value):
+            return
+        if h in self.data:
+            # keep the best value of a config measured more than once
+            value = min(value, self.data.pop(h)[0])
+        self.data[h] = (value, result.configuration.data)
+
+    def generate_candidate(self):
+        for i in range(len(self.generators)):
+            generator = self.generators[self.next_generator]
+            self.next_generator = (self.next_generator + 1) % len(self.generators)
+            cfg = generator.desired_configuration()
+            if type(cfg) is Configuration:
+                cfg = cfg.data
+            if cfg:
+                return cfg
+        return self.manipulator.random()
+
+    def training_data(self):
+        data = list(self.data.values())
+        if len(data) > self.max_points:
+            # keep the most recent points and fill up with the best others
+            half = self.max_points // 2
+            recent = data[-(self.max_points - half):]
+            data = sorted(data[:-len(recent)], key=lambda d: d[0])[:half] + recent
+        x = self.encoder.encode_all([cfg for value, cfg in data])
+        y = numpy.array([value for value, cfg in data], dtype=numpy.float64)
+        if numpy.all(y > 0):
+            y = numpy.log(y)
+        return x, y
+
+    def screen(self):
+        """refill self.queue with the best predicted candidates"""
+        candidates = dict()
+        for i in range(self.candidate_count):
+            cfg = self.generate_candidate()
+            h = self.manipulator.hash_config(cfg)
+            if h not in self.seen and h not in candidates:
+                candidates[h] = cfg
+        if not candidates:
+            return
+        x, y = self.training_data()
+        try:
+            self.model.fit(x, y)
+        except numpy.linalg.LinAlgError:
+            log.warning('surrogate model fit failed, using random candidates')
+            self.queue = list(candidates.values())[:self.top_k]
+            return
+        hashes = list(candidates.keys())
+        mean, std = self.model.predict(
+            self.encoder.encode_all([candidates[h] for h in hashes]))
+        order = numpy.argsort(mean - self.kappa * std)
+        self.queue = [candidates[hashes[i]] for i in order[:self.top_k]]
+        log.debug('surrogate screened %d candidates, best predicted %f',
+                  len(hashes), mean[order[0]])
+
+    def desired_configuration(self):
+        if len(self.data) < self.min_results:
+            return self.generate_candidate()
+        while self.queue:
+            cfg = self.queue.pop(0)
+            h = self.manipulator.hash_config(cfg)
+            if h not in self.seen:
+                self.seen.add(h)
+                return cfg
+        self.screen()
+        if self.queue:
+            cfg = self.queue.pop(0)
+            self.seen.add(self.manipulator.hash_config(cfg))
+            return cfg
+        return self.generate_candidate()
+
+
+technique.register(SurrogateSearch())
+technique.register(SurrogateSearch(name='SurrogateSearchLCB2', kappa=2.0))
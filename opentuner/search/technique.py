@@ -46,6 +46,13 @@ class SearchTechniqueBase(with_metaclass(abc.ABCMeta, object)):
         """test if enough data has been gathered to use this technique"""
         return True
 
+    def add_seed_configurations(self, cfgs):
+        """
+        called before the search starts with good configurations from
+        earlier tuning runs (best first), to start the search from them
+        """
+        pass
+
     def default_name(self):
         """name of this SearchTechnique uses for display/accounting"""
         return self.__class__.__name__
@@ -0,0 +1,230 @@
+from __future__ import absolute_import
+from __future__ import division
+
+import glob
+import json
+import logging
+import os
+from builtins import object
+
+import numpy
+from sqlalchemy import or_
+from sqlalchemy.engine import make_url
+
+from opentuner import resultsdb
+from opentuner.resultsdb.models import Configuration
+from opentuner.resultsdb.models import Input
+from opentuner.resultsdb.models import Program
+from opentuner.resultsdb.models import ProgramVersion
+from opentuner.resultsdb.models import Result
+from opentuner.resultsdb.models import TuningRun
+
+log = logging.getLogger(__name__)
+
+
+def database_urls(sources):
+    """
+    database urls for a list of urls, sqlite files and directories of
+    sqlite files (as the per kernel tunerDB directories)
+    """
+    urls = list()
+    for source in sources:
+        if '://' in source:
+            urls.append(source)
+        elif os.path.isdir(source):
+            urls.extend('sqlite:///' + os.path.abspath(path)
+                        for path in sorted(glob.glob(os.path.join(source, '*.db')))
+                        if os.path.getsize(path) > 0)
+        elif os.path.isfile(source):
+            urls.append('sqlite:///' + os.path.abspath(source))
+        else:
+            log.warning('no such database for --transfer-from %s', source)
+    return urls
+
+
+def normalize_url(url):
+    """url with the path of a sqlite database made absolute, for comparing"""
+    if '://' not in url:
+        url = 'sqlite:///' + url
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite' and url.database:
+        url = url.set(database=os.path.abspath(url.database))
+    return url.render_as_string(hide_password=False)
+
+
+def load_features(filename):
+    """--transfer-features file: a json object of program name -> vector"""
+    with open(filename) as fd:
+        return dict((name, [float(x) for x in vector])
+                    for name, vector in json.load(fd).items())
+
+
+class TransferRanking(object):
+    """
+    ranks configurations for a program by how well they did on other
+    programs with the same parameters (e.g. other kernels sharing one
+    search space): each configuration scores its normalized rank on each
+    of the most similar programs, weighted by their similarity
+
+    similarity comes from program feature vectors when the program has
+    one, else from the rank correlation of the results both programs have
+    for the same configurations (so the program needs some results of its
+    own), else every program counts the same
+    """
+
+    def __init__(self, name, features=None, neighbors=5, min_overlap=3):
+        self.name = name
+        self.features = features or dict()
+        self.neighbors = neighbors
+        self.min_overlap = min_overlap
+        self.orders = dict()  # program name -> [config hash] best first
+        self.configs = dict()  # config hash -> (session, configuration id)
+
+    def add_results(self, program, hashes):
+        """add the config hashes of program's results, best first"""
+        order = self.orders.setdefault(program, list())
+        seen = set(order)
+        for h in hashes:
+            if h not in seen:
+                seen.add(h)
+                order.append(h)
+
+    def load(self, session, program_version, objective):
+        """
+        add the OK (full fidelity) results of all programs in session with
+        the project and parameters of program_version
+        """
+        versions = [id for id, in (
+            session.query(ProgramVersion.id)
+            .join(Program, ProgramVersion.program_id == Program.id)
+            .filter(Program.project == program_version.project,
+                    ProgramVersion.parameter_info ==
+                    program_version.parameter_info))]
+        if not versions:
+            return
+        q = (session.query(Program.name, Configuration.hash, Configuration.id)
+             .select_from(Result)
+             .join(Configuration, Result.configuration_id == Configuration.id)
+             .join(TuningRun, Result.tuning_run_id == TuningRun.id)
+             .join(ProgramVersion,
+                   TuningRun.program_version_id == ProgramVersion.id)
+             .join(Program, ProgramVersion.program_id == Program.id)
+             .outerjoin(Input, Result.input_id == Input.id)
+             .filter(TuningRun.program_version_id.in_(versions),
+                     Result.state == 'OK',
+                     Result.time < float('inf'),
+                     or_(TuningRun.input_class_id == None,
+                         Input.input_class_id == TuningRun.input_class_id)))
+        q = objective.result_order_by(objective.filter_acceptable(q))
+        by_program = dict()
+        for program, h, config_id in q:
+            by_program.setdefault(program, list()).append(h)
+            self.configs.setdefault(h, (session, config_id))
+        for program, hashes in by_program.items():
+            self.add_results(program, hashes)
+
+    def others(self):
+        return sorted(p for p in self.orders if p != self.name)
+
+    def feature_similarity(self):
+        """program -> 1 / (1 + distance) of standardized feature vectors"""
+        names = [p for p in self.others() if p in self.features]
+        if self.name not in self.features or not names:
+            return None
+        vectors = numpy.array([self.features[p] for p in [self.name] + names])
+        scale = vectors.std(axis=0)
+        scale[scale == 0] = 1.0
+        vectors = (vectors - vectors.mean(axis=0)) / scale
+        distance = numpy.sqrt(((vectors[1:] - vectors[0]) ** 2).sum(axis=1))
+        return dict(zip(names, (1.0 / (1.0 + distance)).tolist()))
+
+    def correlation_similarity(self):
+        """program -> positive rank correlation on shared configurations"""
+        own = self.orders.get(self.name)
+        if not own:
+            return None
+        own_rank = dict((h, i) for i, h in enumerate(own))
+        similarity = dict()
+        for p in self.others():
+            shared = [(own_rank[h], i) for i, h in enumerate(self.orders[p])
+                      if h in own_rank]
+            if len(shared) < self.min_overlap:
+                continue
+            # ranks within the shared configs for a spearman correlation
+            ranks = numpy.argsort(numpy.argsort(numpy.array(shared), axis=0),
+                                  axis=0)
+            corr = numpy.corrcoef(ranks[:, 0], ranks[:, 1])[0, 1]
+            if corr > 0:
+                similarity[p] = float(corr)
+        return similarity or None
+
+    def similarity(self):
+        """weights of the (up to self.neighbors) most similar programs"""
+        similarity = self.feature_similarity()
+        if similarity is None:
+            similarity = self.correlation_similarity()
+        if similarity is None:
+            return dict((p, 1.0) for p in self.others())
+        nearest = sorted(similarity, key=lambda p: -similarity[p])
+        return dict((p, similarity[p]) for p in nearest[:self.neighbors])
+
+    def rank(self, count=None):
+        """
+        config hashes not yet measured for this program, best scoring first;
+        score is the similarity weighted mean of 1 - rank / (n - 1) over the
+        neighbors (0 for neighbors that never measured the config)
+        """
+        weights = self.similarity()
+        total = sum(weights.values())
+        if not total:
+            return []
+        scores = dict()
+        for p, weight in weights.items():
+            order = self.orders[p]
+            n = max(len(order) - 1, 1)
+            for i, h in enumerate(order):
+                scores[h] = scores.get(h, 0.0) + weight * (1.0 - i / n) / total
+        measured = set(self.orders.get(self.name, ()))
+        ranked = sorted((h for h in scores if h not in measured),
+                        key=lambda h: (-scores[h], h))
+        log.info('transfer: %d candidate configurations from %s', len(ranked),
+                 ', '.join('%s (%.2f)' % (p, weights[p]) for p in sorted(weights)))
+        return ranked[:count]
+
+    def configuration_data(self, hashes):
+        """Configuration.data of hashes, loaded from their databases"""
+        data = list()
+        for h in hashes:
+            session, config_id = self.configs[h]
+            data.append(session.query(Configuration)
+                        .filter_by(id=config_id).one().data)
+        return data
+
+
+def transfer_configurations(args, session, program_version, objective):
+    """
+    data of the --transfer-seeds best ranked configurations from the
+    databases of --transfer-from for program_version
+    """
+    features = None
+    if args.transfer_features:
+        features = load_features(args.transfer_features)
+    ranking = TransferRanking(program_version.name, features,
+                              args.transfer_neighbors)
+    sessions = list()
+    database = normalize_url(args.database)
+    for url in database_urls(args.transfer_from):
+        if normalize_url(url) == database:
+            ranking.load(session, program_version, objective)
+            continue
+        try:
+            # other tuning runs may be writing these, never write to them
+            engine, Session = resultsdb.connect(url, readonly=True)
+            sessions.append(Session())
+            ranking.load(sessions[-1], program_version, objective)
+        except Exception as e:
+            log.warning('skipping --transfer-from database %s: %s', url, e)
+    data = ranking.configuration_data(ranking.rank(args.transfer_seeds))
+    for s in sessions:
+        s.close()
+    return data
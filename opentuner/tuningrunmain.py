@@ -9,9 +9,22 @@ import time
 import uuid
 from datetime import datetime
 
+from sqlalchemy import or_
+
 from opentuner import resultsdb
+from opentuner.driverbase import ResultIndex
+from opentuner.measurement.cache import RESULT_FIELDS
 from opentuner.measurement.driver import MeasurementDriver
+from opentuner.resultsdb.models import CompressedPickler
+from opentuner.resultsdb.models import Configuration
+from opentuner.resultsdb.models import DesiredResult
+from opentuner.resultsdb.models import Input
+from opentuner.resultsdb.models import Program
+from opentuner.resultsdb.models import ProgramVersion
+from opentuner.resultsdb.models import Result
+from opentuner.resultsdb.models import TuningRun
 from opentuner.search.driver import SearchDriver
+from opentuner.search.transfer import transfer_configurations
 
 log = logging.getLogger(__name__)
 
@@ -20,6 +33,35 @@ argparser.add_argument('--label', help="name for the TuningRun")
 argparser.add_argument('--print-search-space-size', action='store_true',
                        help="Print out the estimated size of the search space and exit")
 argparser.add_argument('--database', help="database to store tuning results in")
+argparser.add_argument('--compression-level', type=int, default=1,
+                       choices=list(range(10)),
+                       help="zlib level of pickled data stored in the database")
+argparser.add_argument('--configuration-cache', type=int, default=10000,
+                       help="decoded configurations to keep in memory")
+argparser.add_argument('--resume-from', metavar='DATABASE',
+                       help="start from the results of earlier tuning runs of "
+                            "this program (with the same parameters) in "
+                            "DATABASE, configs measured there by the same "
+                            "program version are not measured again")
+argparser.add_argument('--resume-seeds', type=int, default=10,
+                       help="seed the search techniques with this many of "
+                            "the best --resume-from configurations (and "
+                            "measure those of other program versions again)")
+argparser.add_argument('--transfer-from', action='append', default=[],
+                       metavar='DATABASE',
+                       help="rank configurations by how well they did for "
+                            "other programs with the same parameters in "
+                            "DATABASE (a url, sqlite file or directory of "
+                            "them) and try the best first; can be specified "
+                            "multiple times")
+argparser.add_argument('--transfer-seeds', type=int, default=10,
+                       help="how many --transfer-from configurations to try")
+argparser.add_argument('--transfer-neighbors', type=int, default=5,
+                       help="rank by this many of the most similar programs")
+argparser.add_argument('--transfer-features', metavar='FILENAME',
+                       help="json file of program name -> feature vector, "
+                            "similar programs are the nearest ones instead "
+                            "of the ones whose results correlate best")
 argparser.add_argument('--print-params', '-pp', action='store_true',
                        help='show parameters of the configuration being tuned')
 
@@ -97,6 +139,8 @@ class TuningRunMain:
         self.args = args
         self.engine, self.Session = resultsdb.connect(args.database)
         self.session = self.Session()
+        CompressedPickler.level = args.compression_level
+        Configuration.data_cache(self.session, args.configuration_cache)
         self.tuning_run = None
         self.search_driver_cls = search_driver
         self.measurement_driver_cls = measurement_driver
@@ -132,7 +176,8 @@ class TuningRunMain:
                 'tuning_run_main': self,
                 'tuning_run': self.tuning_run,
                 'extra_seeds': self.measurement_interface.seed_configurations(),
-                'extra_criteria': self.measurement_interface.extra_convergence_criteria
+                'extra_criteria': self.measurement_interface.extra_convergence_criteria,
+                'result_index': ResultIndex(),
             }
 
             self.search_driver = self.search_driver_cls(**driver_kwargs)
@@ -141,6 +186,76 @@ class TuningRunMain:
             self.input_manager.set_driver(self.measurement_driver)
             self.tuning_run.machine_class = self.measurement_driver.get_machine_class()
             self.tuning_run.input_class = self.input_manager.get_input_class()
+            if self.args.resume_from:
+                self.search_driver.add_previous_results(self.previous_results(),
+                                                        self.args.resume_seeds)
+            if self.args.transfer_from:
+                self.search_driver.add_seed_configurations(
+                    transfer_configurations(self.args, self.session,
+                                            self.tuning_run.program_version,
+                                            self.objective))
+
+    def previous_results(self):
+        """
+        best OK (full fidelity) result of each configuration measured by
+        earlier tuning runs of this program in --resume-from, as a list of
+        (configuration data, dict of Result fields, current) ordered best
+        first; runs of any program version with the same parameters are
+        used, current is False for results of other program versions
+        """
+        database = self.args.resume_from
+        if '://' not in database:
+            database = 'sqlite:///' + database
+        if database == self.args.database:
+            session = self.session
+        else:
+            try:
+                engine, Session = resultsdb.connect(database, readonly=True)
+            except Exception:
+                log.error('failed to load --resume-from database %s, '
+                          'starting from scratch', self.args.resume_from,
+                          exc_info=True)
+                return []
+            session = Session()
+        program_version = self.tuning_run.program_version
+        versions = [id for id, in (
+            session.query(ProgramVersion.id)
+            .join(Program, ProgramVersion.program_id == Program.id)
+            .filter(Program.project == program_version.project,
+                    Program.name == program_version.name,
+                    ProgramVersion.parameter_info ==
+                    program_version.parameter_info))]
+        q = (session.query(Result, ProgramVersion.version)
+             .join(TuningRun, Result.tuning_run_id == TuningRun.id)
+             .join(ProgramVersion,
+                   TuningRun.program_version_id == ProgramVersion.id)
+             .outerjoin(Input, Result.input_id == Input.id)
+             .filter(TuningRun.program_version_id.in_(versions),
+                     Result.state == 'OK',
+                     Result.time < float('inf'),
+                     or_(TuningRun.input_class_id == None,
+                         Input.input_class_id == TuningRun.input_class_id)))
+        results = self.objective.filter_acceptable(q)
+        results = self.objective.result_order_by(results).all()
+        Configuration.prefetch(session, [r.configuration_id for r, v in results])
+        previous = list()
+        index = dict()  # configuration id -> position in previous
+        for result, version in results:
+            current = version == program_version.version
+            fields = dict((field, getattr(result, field))
+                          for field in RESULT_FIELDS)
+            i = index.get(result.configuration_id)
+            if i is None:
+                index[result.configuration_id] = len(previous)
+                previous.append((result.configuration.data, fields, current))
+            elif current and not previous[i][2]:
+                # prefer a result of this version to a better stale one
+                previous[i] = (previous[i][0], fields, current)
+        log.info('resuming from %d configurations in %s', len(previous),
+                 self.args.resume_from)
+        if session is not self.session:
+            session.close()
+        return previous
 
     def commit(self, force=False):
         if force or not self.fake_commit or time.time() - self.last_commit_time > 30:
@@ -154,6 +269,9 @@ class TuningRunMain:
         try:
             self.tuning_run.state = 'RUNNING'
             self.commit(force=True)
+            if self.args.external_workers:
+                log.info('measuring with opentuner-worker --tuning-run %s',
+                         self.tuning_run.uuid)
             self.search_driver.main()
             if self.search_driver.best_result:
                 self.measurement_interface.save_final_config(self.search_driver.best_result.configuration)
@@ -166,12 +284,41 @@ class TuningRunMain:
             self.tuning_run.end_date = datetime.now()
             self.commit(force=True)
             self.session.close()
+            self.measurement_driver.close()
 
     def results_wait(self, generation):
+        if self.args.external_workers:
+            return self.wait_for_workers()
         self.measurement_interface.pre_process()
         self.measurement_driver.process_all()
         self.measurement_interface.post_process()
 
+    def results_wait_any(self):
+        if self.args.external_workers:
+            return self.wait_for_workers(any_result=True)
+        self.measurement_interface.pre_process()
+        self.measurement_driver.process_async()
+        self.measurement_interface.post_process()
+
+    def wait_for_workers(self, any_result=False):
+        """
+        poll the database until external workers have measured all of the
+        requested tests, or with any_result until one in flight test is done
+        """
+        while True:
+            self.measurement_driver.requeue_expired()
+            self.commit(force=True)
+            outstanding = (self.measurement_driver.requests_query()
+                           .filter(DesiredResult.state.in_(('REQUESTED',
+                                                            'RUNNING')))
+                           .count())
+            if outstanding == 0:
+                return
+            if (any_result and
+                    outstanding < len(self.search_driver.in_flight)):
+                return
+            time.sleep(self.args.worker_poll_interval)
+
 
 def main(interface, args, *pargs, **kwargs):
     if inspect.isclass(interface):
@@ -8,6 +8,7 @@ from builtins import map
 from builtins import range
 from builtins import str
 from builtins import zip
+from functools import cmp_to_key
 from functools import reduce
 from itertools import chain
 
@@ -18,21 +19,25 @@ if __name__ == '__main__':
 
 import argparse
 import csv
-import hashlib
-import itertools
 import logging
 import math
 import os
-import sqlalchemy.orm.exc
 import subprocess
 import sys
 
 from collections import defaultdict
 from pprint import pprint
 
+import numpy
+
 import opentuner
 from opentuner import resultsdb
-from opentuner.resultsdb.models import *
+from opentuner.utils.statsexport import PCTSTEPS
+from opentuner.utils.statsexport import ResultsExport
+from opentuner.utils.statsexport import hash_args
+from opentuner.utils.statsexport import over_time_stats
+from opentuner.utils.statsexport import run_label
+from opentuner.utils.statsexport import technique_scores
 
 log = logging.getLogger('opentuner.utils.stats')
 
@@ -49,8 +54,14 @@ argparser.add_argument('--stats-dir', default='stats',
 argparser.add_argument('--stats-input', default="opentuner.db")
 argparser.add_argument('--min-runs', type=int, default=1,
                        help="ignore series with less then N runs")
+argparser.add_argument('--stats-export',
+                       help="results export (.npz) to compute stats from, "
+                            "recreated from --stats-input when missing or "
+                            "older than its databases "
+                            "(default STATS_DIR/results.npz)")
+argparser.add_argument('--refresh-export', action='store_true',
+                       help="recreate --stats-export")
 
-PCTSTEPS = list(map(lambda n: old_div(n, 20.0), list(range(21))))
 
 
 def mean(vals):
@@ -97,84 +108,64 @@ def stddev(vals):
     return math.sqrt(var)
 
 
-def hash_args(x):
-    d = dict(vars(x))
-    for k in ('database', 'results_log', 'results_log_details'):
-        d[k] = None
-    return hashlib.sha256(str(sorted(d.items()))).hexdigest()[:20]
-
+def run_dir(base, project, program, version):
+    return os.path.join(base,
+                        project,
+                        program.split('/')[-1],
+                        version[:16])
 
-def run_label(tr, short=False):
-    techniques = ','.join(tr.args.technique)
-    if not tr.name or tr.name == 'unnamed':
-        if short:
-            return techniques
-        else:
-            return "%s_%s" % (techniques, hash_args(tr.args)[:6])
-    else:
-        return tr.name
 
-
-def run_dir(base, tr):
-    return os.path.join(base,
-                        tr.program.project,
-                        tr.program.name.split('/')[-1],
-                        tr.program_version.version[:16])
+def connect_session(filename):
+    e, sm = resultsdb.connect('sqlite:///' + filename)
+    return sm()
 
 
 class StatsMain(object):
     def __init__(self, args):
         self.args = args
         path = args.stats_input
-        self.dbs = list()
-        for f in os.listdir(path):
-            if 'journal' in f:
-                continue
-            try:
-                e, sm = resultsdb.connect('sqlite:///' + os.path.join(path, f))
-                self.dbs.append(sm())
-            except:
-                log.error('failed to load database: %s',
-                          os.path.join(path, f),
-                          exc_info=True)
+        database_files = [os.path.join(path, f) for f in sorted(os.listdir(path))
+                          if 'journal' not in f and not f.endswith('.npz')]
+        export_path = (args.stats_export or
+                       os.path.join(args.stats_dir, 'results.npz'))
+        if not os.path.isdir(os.path.dirname(export_path) or '.'):
+            os.makedirs(os.path.dirname(export_path))
+        self.export = ResultsExport.cached(export_path, database_files,
+                                           connect_session,
+                                           refresh=args.refresh_export)
+        self.curves = defaultdict(dict)  # dir -> label -> (secs, columns)
 
     def main(self):
+        export = self.export
+        labels = None
+        if self.args.label:
+            labels = set(map(str.strip, self.args.label.split(',')))
         dir_label_runs = defaultdict(lambda: defaultdict(list))
-        for session in self.dbs:
-            q = (session.query(resultsdb.models.TuningRun)
-                 .filter_by(state='COMPLETE')
-                 .order_by('name'))
-
-            if self.args.label:
-                q = q.filter(TuningRun.name.in_(
-                    list(map(str.strip, self.args.label.split(',')))))
-
-            for tr in q:
-                d = run_dir(self.args.stats_dir, tr)
-                d = os.path.normpath(d)
-                dir_label_runs[d][run_label(tr)].append((tr, session))
+        for run in range(export.run_count()):
+            if labels and export['run_name'][run] not in labels:
+                continue
+            d = run_dir(self.args.stats_dir,
+                        export['run_project'][run],
+                        export['run_program'][run],
+                        export['run_version'][run])
+            d = os.path.normpath(d)
+            dir_label_runs[d][str(export['run_label'][run])].append(run)
 
         summary_report = defaultdict(lambda: defaultdict(list))
         for d, label_runs in list(dir_label_runs.items()):
             if not os.path.isdir(d):
                 os.makedirs(d)
-            session = list(label_runs.values())[0][0][1]
-            objective = list(label_runs.values())[0][0][0].objective
-            all_run_ids = list(map(lambda x: x[0].id, chain(*list(label_runs.values()))))
-            q = (session.query(Result)
-                 .filter(Result.tuning_run_id.in_(all_run_ids))
-                 .filter(Result.time < float('inf'))
-                 .filter_by(was_new_best=True, state='OK'))
-            total = q.count()
-            if total == 0:
+            all_runs = list(chain(*list(label_runs.values())))
+            objective = export.objective(all_runs[0])
+            results = [export.result(row) for row in export.best_rows(all_runs)]
+            total = len(results)
+            results = [r for r in results if objective.is_acceptable(r)]
+            acceptable = len(results)
+            if acceptable == 0:
                 continue
-            q = objective.filter_acceptable(q)
-            acceptable = q.count()
-            q = q.order_by(*objective.result_order_by_terms())
-            best = q.limit(1).one()
-            worst = q.offset(acceptable - 1).limit(1).one()
-
-            list(map(len, list(label_runs.values())))
+            results.sort(key=cmp_to_key(objective.result_compare))
+            best = results[0]
+            worst = results[-1]
 
             log.info("%s -- best %.4f / worst %.f4 "
                      "-- %d of %d acceptable -- %d techniques with %d to %d runs",
@@ -191,36 +182,35 @@ class StatsMain(object):
                 if len(runs) < self.args.min_runs:
                     print(len(runs), self.args.min_runs)
                     continue
-                log.debug('%s/%s has %d runs %s', d, label, len(runs), runs[0][0].args.technique)
+                log.debug('%s/%s has %d runs', d, label, len(runs))
                 self.combined_stats_over_time(d, label, runs, objective, worst, best)
 
                 final_scores = list()
-                for run, session in runs:
-                    try:
-                        final = (session.query(Result)
-                                 .filter_by(tuning_run=run,
-                                            configuration=run.final_config)
-                                 .limit(1)
-                                 .one())
-                    except sqlalchemy.orm.exc.NoResultFound:
+                for run in runs:
+                    row = export.final_row(run)
+                    if row is None:
                         continue
-                    final_scores.append(objective.stats_quality_score(final, worst, best))
+                    final_scores.append(objective.stats_quality_score(
+                        export.result(row), worst, best))
                 final_scores.sort()
+                short_label = str(export['run_short_label'][runs[-1]])
                 if final_scores:
                     norm = objective.stats_quality_score(best, worst, best)
                     if norm > 0.00001:
-                        summary_report[d][run_label(run, short=True)] = (
+                        summary_report[d][short_label] = (
                             old_div(percentile(final_scores, 0.5), norm),
                             old_div(percentile(final_scores, 0.1), norm),
                             old_div(percentile(final_scores, 0.9), norm),
                         )
                     else:
-                        summary_report[d][run_label(run, short=True)] = (
+                        summary_report[d][short_label] = (
                             percentile(final_scores, 0.5) + norm + 1.0,
                             percentile(final_scores, 0.1) + norm + 1.0,
                             percentile(final_scores, 0.9) + norm + 1.0,
                         )
 
+        if not os.path.isdir(self.args.stats_dir):
+            os.makedirs(self.args.stats_dir)
         with open(self.args.stats_dir + "/summary.dat", 'w') as o:
             # make summary report
             keys = sorted(reduce(set.union,
@@ -252,7 +242,7 @@ class StatsMain(object):
 
         for d, label_runs in list(dir_label_runs.items()):
             labels = [k for k, v in list(label_runs.items())
-                      if len(v) >= self.args.min_runs]
+                      if len(v) >= self.args.min_runs and k in self.curves[d]]
             self.gnuplot_file(d,
                               "medianperfe",
                               ['"%s_percentiles.dat" using 1:12:4:18 with errorbars title "%s"' % (l, l) for l in
@@ -268,52 +258,20 @@ class StatsMain(object):
                               "meanperfl",
                               ['"%s_percentiles.dat" using 1:21 with lines title "%s"' % (l, l) for l in labels])
 
-            # print
-            # print "10% Scores", d
-            # pprint(self.technique_scores(d, labels, '0.1'))
-            # print
-            # print "90% Scores", d
-            # pprint(self.technique_scores(d, labels, '0.9'))
-            # print
-            # print "Mean Scores", d
-            # pprint(self.technique_scores(d, labels, 'mean'))
             print()
             print("Median Scores", d)
             pprint(self.technique_scores(d, labels, '0.5'))
 
-    def technique_scores(self, directory, labels, ykey, xkey='#sec', factor=10.0):
-        max_duration = None
-        min_value = float('inf')
-        for label in labels:
-            try:
-                dr = csv.DictReader(open(os.path.join(directory, label + "_percentiles.dat")), delimiter=' ',
-                                    lineterminator='\n')
-                lastrow = list(dr)[-1]
-                max_duration = max(max_duration, float(lastrow[xkey]))
-                min_value = min(min_value, float(lastrow[ykey]))
-            except:
-                log.exception("failed computing score")
-
-        scores = list()
-
+    def technique_scores(self, directory, labels, ykey, factor=10.0):
+        """
+        score the ykey column ('mean' or a PCTSTEPS percentile) of the
+        labels in directory by their area over the best final value
+        """
+        curves = dict()
         for label in labels:
-            try:
-                dr = csv.DictReader(open(os.path.join(directory, label + "_percentiles.dat")), delimiter=' ',
-                                    lineterminator='\n')
-                score = 0.0
-                lastsec = 0.0
-                value = float('inf')
-                for row in dr:
-                    duration = float(row[xkey]) - lastsec
-                    lastsec = float(row[xkey])
-                    value = float(row[ykey])
-                    score += duration * (value - min_value)
-                score += (factor * max_duration - lastsec) * (value - min_value)
-                scores.append((score, label))
-            except:
-                log.exception("failed computing score")
-
-        return sorted(scores)
+            secs, columns = self.curves[directory][label]
+            curves[label] = (secs, columns[ykey])
+        return technique_scores(curves, factor)
 
     def combined_stats_over_time(self,
                                  output_dir,
@@ -324,55 +282,35 @@ class StatsMain(object):
                                  best,
                                  ):
         """
-        combine stats_over_time() vectors for multiple runs
+        combine the best time over time of multiple runs
         """
-
-        # extract_fn = lambda dr: objective.stats_quality_score(dr.result, worst, best)
-        extract_fn = lambda x: x.result.time
-        combine_fn = min
-        no_data = 999
-
         log.debug("writing stats for %s to %s", label, output_dir)
-        by_run = [self.stats_over_time(session, run, extract_fn, combine_fn, no_data)
-                  for run, session in runs]
-        max_len = max(list(map(len, by_run)))
-
-        by_run_streams = [chain(x, repeat(x[-1], max_len - len(x)))
-                          for x in by_run]
-        by_quanta = list(zip(*by_run_streams[:]))
-
-        def data_file(suffix, headers, value_function):
+        matrix = self.export.combined_over_time(runs,
+                                                self.args.stats_quanta,
+                                                self.args.by_request_count,
+                                                no_data=999)
+        stats = over_time_stats(matrix)
+        secs = numpy.arange(len(matrix)) * float(self.args.stats_quanta)
+        columns = dict(zip(map(str, PCTSTEPS), stats['percentiles'].T))
+        columns['mean'] = stats['mean']
+        self.curves[output_dir][label] = (secs, columns)
+
+        def data_file(suffix, headers, values):
             with open(os.path.join(output_dir, label + suffix), 'w') as fd:
                 out = csv.writer(fd, delimiter=' ', lineterminator='\n')
                 out.writerow(['#sec'] + headers)
-                for quanta, values in enumerate(by_quanta):
-                    sec = quanta * self.args.stats_quanta
-                    out.writerow([sec] + value_function(values))
-
-        # data_file('_details.dat',
-        #          map(lambda x: 'run%d'%x, xrange(max_len)),
-        #          list)
-        # self.gnuplot_file(output_dir,
-        #                  label+'_details',
-        #                  [('"'+label+'_details.dat"'
-        #                    ' using 1:%d'%i +
-        #                    ' with lines'
-        #                    ' title "Run %d"'%i)
-        #                   for i in xrange(max_len)])
+                for row in numpy.column_stack([secs] + values).tolist():
+                    out.writerow(row)
 
         data_file('_mean.dat',
                   ['#sec', 'mean', 'stddev'],
-                  lambda values: [mean(values), stddev(values)])
+                  [stats['mean'], stats['stddev']])
         self.gnuplot_file(output_dir,
                           label + '_mean',
                           ['"' + label + '_mean.dat" using 1:2 with lines title "Mean"'])
 
-        def extract_percentiles(values):
-            values = sorted(values)
-            return ([values[int(round(p * (len(values) - 1)))] for p in PCTSTEPS]
-                    + [mean(values)])
-
-        data_file("_percentiles.dat", PCTSTEPS + ['mean'], extract_percentiles)
+        data_file("_percentiles.dat", PCTSTEPS + ['mean'],
+                  [stats['percentiles'], stats['mean']])
         self.gnuplot_file(output_dir,
                           label + '_percentiles',
                           reversed([
@@ -430,50 +368,10 @@ set ytics 1
 
 ''', file=fd)
             print('plot', ',\\\n'.join(plotcmd), file=fd)
-        subprocess.call(['gnuplot', prefix + '.gnuplot'], cwd=output_dir, stdin=None)
-
-    def stats_over_time(self,
-                        session,
-                        run,
-                        extract_fn,
-                        combine_fn,
-                        no_data=None):
-        """
-        return reduce(combine_fn, map(extract_fn, data)) for each quanta of the
-        tuning run
-        """
-        value_by_quanta = [no_data]
-        start_date = run.start_date
-
-        subq = (session.query(Result.id)
-                .filter_by(tuning_run=run, was_new_best=True, state='OK'))
-
-        q = (session.query(DesiredResult)
-             .join(Result)
-             .filter(DesiredResult.state == 'COMPLETE',
-                     DesiredResult.tuning_run == run,
-                     DesiredResult.result_id.in_(subq.subquery()))
-             .order_by(DesiredResult.request_date))
-
-        first_id = None
-        for dr in q:
-            if first_id is None:
-                first_id = dr.id
-            td = (dr.request_date - start_date)
-            duration = td.seconds + (td.days * 24 * 3600.0)
-            if self.args.by_request_count:
-                quanta = dr.id - first_id
-            else:
-                quanta = int(old_div(duration, self.args.stats_quanta))
-            while len(value_by_quanta) <= quanta:
-                value_by_quanta.append(value_by_quanta[-1])
-
-            if value_by_quanta[-1] is no_data:
-                value_by_quanta[-1] = extract_fn(dr)
-            else:
-                value_by_quanta[-1] = combine_fn(value_by_quanta[-1], extract_fn(dr))
-
-        return value_by_quanta
+        try:
+            subprocess.call(['gnuplot', prefix + '.gnuplot'], cwd=output_dir, stdin=None)
+        except OSError:
+            log.error("command gnuplot not found")
 
 
 if __name__ == '__main__':
@@ -14,19 +14,17 @@ from past.utils import old_div
 if __name__ == '__main__':
     pass
 
-import itertools
 import math
 import matplotlib.pyplot as plt
 import numpy
 import os
-import sqlalchemy
-import sqlalchemy.orm.exc
 
 from collections import defaultdict
-from itertools import chain, repeat
+from functools import cmp_to_key
 from opentuner import resultsdb
-
-PCTSTEPS = list(map(lambda n: old_div(n, 20.0), list(range(21))))
+from opentuner.utils.statsexport import PCTSTEPS
+from opentuner.utils.statsexport import ResultsExport
+from opentuner.utils.statsexport import over_time_stats
 
 
 def mean(vals):
@@ -131,116 +129,55 @@ def matplotlibplot_file(labels, xlim=None, ylim=None, disp_types=['median']):
     return figure
 
 
-def run_label(tr):
-    techniques = ','.join(tr.args.technique)
-    if not tr.name or tr.name == 'unnamed':
-        return techniques
-    return tr.name
+def get_export(path=None, db_type='sqlite:///'):
+    """
+    Arguments,
+      path: Path of directory containing .db files (default: current directory)
+    Returns,
+      A ResultsExport of the dbs, cached in path/results.npz
+    """
+    if path is None:
+        path = os.getcwd()
+    files = [os.path.join(path, f) for f in sorted(os.listdir(path))
+             if 'journal' not in f and not f.endswith('.npz')]
+
+    def connect(db_path):
+        e, sm = resultsdb.connect(db_type + db_path)
+        return sm()
 
+    return ResultsExport.cached(os.path.join(path, 'results.npz'), files, connect)
 
-def combined_stats_over_time(label,
+
+def combined_stats_over_time(export,
+                             label,
                              runs,
                              objective,
                              worst,
                              best,
                              ):
     """
-    combine stats_over_time() vectors for multiple runs
+    combine the best time over time of multiple runs (indexes into export)
     """
-
-    extract_fn = lambda x: x.result.time
-    combine_fn = min
-    no_data = 999
-
-    by_run = [stats_over_time(session, run, extract_fn, combine_fn, no_data)
-              for run, session in runs]
-    max_len = max(list(map(len, by_run)))
-
-    by_run_streams = [chain(x, repeat(x[-1], max_len - len(x)))
-                      for x in by_run]
-    by_quanta = list(zip(*by_run_streams[:]))
-
     # TODO: Fix this, this variable should be configurable
     stats_quanta = 10
-
-    def get_data(value_function):
-        final_values = []
-        for quanta, values in enumerate(by_quanta):
-            sec = quanta * stats_quanta
-            final_values.append([sec] + value_function(values))
-        return final_values
-
-    mean_values = get_data(lambda values: [mean(values), stddev(values)])
-
-    def extract_percentiles(values):
-        values = sorted(values)
-        return ([values[int(round(p * (len(values) - 1)))] for p in PCTSTEPS]
-                + [mean(values)])
-
-    percentile_values = get_data(extract_percentiles)
+    matrix = export.combined_over_time(runs, stats_quanta, by_request_count=True,
+                                       no_data=999)
+    stats = over_time_stats(matrix)
+    secs = numpy.arange(len(matrix)) * stats_quanta
+
+    mean_values = numpy.column_stack(
+        [secs, stats['mean'], stats['stddev']]).tolist()
+    percentile_values = numpy.column_stack(
+        [secs, stats['percentiles'], stats['mean']]).tolist()
     return mean_values, percentile_values
 
 
-def stats_over_time(session,
-                    run,
-                    extract_fn,
-                    combine_fn,
-                    no_data=None):
-    """
-    return reduce(combine_fn, map(extract_fn, data)) for each quanta of the
-    tuning run
-    """
-    value_by_quanta = [no_data]
-    start_date = run.start_date
-
-    subq = (session.query(resultsdb.models.Result.id)
-            .filter_by(tuning_run=run, was_new_best=True, state='OK'))
-
-    q = (session.query(resultsdb.models.DesiredResult)
-         .join(resultsdb.models.Result)
-         .filter(resultsdb.models.DesiredResult.state == 'COMPLETE',
-                 resultsdb.models.DesiredResult.tuning_run == run,
-                 resultsdb.models.DesiredResult.result_id.in_(subq.subquery()))
-         .order_by(resultsdb.models.DesiredResult.request_date))
-
-    first_id = None
-    for dr in q:
-        if first_id is None:
-            first_id = dr.id
-        td = (dr.request_date - start_date)
-        duration = td.seconds + (td.days * 24 * 3600.0)
-        # TODO: Make this variable configurable
-        by_request_count = True
-        stats_quanta = 10
-        if by_request_count:
-            quanta = dr.id - first_id
-        else:
-            quanta = int(old_div(duration, stats_quanta))
-        while len(value_by_quanta) <= quanta:
-            value_by_quanta.append(value_by_quanta[-1])
-
-        if value_by_quanta[-1] is no_data:
-            value_by_quanta[-1] = extract_fn(dr)
-        else:
-            value_by_quanta[-1] = combine_fn(value_by_quanta[-1], extract_fn(dr))
-
-    return value_by_quanta
-
-
 def get_all_labels():
     """
     Returns,
       List of labels that are in the complete state
     """
-    dbs = get_dbs(os.getcwd())
-    all_labels = list()
-    for db in dbs:
-        all_labels.extend(db.query(resultsdb.models.TuningRun.name)
-                          .filter_by(state='COMPLETE')
-                          .distinct()
-                          .all())
-    all_labels = [str(element[0]) for element in all_labels]
-    return all_labels
+    return sorted(set(str(name) for name in get_export()['run_name']))
 
 
 def get_values(labels):
@@ -251,48 +188,25 @@ def get_values(labels):
       A list of (mean, percentile) tuples, corresponding to the
       provided list of labels
     """
-    dbs = get_dbs(os.getcwd())
-    dir_label_runs = defaultdict(lambda: defaultdict(list))
-    for db in dbs:
-        q = (db.query(resultsdb.models.TuningRun)
-             .filter_by(state='COMPLETE')
-             .order_by('name'))
-        if labels:
-            q = q.filter(resultsdb.models.TuningRun.name.in_(labels))
-        for tr in q:
-            dir_label_runs[run_label(tr)][run_label(tr)].append((tr, db))
-    all_run_ids = list()
+    export = get_export()
+    label_runs = defaultdict(list)
+    for run in range(export.run_count()):
+        if labels and export['run_name'][run] not in labels:
+            continue
+        label_runs[str(export['run_short_label'][run])].append(run)
     returned_values = {}
-    for d, label_runs in list(dir_label_runs.items()):
-        all_run_ids = list(map(lambda x: x[0].id, chain(*list(label_runs.values()))))
-        session = list(label_runs.values())[0][0][1]
-        objective = list(label_runs.values())[0][0][0].objective
-
-        q = (session.query(resultsdb.models.Result)
-             .filter(resultsdb.models.Result.tuning_run_id.in_(all_run_ids))
-             .filter(resultsdb.models.Result.time < float('inf'))
-             .filter_by(was_new_best=True, state='OK'))
-        total = q.count()
-        q = objective.filter_acceptable(q)
-        acceptable = q.count()
-        q = q.order_by(*objective.result_order_by_terms())
-        best = q.limit(1).one()
-        worst = q.offset(acceptable - 1).limit(1).one()
-
-        for label, runs in sorted(label_runs.items()):
-            (mean_values, percentile_values) = combined_stats_over_time(label, runs, objective, worst, best)
-            returned_values[label] = (mean_values, percentile_values)
-            final_scores = list()
-            for run, session in runs:
-                try:
-                    final = (session.query(resultsdb.models.Result)
-                             .filter_by(tuning_run=run,
-                                        configuration=run.final_config)
-                             .limit(1).one())
-                except sqlalchemy.orm.exc.NoResultFound:
-                    continue
-                final_scores.append(objective.stats_quality_score(final, worst, best))
-            final_scores.sort()
+    for label, runs in sorted(label_runs.items()):
+        objective = export.objective(runs[0])
+        results = [export.result(row) for row in export.best_rows(runs)]
+        results = [r for r in results if objective.is_acceptable(r)]
+        if not results:
+            continue
+        results.sort(key=cmp_to_key(objective.result_compare))
+        best = results[0]
+        worst = results[-1]
+        (mean_values, percentile_values) = combined_stats_over_time(
+            export, label, runs, objective, worst, best)
+        returned_values[label] = (mean_values, percentile_values)
     return returned_values
 
 
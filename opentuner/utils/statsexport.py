@@ -0,0 +1,295 @@
+from __future__ import absolute_import
+from __future__ import division
+
+import hashlib
+import logging
+import os
+import pickle
+from builtins import object
+from builtins import range
+from builtins import str
+
+import numpy
+from sqlalchemy import and_
+from sqlalchemy.orm import joinedload
+
+from opentuner.resultsdb.models import *
+
+log = logging.getLogger(__name__)
+
+PCTSTEPS = [n / 20.0 for n in range(21)]
+
+RUN_COLUMNS = ('run_name', 'run_label', 'run_short_label', 'run_project',
+               'run_program', 'run_version', 'run_final_config',
+               'run_objective')
+RESULT_COLUMNS = ('result_run', 'result_id', 'result_config', 'result_state',
+                  'result_time', 'result_accuracy', 'result_energy',
+                  'result_size', 'result_new_best', 'result_dr',
+                  'result_request')
+
+
+def hash_args(x):
+    d = dict(vars(x))
+    for k in ('database', 'results_log', 'results_log_details'):
+        d[k] = None
+    return hashlib.sha256(str(sorted(d.items())).encode()).hexdigest()[:20]
+
+
+def run_label(tr, short=False):
+    techniques = ','.join(tr.args.technique)
+    if not tr.name or tr.name == 'unnamed':
+        if short:
+            return techniques
+        else:
+            return "%s_%s" % (techniques, hash_args(tr.args)[:6])
+    else:
+        return tr.name
+
+
+def _floats(values):
+    return numpy.array([numpy.nan if v is None else v for v in values],
+                       dtype=float)
+
+
+class ResultsExport(object):
+    """
+    columnar copy of the complete tuning runs of results databases, stored
+    as a numpy .npz file
+
+    run_* arrays have one entry per TuningRun, result_* arrays one per
+    Result and completed DesiredResult pair (result_dr is -1 and
+    result_request NaN for results without one); result_run indexes the
+    run_* arrays and result_request is seconds after the run started
+    """
+
+    def __init__(self, arrays):
+        self.arrays = dict(arrays)
+        runs = self.arrays['result_run']
+        self.order = numpy.argsort(runs, kind='stable')
+        self.bounds = numpy.searchsorted(runs[self.order],
+                                         numpy.arange(self.run_count() + 1))
+        self.objectives = dict()
+
+    def __getitem__(self, column):
+        return self.arrays[column]
+
+    @classmethod
+    def from_sessions(cls, sessions, labels=None):
+        """export the complete tuning runs (named in labels) of sessions"""
+        columns = dict((name, []) for name in RUN_COLUMNS + RESULT_COLUMNS)
+        for session in sessions:
+            cls.export_session(session, columns, labels)
+        arrays = dict()
+        for name in ('run_name', 'run_label', 'run_short_label', 'run_project',
+                     'run_program', 'run_version', 'result_state'):
+            arrays[name] = numpy.array(columns[name], dtype=str)
+        for name in ('run_final_config', 'result_run', 'result_id',
+                     'result_config', 'result_dr'):
+            arrays[name] = numpy.array(columns[name], dtype=numpy.int64)
+        for name in ('result_time', 'result_accuracy', 'result_energy',
+                     'result_size', 'result_request'):
+            arrays[name] = _floats(columns[name])
+        arrays['result_new_best'] = numpy.array(columns['result_new_best'],
+                                                dtype=bool)
+        arrays['run_objective'] = numpy.empty(len(columns['run_objective']),
+                                              dtype=object)
+        arrays['run_objective'][:] = columns['run_objective']
+        return cls(arrays)
+
+    @staticmethod
+    def export_session(session, columns, labels=None):
+        """append the runs of session to columns with two queries"""
+        q = (session.query(TuningRun)
+             .options(joinedload(TuningRun.program_version)
+                      .joinedload(ProgramVersion.program))
+             .filter_by(state='COMPLETE')
+             .order_by(TuningRun.name))
+        if labels:
+            q = q.filter(TuningRun.name.in_(labels))
+        first_run = len(columns['run_name'])
+        run_index = dict()
+        starts = list()
+        for tr in q:
+            run_index[tr.id] = len(columns['run_name'])
+            starts.append(tr.start_date)
+            columns['run_name'].append(tr.name or '')
+            columns['run_label'].append(run_label(tr))
+            columns['run_short_label'].append(run_label(tr, short=True))
+            columns['run_project'].append(tr.program.project or '')
+            columns['run_program'].append(tr.program.name or '')
+            columns['run_version'].append(tr.program_version.version or '')
+            columns['run_final_config'].append(tr.final_config_id or -1)
+            columns['run_objective'].append(pickle.dumps(tr.objective))
+        if not run_index:
+            return
+
+        q = (session.query(Result.tuning_run_id, Result.id,
+                           Result.configuration_id, Result.state, Result.time,
+                           Result.accuracy, Result.energy, Result.size,
+                           Result.was_new_best, DesiredResult.id,
+                           DesiredResult.request_date)
+             .outerjoin(DesiredResult,
+                        and_(DesiredResult.result_id == Result.id,
+                             DesiredResult.state == 'COMPLETE'))
+             .filter(Result.tuning_run_id.in_(list(run_index.keys()))))
+        rows = q.all()
+        runs = [run_index[row[0]] for row in rows]
+        columns['result_run'].extend(runs)
+        columns['result_id'].extend(row[1] for row in rows)
+        columns['result_config'].extend(row[2] or -1 for row in rows)
+        columns['result_state'].extend(row[3] or 'OK' for row in rows)
+        columns['result_time'].extend(row[4] for row in rows)
+        columns['result_accuracy'].extend(row[5] for row in rows)
+        columns['result_energy'].extend(row[6] for row in rows)
+        columns['result_size'].extend(row[7] for row in rows)
+        columns['result_new_best'].extend(bool(row[8]) for row in rows)
+        columns['result_dr'].extend(-1 if row[9] is None else row[9]
+                                    for row in rows)
+        requests = numpy.array([row[10] for row in rows], dtype='datetime64[us]')
+        start = numpy.array(starts, dtype='datetime64[us]')[
+            numpy.array(runs, dtype=numpy.int64) - first_run]
+        seconds = (requests - start) / numpy.timedelta64(1, 's')
+        columns['result_request'].extend(seconds.tolist())
+
+    def save(self, path):
+        numpy.savez_compressed(path, **self.arrays)
+
+    @classmethod
+    def load(cls, path):
+        with numpy.load(path, allow_pickle=True) as npz:
+            return cls(dict((name, npz[name]) for name in npz.files))
+
+    @classmethod
+    def cached(cls, path, database_files, connect, refresh=False):
+        """
+        load the export at path, or create it from database_files (opened
+        with connect(filename) -> session) if it is missing or older
+        than any of them
+        """
+        if (not refresh and os.path.exists(path) and
+                all(os.path.getmtime(f) <= os.path.getmtime(path)
+                    for f in database_files)):
+            log.info('using results export %s', path)
+            return cls.load(path)
+        sessions = list()
+        for f in database_files:
+            try:
+                sessions.append(connect(f))
+            except Exception:
+                log.error('failed to load database: %s', f, exc_info=True)
+        export = cls.from_sessions(sessions)
+        export.save(path)
+        log.info('exported %d runs and %d results to %s', export.run_count(),
+                 len(export['result_run']), path)
+        return export
+
+    def run_count(self):
+        return len(self.arrays['run_name'])
+
+    def objective(self, run):
+        if run not in self.objectives:
+            self.objectives[run] = pickle.loads(self.arrays['run_objective'][run])
+        return self.objectives[run]
+
+    def rows(self, runs):
+        """indexes of the result rows of a run or list of runs"""
+        if numpy.isscalar(runs):
+            runs = [runs]
+        return numpy.concatenate(
+            [self.order[self.bounds[r]:self.bounds[r + 1]] for r in runs] +
+            [numpy.zeros(0, dtype=numpy.int64)])
+
+    def result(self, row):
+        """a (detached) Result with the exported fields of row"""
+        state = str(self.arrays['result_state'][row])
+        fields = dict(state=state)
+        for field in ('time', 'accuracy', 'energy', 'size'):
+            value = float(self.arrays['result_' + field][row])
+            fields[field] = None if numpy.isnan(value) else value
+        return Result(**fields)
+
+    def best_rows(self, runs):
+        """rows of the OK new best results of runs with a finite time"""
+        rows = self.rows(runs)
+        return rows[self.arrays['result_new_best'][rows] &
+                    (self.arrays['result_state'][rows] == 'OK') &
+                    (self.arrays['result_time'][rows] < float('inf'))]
+
+    def final_row(self, run):
+        """a row of the final configuration of run, or None"""
+        rows = self.rows(run)
+        rows = rows[self.arrays['result_config'][rows] ==
+                    self.arrays['run_final_config'][run]]
+        if len(rows) == 0:
+            return None
+        return rows[0]
+
+    def best_over_time(self, run, quanta, by_request_count=False, no_data=999):
+        """
+        best time found so far in each quanta (seconds, or requests with
+        by_request_count) of run, no_data before the first result
+        """
+        rows = self.best_rows(run)
+        rows = rows[self.arrays['result_dr'][rows] >= 0]
+        if len(rows) == 0:
+            return numpy.array([no_data], dtype=float)
+        request = self.arrays['result_request'][rows]
+        if by_request_count:
+            dr = self.arrays['result_dr'][rows]
+            steps = dr - dr[numpy.argmin(request)]
+        else:
+            steps = numpy.floor(request / quanta)
+        steps = numpy.maximum(steps, 0).astype(numpy.int64)
+        values = numpy.full(steps.max() + 1, numpy.inf)
+        numpy.minimum.at(values, steps, self.arrays['result_time'][rows])
+        seen = numpy.zeros(len(values), dtype=bool)
+        seen[steps] = True
+        values = numpy.minimum.accumulate(values)
+        values[~numpy.logical_or.accumulate(seen)] = no_data
+        return values
+
+    def combined_over_time(self, runs, quanta, by_request_count=False,
+                           no_data=999):
+        """
+        best_over_time() of runs as a (quanta, runs) matrix, shorter runs are
+        padded with their final value
+        """
+        by_run = [self.best_over_time(run, quanta, by_request_count, no_data)
+                  for run in runs]
+        length = max(len(values) for values in by_run)
+        matrix = numpy.empty((length, len(by_run)))
+        for i, values in enumerate(by_run):
+            matrix[:len(values), i] = values
+            matrix[len(values):, i] = values[-1]
+        return matrix
+
+
+def over_time_stats(matrix):
+    """
+    per row of a combined_over_time() matrix: mean, stddev and the
+    PCTSTEPS percentiles (nearest rank)
+    """
+    ordered = numpy.sort(matrix, axis=1)
+    ranks = [int(round(p * (matrix.shape[1] - 1))) for p in PCTSTEPS]
+    return {'mean': matrix.mean(axis=1),
+            'stddev': matrix.std(axis=1),
+            'percentiles': ordered[:, ranks]}
+
+
+def technique_scores(curves, factor=10.0):
+    """
+    area between each (x, y) curve and the lowest final y of all curves,
+    with the final y extended to factor times the longest curve;
+    returns sorted [(score, label)]
+    """
+    if not curves:
+        return []
+    max_duration = max(x[-1] for x, y in curves.values())
+    min_value = min(y[-1] for x, y in curves.values())
+    scores = list()
+    for label, (x, y) in curves.items():
+        durations = numpy.diff(numpy.concatenate([[0.0], x]))
+        score = numpy.sum(durations * (y - min_value))
+        score += (factor * max_duration - x[-1]) * (y[-1] - min_value)
+        scores.append((float(score), label))
+    return sorted(scores)
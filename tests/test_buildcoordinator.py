@@ -0,0 +1,48 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'DLC'))
+
+from buildcoordinator import BatchCoordinator
+
+
+class BatchCoordinatorTests(unittest.TestCase):
+
+    def test_uneven_rounds(self):
+        # samples each participant takes in each generation
+        samples = [[1, 3, 2], [2, 1, 2], [4, 1, 1]]
+        build = BatchCoordinator(len(samples), timeout=10, name="build")
+        done = BatchCoordinator(len(samples), timeout=10, name="done")
+        batches = []
+        errors = []
+
+        def participant(counts):
+            try:
+                for count in counts:
+                    for i in range(count):
+                        build.submit(i, lambda items: batches.append(len(items)))
+                    build.pause()
+                    done.submit(None, lambda items: build.resume_all())
+            except Exception as e:
+                errors.append(e)
+            finally:
+                build.leave()
+                done.leave()
+
+        threads = [threading.Thread(target=participant, args=(counts,))
+                   for counts in samples]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        # one build per round, the first rounds of a generation are shared
+        self.assertEqual(len(batches), 4 + 3 + 2)
+        self.assertEqual(batches[0], 3)
+        self.assertEqual(sum(batches), sum(map(sum, samples)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import argparse
+import os
+import unittest
+
+from opentuner.measurement.interface import DefaultMeasurementInterface
+from opentuner.measurement.interface import ProgressPruner
+
+
+def count_cost(line):
+    if line.startswith(b'cost'):
+        return int(line.split()[1])
+    return None
+
+
+class CallProgramTests(unittest.TestCase):
+
+    def setUp(self):
+        self.interface = DefaultMeasurementInterface(
+            argparse.Namespace(parallel_compile=False, parallelism=2))
+
+    def test_output(self):
+        result = self.interface.call_program('echo out; echo err >&2; exit 3')
+        self.assertEqual(result['stdout'], b'out\n')
+        self.assertEqual(result['stderr'], b'err\n')
+        self.assertEqual(result['returncode'], 3)
+        self.assertFalse(result['timeout'])
+
+    def test_timeout(self):
+        result = self.interface.call_program('sleep 5', limit=0.2)
+        self.assertTrue(result['timeout'])
+        self.assertEqual(result['time'], float('inf'))
+
+    def test_progress_abort(self):
+        pruner = ProgressPruner(count_cost, 25)
+        result = self.interface.call_program(
+            'for i in 1 2 3 4 5 6 7 8 9; do echo cost 10 >&2; sleep 0.1; done',
+            progress_callback=pruner, progress_stream='stderr')
+        self.assertTrue(result['aborted'])
+        self.assertTrue(result['timeout'])
+        self.assertEqual(pruner.total, 30)
+
+    def test_progress_no_bound(self):
+        pruner = ProgressPruner(count_cost, None)
+        result = self.interface.call_program('echo cost 1; echo cost 2',
+                                             progress_callback=pruner)
+        self.assertFalse(result['aborted'])
+        self.assertEqual(pruner.total, 3)
+        self.assertEqual(result['stdout'], b'cost 1\ncost 2\n')
+
+    def test_max_output(self):
+        result = self.interface.call_program('seq 1000', max_output=10)
+        self.assertEqual(result['stdout'], b'1\n2\n3\n4\n5\n')
+        self.assertEqual(result['returncode'], 0)
+
+    def test_spill_output(self):
+        result = self.interface.call_program('seq 1000; echo err >&2',
+                                             max_output=10, spill_output=True)
+        self.assertEqual(result['stdout'], b'1\n2\n3\n4\n5\n')
+        self.assertIsNone(result['stderr_file'])
+        try:
+            with open(result['stdout_file'], 'rb') as f:
+                self.assertEqual(f.read().split(), [str(i).encode()
+                                                    for i in range(1, 1001)])
+        finally:
+            os.unlink(result['stdout_file'])
+
+
+if __name__ == '__main__':
+    unittest.main()
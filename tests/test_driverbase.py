@@ -0,0 +1,37 @@
+import unittest
+
+from opentuner.driverbase import ResultIndex
+from opentuner.resultsdb.models import Configuration
+from opentuner.resultsdb.models import DesiredResult
+from opentuner.resultsdb.models import Result
+
+
+class ResultIndexTests(unittest.TestCase):
+
+    def setUp(self):
+        self.index = ResultIndex()
+        self.config1 = Configuration(hash='a' * 64, data={'x': 1})
+        self.config2 = Configuration(hash='b' * 64, data={'x': 2})
+
+    def test_has_results(self):
+        self.assertFalse(self.index.has_results(self.config1))
+        result = Result(id=1, configuration=self.config1, time=1.0)
+        self.assertTrue(self.index.add_result(result))
+        self.assertTrue(self.index.has_results(self.config1))
+        self.assertFalse(self.index.has_results(self.config2))
+        self.assertEqual(self.index.results_for(self.config1), [result])
+
+    def test_add_result_twice(self):
+        result = Result(id=1, configuration=self.config1, time=1.0)
+        self.assertTrue(self.index.add_result(result))
+        self.assertFalse(self.index.add_result(result))
+        self.assertEqual(len(self.index.results_for(self.config1)), 1)
+
+    def test_first_request(self):
+        dr1 = DesiredResult(configuration=self.config1, requestor='a')
+        dr2 = DesiredResult(configuration=self.config1, requestor='b')
+        self.assertIsNone(self.index.first_request(self.config1))
+        self.index.add_request(dr1)
+        self.index.add_request(dr2)
+        self.assertIs(self.index.first_request(self.config1), dr1)
+        self.assertIsNone(self.index.first_request(self.config2))
@@ -0,0 +1,114 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'DLC'))
+
+try:
+    import dlcutils
+    import kernelcache
+except ImportError:
+    kernelcache = None
+
+# a kernel tree in miniature: every object reads the policy file, which the
+# depfile reports as an input, and syntests links all of the objects
+BUILD_NINJA = """
+policy = ../src/dlc_src/opt_flag_data/autotune_strategies.csv
+rule cc
+  command = cat $in $policy > $out && echo "$out: $in $policy" > $out.d && echo $out >> compiled.log
+  depfile = $out.d
+  deps = gcc
+rule link
+  command = cat $in > $out && echo $out >> compiled.log
+build dlc_src/addk_dlc.o: cc ../src/dlc_kernels/addk.c
+build dlc_src/mulk_dlc.o: cc ../src/dlc_kernels/mulk.c
+build syntests: link dlc_src/addk_dlc.o dlc_src/mulk_dlc.o
+default syntests
+"""
+
+
+@unittest.skipUnless(kernelcache is not None and shutil.which('ninja'),
+                     'needs the DLC dependencies and ninja')
+class IncrementalKernelBuilderTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.src = os.path.join(self.dir, 'src') + '/'
+        self.build_dir = os.path.join(self.dir, 'build') + '/'
+        os.makedirs(self.src + 'dlc_kernels')
+        os.makedirs(self.src + 'dlc_src/opt_flag_data')
+        for kernel in ('addk', 'mulk'):
+            with open(self.src + 'dlc_kernels/%s.c' % kernel, 'w') as f:
+                f.write('%s source\n' % kernel)
+        self.policy = self.src + 'dlc_src/opt_flag_data/autotune_strategies.csv'
+        with open(self.policy, 'w') as f:
+            f.write('addk,a\nmulk,a\n')
+        self.store = dlcutils.PolicyStore(self.policy)
+        self.patches = [
+            mock.patch.object(kernelcache, 'get_kernel_path',
+                              return_value=self.src),
+            mock.patch.object(kernelcache, 'get_policy_path',
+                              return_value=self.policy),
+            mock.patch.object(kernelcache, 'get_policy_store',
+                              return_value=self.store),
+        ]
+        for patch in self.patches:
+            patch.start()
+        self.builder = kernelcache.IncrementalKernelBuilder(
+            build_dir=self.build_dir)
+
+    def tearDown(self):
+        for patch in self.patches:
+            patch.stop()
+        shutil.rmtree(self.dir)
+
+    def call_program(self, cmd):
+        if cmd.startswith('cmake'):
+            os.makedirs(self.build_dir, exist_ok=True)
+            with open(self.build_dir + 'build.ninja', 'w') as f:
+                f.write(BUILD_NINJA)
+            return {'returncode': 0}
+        return {'returncode': subprocess.call(cmd, shell=True,
+                                              stdout=subprocess.DEVNULL)}
+
+    def build(self, addk, mulk):
+        # make sure the new policy file gets a newer mtime
+        time.sleep(0.01)
+        self.store.set('addk', [addk])
+        self.store.set('mulk', [mulk])
+        log = self.build_dir + 'compiled.log'
+        if os.path.exists(log):
+            os.remove(log)
+        self.builder.build(self.call_program)
+        if not os.path.exists(log):
+            return []
+        with open(log) as f:
+            return f.read().split()
+
+    def binary(self):
+        with open(self.build_dir + 'syntests') as f:
+            return f.read()
+
+    def test_only_changed_kernels(self):
+        self.assertEqual(sorted(self.build('a', 'a')),
+                         ['dlc_src/addk_dlc.o', 'dlc_src/mulk_dlc.o', 'syntests'])
+        self.assertEqual(self.build('b', 'a'), ['dlc_src/addk_dlc.o', 'syntests'])
+        self.assertIn('addk,b', self.binary())
+        self.assertEqual(self.build('b', 'a'), [])
+        # back to a config built before: restored, only relinked
+        self.assertEqual(self.build('a', 'a'), ['syntests'])
+        self.assertNotIn('addk,b', self.binary())
+        self.assertEqual(self.builder.cache.hits, 1)
+        # ninja agrees that nothing is left to do
+        self.assertIn('no work to do', subprocess.check_output(
+            ['ninja', '-C', self.build_dir, '-n']).decode())
+
+
+if __name__ == '__main__':
+    unittest.main()
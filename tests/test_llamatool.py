@@ -0,0 +1,119 @@
+import math
+import os
+import statistics
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'DLC'))
+
+from llamatool import LlamaLogParser
+from llamatool import RunningStats
+from llamatool import get_kernel_cycles
+from llamatool import get_kernel_info
+from llamatool import get_kernel_launches
+from llamatool import remove_ansi
+
+START = '─' * 83 + ' '
+END = '─' * 72
+
+
+def launch(name, addr):
+    return ('%s\x1b[1;32m%s\x1b[0m on dlc0 grid=(4, 1, 1)\n'
+            '  arg0 addr=0x%x size=4096\n'
+            '  arg1 addr=0x%x size=4096\n'
+            '%s\n' % (START, name, addr, addr + 4096, END))
+
+
+def cycles(k, xys0, xys1):
+    return ('k[%d] xys0: 36582818465908 ~ 36582818689383  %d cycles  '
+            'xys1: 36582818450796 ~ 36582818675193  %d cycles   '
+            'custom_embedding_dense: 14.0186 GFLOPS\n' % (k, xys0, xys1))
+
+
+# the shape of a sft_trainer.py run: training output around the kernel
+# launch blocks, whose cycle lines may come some launches later
+LOG = ('loading model\n' +
+       launch('custom_embedding_dense', 0x7f0000) +
+       cycles(0, 223475, 224397) +
+       'step 0 loss 2.31\n' +
+       launch('custom_addk', 0x7f1000) +
+       launch('custom_mulk', 0x7f2000) +
+       cycles(1, 1200, 1180) +
+       cycles(2, 3400, 3390) +
+       launch('custom_addk', 0x7f3000) +
+       cycles(3, 1210, 1230) +
+       launch('custom_embedding_dense', 0x7f4000) +
+       cycles(4, 223000, 222900) +
+       'step 1 loss 2.18\n')
+
+
+def old_kernel_name_cycles(text):
+    """the full text regex scan tune-llama.py used before LlamaLogParser"""
+    names = [get_kernel_info(remove_ansi(kernel))[0]
+             for kernel in get_kernel_launches(text)]
+    kernel_cycles = get_kernel_cycles(text)
+    total_cycles = sum(kernel_cycles) + 1
+    kernel_cycles = kernel_cycles[:len(names)]
+    kernel_cycles += [0] * (len(names) - len(kernel_cycles))
+    kernel_name_cycles = {}
+    for name, cycle in zip(names, kernel_cycles):
+        kernel_name_cycles[name] = kernel_name_cycles.get(name, 0) + int(cycle)
+    return kernel_name_cycles, total_cycles
+
+
+def parse(text):
+    parser = LlamaLogParser()
+    for line in text.splitlines(True):
+        parser.feed(line)
+    return parser
+
+
+class LlamaLogParserTests(unittest.TestCase):
+
+    def test_same_as_regexes(self):
+        expected = old_kernel_name_cycles(LOG)
+        self.assertEqual(expected, ({'custom_embedding_dense': 224397 + 223000,
+                                     'custom_addk': 1200 + 1230,
+                                     'custom_mulk': 3400},
+                                    224397 + 1200 + 3400 + 1230 + 223000 + 1))
+        self.assertEqual(parse(LOG).finish(), expected)
+
+    def test_count_mismatch(self):
+        for text in (LOG + launch('custom_mulk', 0x7f5000),
+                     LOG + cycles(5, 10, 20)):
+            self.assertEqual(parse(text).finish(), old_kernel_name_cycles(text))
+
+    def test_stopped_early(self):
+        parser = parse(LOG)
+        self.assertTrue(parser.stable(['custom_addk'], 2, 0.1))
+        self.assertFalse(parser.stable(['custom_addk'], 3, 0.1))
+        self.assertFalse(parser.stable(['custom_mulk'], 1, 0.1))
+        estimate, total = parser.finish({'custom_addk': 10, 'custom_mulk': 4})
+        self.assertEqual(estimate['custom_addk'], int(1215.0 * 10))
+        self.assertEqual(estimate['custom_mulk'], 3400 * 4)
+        self.assertEqual(total, sum(estimate.values()) + 1)
+
+
+class RunningStatsTests(unittest.TestCase):
+
+    def test_mean_and_ci(self):
+        values = [1200.0, 1230.0, 1190.0, 1250.0, 1215.0]
+        stats = RunningStats()
+        for value in values:
+            stats.add(value)
+        self.assertAlmostEqual(stats.mean, statistics.mean(values))
+        self.assertAlmostEqual(stats.variance(), statistics.variance(values))
+        self.assertAlmostEqual(
+            stats.relative_ci(),
+            1.96 * statistics.stdev(values) / math.sqrt(len(values)) /
+            statistics.mean(values))
+
+    def test_too_few_values(self):
+        stats = RunningStats()
+        self.assertEqual(stats.relative_ci(), float('inf'))
+        stats.add(5.0)
+        self.assertEqual(stats.relative_ci(), float('inf'))
+
+
+if __name__ == '__main__':
+    unittest.main()
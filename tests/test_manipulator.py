@@ -259,3 +259,106 @@ class FloatArrayOperatorTests(unittest.TestCase):
         self.assertEqual(len(val), len(expected))
         for i in range(len(val)):
             self.assertAlmostEqual(val[i], expected[i])
+
+
+class HashConfigTests(unittest.TestCase):
+
+    def setUp(self):
+        self.params = [manipulator.IntegerParameter('b', 0, 100),
+                       manipulator.FloatParameter('a', 0.0, 1.0),
+                       manipulator.PermutationParameter('c', [0, 1, 2, 3])]
+        self.manipulator = manipulator.ConfigurationManipulator()
+        self.cached = manipulator.ConfigurationManipulator(hash_cache_size=2)
+        for p in self.params:
+            self.manipulator.add_parameter(p)
+        for p in [manipulator.IntegerParameter('b', 0, 100),
+                  manipulator.FloatParameter('a', 0.0, 1.0),
+                  manipulator.PermutationParameter('c', [0, 1, 2, 3])]:
+            self.cached.add_parameter(p)
+
+    def test_sorted_parameters(self):
+        cfg = self.manipulator.seed_config()
+        names = [p.name for p in self.manipulator.sorted_parameters(cfg)]
+        self.assertEqual(names, ['a', 'b', 'c'])
+        self.manipulator.add_parameter(manipulator.BooleanParameter('0'))
+        names = [p.name for p in self.manipulator.sorted_parameters(cfg)]
+        self.assertEqual(names, ['0', 'a', 'b', 'c'])
+
+    def test_cached_hash_matches(self):
+        for i in range(10):
+            cfg = self.manipulator.random()
+            self.assertEqual(self.manipulator.hash_config(cfg),
+                             self.cached.hash_config(cfg))
+            self.assertEqual(self.manipulator.hash_config(cfg),
+                             self.cached.hash_config(cfg))
+        self.assertGreater(self.cached.hash_cache.hits, 0)
+        self.assertEqual(len(self.cached.hash_cache), 2)
+
+    def test_cached_hash_after_mutation(self):
+        cfg = self.cached.seed_config()
+        hash1 = self.cached.hash_config(cfg)
+        cfg['c'].reverse()
+        hash2 = self.cached.hash_config(cfg)
+        self.assertNotEqual(hash1, hash2)
+        self.assertEqual(hash2, self.manipulator.hash_config(cfg))
+
+
+class UnitArrayTests(unittest.TestCase):
+
+    def setUp(self):
+        self.manipulator = manipulator.ConfigurationManipulator()
+        self.manipulator.add_parameter(manipulator.IntegerParameter('int', -5, 20))
+        self.manipulator.add_parameter(manipulator.FloatParameter('float', -1.0, 3.0))
+        self.manipulator.add_parameter(manipulator.LogIntegerParameter('logint', 1, 1000))
+        self.manipulator.add_parameter(manipulator.LogFloatParameter('logfloat', 0.5, 64.0))
+        self.manipulator.add_parameter(manipulator.PowerOfTwoParameter('pow2', 2, 512))
+        self.manipulator.add_parameter(manipulator.IntegerParameter('fixed', 7, 7))
+
+    def test_is_numeric(self):
+        self.assertTrue(self.manipulator.is_numeric())
+        self.manipulator.add_parameter(manipulator.BooleanParameter('bool'))
+        self.assertFalse(self.manipulator.is_numeric())
+        self.assertRaises(TypeError, self.manipulator.array_random, 1)
+
+    def test_to_unit_array(self):
+        cfgs = [self.manipulator.random() for i in range(20)]
+        array = self.manipulator.to_unit_array(cfgs)
+        self.assertEqual(array.shape, (20, 6))
+        for cfg, row in zip(cfgs, array):
+            for p, v in zip(self.manipulator.params, row):
+                self.assertAlmostEqual(p.get_unit_value(cfg), v)
+
+    def test_from_unit_array(self):
+        array = self.manipulator.array_random(50)
+        cfgs = self.manipulator.from_unit_array(array)
+        for cfg, row in zip(cfgs, array):
+            expected = self.manipulator.seed_config()
+            for p, v in zip(self.manipulator.params, row):
+                p.set_unit_value(expected, v)
+            self.assertEqual(cfg, expected)
+            self.assertTrue(self.manipulator.validate(cfg))
+
+    def test_round_trip(self):
+        cfg = self.manipulator.random()
+        vector = self.manipulator.to_unit_vector(cfg)
+        self.assertEqual(self.manipulator.from_unit_vector(vector)['int'], cfg['int'])
+        self.assertEqual(self.manipulator.from_unit_vector(vector)['pow2'], cfg['pow2'])
+
+    def test_array_operators_stay_in_bounds(self):
+        a = self.manipulator.array_random(100)
+        b = self.manipulator.array_random(100)
+        c = self.manipulator.array_random(100)
+        for population in (self.manipulator.array_normal_mutation(a, sigma=2.0),
+                           self.manipulator.array_set_linear(1.0, a, 0.7, b, -0.7, c),
+                           self.manipulator.array_swarm(a, b - c, b, c)[0]):
+            self.assertEqual(population.shape, a.shape)
+            self.assertTrue(numpy.all(population >= 0.0))
+            self.assertTrue(numpy.all(population <= 1.0))
+
+    @mock.patch('numpy.random.normal')
+    def test_array_normal_mutation_reflects(self, normal_func):
+        normal_func.return_value = numpy.array([[-0.3, 0.3]])
+        population = numpy.array([[0.1, 0.9]])
+        mutated = self.manipulator.array_normal_mutation(population)
+        self.assertAlmostEqual(mutated[0][0], 0.2)
+        self.assertAlmostEqual(mutated[0][1], 0.8)
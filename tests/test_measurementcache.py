@@ -0,0 +1,107 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import opentuner
+from opentuner import ConfigurationManipulator
+from opentuner import IntegerParameter
+from opentuner import MeasurementInterface
+from opentuner.measurement.cache import MeasurementCache
+from opentuner.measurement.inputmanager import FixedInputManager
+from opentuner.resultsdb.models import InputClass
+from opentuner.resultsdb.models import Program
+from opentuner.resultsdb.models import ProgramVersion
+from opentuner.resultsdb.models import Result
+from opentuner.tuningrunmain import TuningRunMain
+
+
+class CountingInputManager(FixedInputManager):
+
+    def __init__(self):
+        super(CountingInputManager, self).__init__()
+        self.selected = []
+
+    def select_input(self, desired_result):
+        self.selected.append(desired_result.id)
+        return super(CountingInputManager, self).select_input(desired_result)
+
+
+class SquareInterface(MeasurementInterface):
+
+    def __init__(self, *pargs, **kwargs):
+        super(SquareInterface, self).__init__(*pargs, **kwargs)
+        self.measured = []
+        self.counting_input_manager = CountingInputManager()
+
+    def input_manager(self):
+        return self.counting_input_manager
+
+    def manipulator(self):
+        manipulator = ConfigurationManipulator()
+        manipulator.add_parameter(IntegerParameter('x', -50, 50))
+        return manipulator
+
+    def run(self, desired_result, input, limit):
+        self.measured.append(desired_result.id)
+        return Result(time=float(desired_result.configuration.data['x'] ** 2))
+
+
+class MeasurementCacheTests(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'cache.db')
+        program = Program(project='p', name='n')
+        self.version = ProgramVersion(program=program, version='1',
+                                      parameter_info='[]')
+        self.input_class = InputClass(program=program, name='default', size=-1)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def key(self, config_hash='a' * 64):
+        return MeasurementCache.key(self.version, self.input_class, 'default',
+                                    config_hash)
+
+    def test_put_get(self):
+        cache = MeasurementCache(self.path)
+        self.assertIsNone(cache.get(self.key()))
+        cache.put(self.key(), Result(state='OK', time=2.5))
+        cache.close()
+        cache = MeasurementCache(self.path)
+        fields = cache.get(self.key())
+        self.assertEqual(fields['time'], 2.5)
+        self.assertEqual(fields['state'], 'OK')
+        self.assertIsNone(cache.get(self.key('b' * 64)))
+        cache.close()
+
+    def test_version_changes_key(self):
+        key = self.key()
+        self.version.version = '2'
+        self.assertNotEqual(key, self.key())
+
+    def test_max_age(self):
+        cache = MeasurementCache(self.path)
+        cache.put(self.key(), Result(state='OK', time=2.5))
+        cache.close()
+        cache = MeasurementCache(self.path, max_age=-1)
+        self.assertIsNone(cache.get(self.key()))
+        cache.close()
+
+    def test_input_selected_once(self):
+        cwd = os.getcwd()
+        os.chdir(self.tmpdir)  # for opentuner.log
+        try:
+            args = opentuner.default_argparser().parse_args(
+                ['--no-dups', '--test-limit', '10',
+                 '--database', os.path.join(self.tmpdir, 'a.db'),
+                 '--measurement-cache', self.path])
+            interface = SquareInterface(args)
+            TuningRunMain(interface, args).main()
+        finally:
+            os.chdir(cwd)
+        self.assertTrue(interface.measured)
+        # cache misses: the input run_cached() picked is the one measured
+        self.assertEqual(sorted(interface.counting_input_manager.selected),
+                         sorted(interface.measured))
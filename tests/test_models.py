@@ -0,0 +1,92 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from opentuner.resultsdb.connect import DB_VERSION
+from opentuner.resultsdb.connect import connect
+from opentuner.resultsdb.models import Configuration
+from opentuner.resultsdb.models import DesiredResult
+from opentuner.resultsdb.models import InputClass
+from opentuner.resultsdb.models import Program
+from opentuner.resultsdb.models import _Meta
+
+
+class ConfigurationDataTests(unittest.TestCase):
+
+    def setUp(self):
+        engine, Session = connect('sqlite://')
+        self.session = Session()
+        self.program = Program(project='test', name='test')
+        self.session.add(self.program)
+
+    def add(self, data):
+        config = Configuration(program=self.program, hash=repr(data), data=data)
+        self.session.add(config)
+        self.session.commit()
+        return config
+
+    def test_cached_across_commits(self):
+        config = self.add({'x': 1})
+        self.assertEqual(config.data, {'x': 1})
+        self.session.commit()
+        cache = Configuration.data_cache(self.session)
+        self.assertEqual(config.data, {'x': 1})
+        self.assertEqual(cache.hits, 1)
+        config.data = {'x': 2}
+        self.session.commit()
+        self.assertEqual(config.data, {'x': 2})
+
+    def test_prefetch(self):
+        configs = [self.add({'x': i}) for i in range(5)]
+        cache = Configuration.data_cache(self.session, size=3)
+        Configuration.prefetch(self.session, [c.id for c in configs])
+        self.assertEqual(len(cache), 3)
+        self.assertEqual(configs[4].data, {'x': 4})
+        self.assertEqual(cache.misses, 0)
+
+
+
+class MigrationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'old.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def make_version_0_0(self):
+        """a database with the schema and version of opentuner 0.0"""
+        engine, Session = connect('sqlite:///' + self.path)
+        Session.remove()
+        engine.dispose()
+        db = sqlite3.connect(self.path)
+        sql, = db.execute("SELECT sql FROM sqlite_master "
+                          "WHERE name = 'desired_result'").fetchone()
+        sql = '\n'.join(line for line in sql.split('\n')
+                        if 'input_class_id' not in line)
+        db.execute('DROP TABLE desired_result')
+        db.execute(sql)
+        db.execute("UPDATE _meta SET db_version = '0.0'")
+        db.execute("INSERT INTO desired_result (id, state) VALUES (1, 'COMPLETE')")
+        db.commit()
+        db.close()
+
+    def test_migrate_0_0(self):
+        self.make_version_0_0()
+        engine, Session = connect('sqlite:///' + self.path)
+        session = Session()
+        self.assertEqual(_Meta.get_version(session), DB_VERSION)
+        self.assertEqual(session.query(DesiredResult).one().input_class, None)
+        dr = DesiredResult(state='REQUESTED',
+                           input_class=InputClass(name='test', size=1))
+        session.add(dr)
+        session.commit()
+        self.assertEqual(session.query(DesiredResult)
+                         .filter(DesiredResult.input_class_id != None).count(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
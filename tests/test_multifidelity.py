@@ -0,0 +1,67 @@
+import unittest
+
+import mock
+
+from opentuner.resultsdb.models import Configuration
+from opentuner.resultsdb.models import InputClass
+from opentuner.resultsdb.models import Result
+from opentuner.search import manipulator
+from opentuner.search.multifidelity import Hyperband
+from opentuner.search.multifidelity import SuccessiveHalving
+from opentuner.search.objective import MinimizeTime
+
+
+class FakeInputManager(object):
+    def __init__(self, sizes):
+        self.input_classes = [InputClass(name='fidelity', size=size)
+                              for size in sizes]
+
+    def fidelities(self):
+        return self.input_classes
+
+
+def make_technique(cls, sizes=(1, 3, 9), **kwargs):
+    t = cls(**kwargs)
+    m = manipulator.ConfigurationManipulator()
+    m.add_parameter(manipulator.IntegerParameter('x', 0, 1000))
+    t.driver = mock.Mock(input_manager=FakeInputManager(sizes))
+    t.manipulator = m
+    t.objective = MinimizeTime()
+    return t
+
+
+def measure(t, cfg):
+    config = Configuration(hash=t.manipulator.hash_config(cfg), data=cfg)
+    t.handle_requested_result(Result(configuration=config, state='OK',
+                                     time=float(cfg['x']),
+                                     collection_cost=1.0))
+
+
+class SuccessiveHalvingTests(unittest.TestCase):
+
+    def test_promotes_best_third(self):
+        t = make_technique(SuccessiveHalving)
+        rung0 = [t.desired_configuration() for i in range(9)]
+        self.assertFalse(t.desired_configuration())  # waiting for results
+        for cfg in rung0:
+            measure(t, cfg)
+        best = sorted(rung0, key=lambda cfg: cfg['x'])[:3]
+        rung1 = [t.desired_configuration() for i in range(3)]
+        self.assertEqual(t.rung, 1)
+        self.assertEqual(rung1, best)
+        self.assertIs(t.fidelities[t.rung], t.driver.input_manager.input_classes[1])
+        for cfg in rung1:
+            measure(t, cfg)
+        self.assertEqual(t.desired_configuration(), best[0])
+        self.assertIsNone(t.fidelities[t.rung])  # full fidelity
+        self.assertEqual([b['tests'] for b in t.budget], [9, 3, 0])
+
+    def test_hyperband_brackets(self):
+        t = make_technique(Hyperband)
+        t.init_fidelities()
+        brackets = [next(t.bracket_iter) for i in range(4)]
+        self.assertEqual(brackets, [(0, 9), (1, 5), (2, 3), (0, 9)])
+
+
+if __name__ == '__main__':
+    unittest.main()
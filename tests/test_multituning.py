@@ -0,0 +1,90 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import opentuner
+from opentuner import ConfigurationManipulator
+from opentuner import IntegerParameter
+from opentuner import MeasurementInterface
+from opentuner import Result
+from opentuner import TuningRun
+from opentuner import resultsdb
+from opentuner.api import MultiTuningRunManager
+
+
+class ShiftedSquareInterface(MeasurementInterface):
+
+    def __init__(self, args, shift, **kwargs):
+        super(ShiftedSquareInterface, self).__init__(args, **kwargs)
+        self.shift = shift
+        self.measured = []
+
+    def manipulator(self):
+        manipulator = ConfigurationManipulator()
+        manipulator.add_parameter(IntegerParameter('x', -50, 50))
+        return manipulator
+
+    def run(self, desired_result, input, limit):
+        x = desired_result.configuration.data['x']
+        self.measured.append(x)
+        return Result(time=float((x - self.shift) ** 2))
+
+    def save_final_config(self, configuration):
+        self.final = configuration.data
+
+
+class BatchTuner(MultiTuningRunManager):
+
+    def __init__(self, *pargs, **kwargs):
+        super(BatchTuner, self).__init__(*pargs, **kwargs)
+        self.batches = []
+
+    def compile_batch(self, batch):
+        self.batches.append([interface.program_name()
+                             for interface, dr, input in batch])
+        return super(BatchTuner, self).compile_batch(batch)
+
+
+class MultiTuningRunManagerTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)  # for opentuner.log
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def interface(self, name, shift, test_limit):
+        args = opentuner.default_argparser().parse_args(
+            ['--no-dups', '--technique', 'PureRandom', '--parallelism', '1',
+             '--test-limit', str(test_limit),
+             '--database', os.path.join(self.dir, name + '.db')])
+        return ShiftedSquareInterface(args, shift, program_name=name)
+
+    def test_lock_step(self):
+        a = self.interface('a', 10, 5)
+        b = self.interface('b', -10, 8)
+        tuner = BatchTuner([a, b])
+        tuner.main()
+        # duplicate requests count towards --test-limit but are not measured
+        self.assertLessEqual(len(a.measured), 5)
+        self.assertLessEqual(len(b.measured), 8)
+        self.assertEqual(tuner.batches[0], ['a', 'b'])
+        self.assertTrue(all(batch in (['a', 'b'], ['a'], ['b'])
+                            for batch in tuner.batches))
+        self.assertEqual(sum(len(batch) for batch in tuner.batches),
+                         len(a.measured) + len(b.measured))
+        for interface in (a, b):
+            engine, Session = resultsdb.connect(interface.args.database)
+            self.assertEqual([tr.state for tr in Session().query(TuningRun)],
+                             ['COMPLETE'])
+            best = min(interface.measured,
+                       key=lambda x: abs(x - interface.shift))
+            self.assertEqual(interface.final['x'], best)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+
+import opentuner
+from opentuner import ConfigurationManipulator
+from opentuner import IntegerParameter
+from opentuner.measurement.interface import DetachedRecord
+from opentuner.measurement.interface import MeasurementInterface
+from opentuner.measurement.interface import process_worker_init
+from opentuner.measurement.interface import process_worker_run
+from opentuner.resultsdb.models import DesiredResult
+from opentuner.resultsdb.models import Result
+from opentuner.tuningrunmain import TuningRunMain
+
+
+class SquareInterface(MeasurementInterface):
+
+    def worker_init(self):
+        self.worker_pid = os.getpid()
+
+    def run(self, desired_result, input, limit):
+        x = desired_result.configuration.data['x']
+        return Result(time=float(x * x), size=float(self.worker_pid))
+
+
+def desired_result(x):
+    configuration = DetachedRecord(object(), (), data={'x': x})
+    return DetachedRecord(object(), (), configuration=configuration)
+
+
+class ProcessPoolTests(unittest.TestCase):
+
+    def setUp(self):
+        self.interface = SquareInterface(
+            argparse.Namespace(parallel_compile=False))
+
+    def test_pickle_interface(self):
+        self.interface.set_driver(object())
+        copy = pickle.loads(pickle.dumps(self.interface))
+        self.assertFalse(hasattr(copy, 'driver'))
+        self.assertEqual(copy.pids, [])
+
+    def test_worker_run(self):
+        batch = [(desired_result(x), None, None) for x in range(4)]
+        with ProcessPoolExecutor(1, initializer=process_worker_init,
+                                 initargs=(self.interface,)) as pool:
+            results = pool.submit(process_worker_run, batch).result()
+        self.assertEqual([r['time'] for r in results], [0.0, 1.0, 4.0, 9.0])
+        self.assertNotEqual(results[0]['size'], float(os.getpid()))
+
+
+class PrecompiledInterface(MeasurementInterface):
+
+    def __init__(self, *pargs, **kwargs):
+        super(PrecompiledInterface, self).__init__(*pargs, **kwargs)
+        self.run_args = []
+
+    def manipulator(self):
+        manipulator = ConfigurationManipulator()
+        manipulator.add_parameter(IntegerParameter('x', -50, 50))
+        return manipulator
+
+    def compile(self, cfg, id):
+        return cfg['x']
+
+    def run_precompiled(self, desired_result, input, limit, compile_result, id):
+        self.run_args.append((desired_result, input))
+        return Result(time=float(desired_result.configuration.data['x'] ** 2))
+
+
+class PipelineTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)  # for opentuner.log
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def test_runs_get_detached_records(self):
+        args = opentuner.default_argparser().parse_args(
+            ['--parallel-compile', '--pipeline', '--test-limit', '10',
+             '--database', os.path.join(self.dir, 'a.db')])
+        interface = PrecompiledInterface(args)
+        TuningRunMain(interface, args).main()
+        self.assertTrue(interface.run_args)
+        for desired_result, input in interface.run_args:
+            self.assertNotIsInstance(desired_result, DesiredResult)
+            self.assertIsInstance(desired_result, DetachedRecord)
+            self.assertIsInstance(input, DetachedRecord)
+
+
+if __name__ == '__main__':
+    unittest.main()
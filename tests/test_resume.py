@@ -0,0 +1,101 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+import opentuner
+from opentuner import ConfigurationManipulator
+from opentuner import IntegerParameter
+from opentuner import MeasurementInterface
+from opentuner import Result
+from opentuner.tuningrunmain import TuningRunMain
+
+
+class SquareInterface(MeasurementInterface):
+
+    def __init__(self, *pargs, **kwargs):
+        super(SquareInterface, self).__init__(*pargs, **kwargs)
+        self.measured = []
+
+    def manipulator(self):
+        manipulator = ConfigurationManipulator()
+        manipulator.add_parameter(IntegerParameter('x', -50, 50))
+        return manipulator
+
+    def run(self, desired_result, input, limit):
+        x = desired_result.configuration.data['x']
+        self.measured.append(x)
+        return Result(time=float(x * x))
+
+    def save_final_config(self, configuration):
+        self.final = configuration.data
+
+
+class ResumeTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)  # for opentuner.log
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def tune(self, *argv, **kwargs):
+        args = opentuner.default_argparser().parse_args(
+            ['--no-dups', '--technique', 'PureRandom'] + list(argv))
+        interface = SquareInterface(args, **kwargs)
+        TuningRunMain(interface, args).main()
+        return interface
+
+    def test_resume(self):
+        first = self.tune('--database', os.path.join(self.dir, 'a.db'),
+                          '--test-limit', '30')
+        second = self.tune('--database', os.path.join(self.dir, 'b.db'),
+                           '--resume-from', os.path.join(self.dir, 'a.db'),
+                           '--test-limit', '5')
+        self.assertFalse(set(first.measured) & set(second.measured))
+        self.assertLessEqual(abs(second.final['x']), abs(first.final['x']))
+
+    def test_other_program_version(self):
+        old = os.path.join(self.dir, 'a.db')
+        first = self.tune('--database', old, '--test-limit', '30',
+                          program_version='1')
+        with open(old, 'rb') as f:
+            contents = f.read()
+        second = self.tune('--database', os.path.join(self.dir, 'b.db'),
+                           '--resume-from', old, '--resume-seeds', '2',
+                           '--test-limit', '5', program_version='2')
+        # the best configs of the old version are measured again first
+        best = sorted(abs(x) for x in set(first.measured))[:2]
+        self.assertEqual([abs(x) for x in second.measured[:2]], best)
+        with open(old, 'rb') as f:
+            self.assertEqual(f.read(), contents)
+
+    def test_resume_from_version_0_0(self):
+        old = os.path.join(self.dir, 'a.db')
+        first = self.tune('--database', old, '--test-limit', '30')
+        # back to the schema and version of opentuner 0.0, resuming does
+        # not need the desired results
+        db = sqlite3.connect(old)
+        sql, = db.execute("SELECT sql FROM sqlite_master "
+                          "WHERE name = 'desired_result'").fetchone()
+        db.execute('DROP TABLE desired_result')
+        db.execute('\n'.join(line for line in sql.split('\n')
+                             if 'input_class_id' not in line))
+        db.execute("UPDATE _meta SET db_version = '0.0'")
+        db.commit()
+        db.close()
+        second = self.tune('--database', os.path.join(self.dir, 'b.db'),
+                           '--resume-from', old, '--test-limit', '5')
+        self.assertFalse(set(first.measured) & set(second.measured))
+        db = sqlite3.connect(old)
+        self.assertEqual(db.execute('SELECT db_version FROM _meta').fetchall(),
+                         [('0.0',)])
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
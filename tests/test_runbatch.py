@@ -0,0 +1,47 @@
+import argparse
+import unittest
+
+import mock
+
+from opentuner.measurement.driver import MeasurementDriver
+from opentuner.measurement.interface import DefaultMeasurementInterface
+from opentuner.resultsdb.models import Result
+
+
+class BatchInterface(DefaultMeasurementInterface):
+
+    def __init__(self, *pargs, **kwargs):
+        super(BatchInterface, self).__init__(*pargs, **kwargs)
+        self.batches = []
+
+    def run_batch(self, desired_results, input):
+        self.batches.append((input.id, [dr.id for dr in desired_results]))
+        return [Result(time=float(dr.id)) for dr in desired_results]
+
+
+class RunBatchTests(unittest.TestCase):
+
+    def setUp(self):
+        args = argparse.Namespace(parallel_compile=False)
+        self.interface = BatchInterface(args)
+        self.driver = MeasurementDriver.__new__(MeasurementDriver)
+        self.driver.args = argparse.Namespace(run_processes=0)
+        self.driver.interface = self.interface
+
+    def test_has_run_batch(self):
+        args = argparse.Namespace(parallel_compile=False)
+        self.assertFalse(DefaultMeasurementInterface(args).has_run_batch())
+        self.assertTrue(self.interface.has_run_batch())
+        self.assertEqual(self.driver.batch_measure(),
+                         self.driver.run_batch_measure)
+
+    def test_one_call_per_input(self):
+        drs = [mock.Mock(id=i) for i in range(5)]
+        inputs = [mock.Mock(id=i % 2) for i in range(5)]
+        results = self.driver.run_batch_measure(drs, inputs)
+        self.assertEqual([r.time for r in results], [0.0, 1.0, 2.0, 3.0, 4.0])
+        self.assertEqual(self.interface.batches, [(0, [0, 2, 4]), (1, [1, 3])])
+
+
+if __name__ == '__main__':
+    unittest.main()
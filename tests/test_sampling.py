@@ -0,0 +1,77 @@
+import argparse
+import unittest
+
+import mock
+
+from opentuner.measurement.driver import MeasurementDriver
+from opentuner.resultsdb.models import Result
+
+
+class SamplingTests(unittest.TestCase):
+
+    def setUp(self):
+        self.driver = MeasurementDriver.__new__(MeasurementDriver)
+        self.driver.args = argparse.Namespace(samples_min=2,
+                                              samples_max=10,
+                                              samples_ci=0.05,
+                                              samples_race_margin=0.1,
+                                              samples_aggregate='mean')
+        self.best = None
+        query = mock.Mock()
+        query.first.side_effect = lambda: self.best
+        self.driver.results_query = mock.Mock(return_value=query)
+
+    def samples(self, *times):
+        return [Result(time=t) for t in times]
+
+    def test_min_and_max(self):
+        self.assertTrue(self.driver.needs_sample(self.samples(1.0)))
+        self.assertFalse(self.driver.needs_sample(self.samples(*[1.0, 2.0] * 5)))
+
+    def test_confidence_interval(self):
+        self.assertFalse(self.driver.needs_sample(self.samples(1.0, 1.01)))
+        self.assertTrue(self.driver.needs_sample(self.samples(1.0, 1.5)))
+
+    def test_failed_sample_stops(self):
+        samples = self.samples(1.0, 1.5)
+        samples[1].state = 'TIMEOUT'
+        self.assertFalse(self.driver.needs_sample(samples))
+
+    def test_race_against_best(self):
+        self.best = Result(time=1.0)
+        self.assertTrue(self.driver.needs_sample(self.samples(1.0, 1.5)))
+        self.assertFalse(self.driver.needs_sample(self.samples(5.0, 5.5)))
+
+    def test_aggregate(self):
+        result = self.driver.aggregate_samples(self.samples(1.0, 2.0, 6.0))
+        self.assertEqual(result.time, 3.0)
+        self.assertEqual(result.state, 'OK')
+        self.assertGreater(result.confidence, 0)
+        self.driver.args.samples_aggregate = 'median'
+        self.assertEqual(self.driver.aggregate_samples(
+            self.samples(1.0, 6.0, 2.0)).time, 2.0)
+        self.driver.args.samples_aggregate = 'min'
+        self.assertEqual(self.driver.aggregate_samples(
+            self.samples(6.0, 1.0, 2.0)).time, 1.0)
+        single = self.samples(4.0)
+        self.assertIs(self.driver.aggregate_samples(single), single[0])
+
+    def test_aggregate_failed_sample(self):
+        samples = self.samples(1.0, 2.0, float('inf'))
+        samples[2].state = 'TIMEOUT'
+        result = self.driver.aggregate_samples(samples)
+        self.assertEqual(result.state, 'TIMEOUT')
+        self.assertIs(result, samples[2])
+        samples = self.samples(1.0, None)
+        self.assertFalse(self.driver.needs_sample(samples))
+        self.assertIs(self.driver.aggregate_samples(samples), samples[1])
+
+    def test_aggregate_zero_times(self):
+        self.assertFalse(self.driver.needs_sample(self.samples(0.0, 0.0)))
+        result = self.driver.aggregate_samples(self.samples(0.0, 0.0))
+        self.assertEqual((result.state, result.time, result.confidence),
+                         ('OK', 0.0, 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
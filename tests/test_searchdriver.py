@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import opentuner
+from opentuner import ConfigurationManipulator
+from opentuner import IntegerParameter
+from opentuner import MeasurementInterface
+from opentuner import Result
+from opentuner import resultsdb
+from opentuner.resultsdb.models import Configuration
+from opentuner.tuningrunmain import TuningRunMain
+
+
+class SquareInterface(MeasurementInterface):
+
+    def manipulator(self):
+        manipulator = ConfigurationManipulator()
+        manipulator.add_parameter(IntegerParameter('x', -50, 50))
+        return manipulator
+
+    def run(self, desired_result, input, limit):
+        return Result(time=float(desired_result.configuration.data['x'] ** 2))
+
+
+class GetConfigurationTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)  # for opentuner.log
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def test_configuration_stored_by_another_process(self):
+        args = opentuner.default_argparser().parse_args(
+            ['--database', os.path.join(self.dir, 'a.db')])
+        main = TuningRunMain(SquareInterface(args), args)
+        main.init()
+        driver = main.search_driver
+        driver.get_configuration({'x': 1})
+        main.commit(force=True)
+        # a concurrent tuning run of the program stores a new configuration
+        engine, Session = resultsdb.connect(args.database)
+        session = Session.session_factory()
+        other = Configuration(program_id=driver.program.id,
+                              hash=driver.manipulator.hash_config({'x': 2}),
+                              data={'x': 2})
+        session.add(other)
+        session.commit()
+        config = driver.get_configuration({'x': 2})
+        driver.resolve_configurations()
+        main.session.flush()
+        self.assertEqual(config.id, other.id)
+        self.assertEqual(config.data, {'x': 2})
+        self.assertEqual(main.session.query(Configuration)
+                         .filter_by(hash=other.hash).count(), 1)
+        # configurations nobody stored are inserted as usual
+        new = driver.get_configuration({'x': 3})
+        driver.resolve_configurations()
+        main.session.flush()
+        self.assertNotIn(new.id, (None, other.id))
+        session.close()
+        main.session.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy
+
+from opentuner.utils.statsexport import ResultsExport
+from opentuner.utils.statsexport import over_time_stats
+from opentuner.utils.statsexport import technique_scores
+
+
+def export(runs, rows):
+    """rows of (run, time, new_best, desired result id, request seconds)"""
+    return ResultsExport({
+        'run_name': numpy.array(['run%d' % i for i in range(runs)]),
+        'run_final_config': numpy.full(runs, -1),
+        'result_run': numpy.array([r[0] for r in rows], dtype=numpy.int64),
+        'result_config': numpy.arange(len(rows)),
+        'result_state': numpy.array(['OK'] * len(rows)),
+        'result_time': numpy.array([r[1] for r in rows], dtype=float),
+        'result_new_best': numpy.array([r[2] for r in rows], dtype=bool),
+        'result_dr': numpy.array([r[3] for r in rows], dtype=numpy.int64),
+        'result_request': numpy.array([r[4] for r in rows], dtype=float),
+    })
+
+
+class ResultsExportTests(unittest.TestCase):
+
+    def setUp(self):
+        self.export = export(2, [(0, 5.0, True, 10, 1.0),
+                                 (1, 7.0, True, 20, 0.5),
+                                 (0, 4.0, True, 11, 25.0),
+                                 (0, 1.0, False, 12, 26.0),
+                                 (0, 3.0, True, 13, 27.0),
+                                 (1, 6.0, True, 21, 12.0)])
+
+    def test_best_over_time(self):
+        self.assertEqual(self.export.best_over_time(0, 10).tolist(),
+                         [5.0, 5.0, 3.0])
+        self.assertEqual(self.export.best_over_time(0, 1, True).tolist(),
+                         [5.0, 4.0, 4.0, 3.0])
+        self.assertEqual(export(1, []).best_over_time(0, 10).tolist(), [999])
+
+    def test_combined_stats(self):
+        matrix = self.export.combined_over_time([0, 1], 10)
+        self.assertEqual(matrix.tolist(), [[5.0, 7.0], [5.0, 6.0], [3.0, 6.0]])
+        stats = over_time_stats(matrix)
+        self.assertEqual(stats['mean'].tolist(), [6.0, 5.5, 4.5])
+        self.assertEqual(stats['percentiles'][:, 0].tolist(), [5.0, 5.0, 3.0])
+        self.assertEqual(stats['percentiles'][:, -1].tolist(), [7.0, 6.0, 6.0])
+
+    def test_technique_scores(self):
+        x = numpy.array([10.0, 20.0])
+        scores = technique_scores({'a': (x, numpy.array([3.0, 1.0])),
+                                   'b': (x, numpy.array([2.0, 2.0]))}, 2.0)
+        self.assertEqual(scores, [(20.0, 'a'), (40.0, 'b')])
+
+    def test_save_load(self):
+        path = tempfile.mkdtemp()
+        try:
+            self.export.save(os.path.join(path, 'results.npz'))
+            loaded = ResultsExport.load(os.path.join(path, 'results.npz'))
+            self.assertEqual(loaded.best_over_time(0, 10).tolist(),
+                             [5.0, 5.0, 3.0])
+        finally:
+            shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+
+import mock
+import numpy
+
+from opentuner.resultsdb.models import Configuration
+from opentuner.resultsdb.models import Result
+from opentuner.search import manipulator
+from opentuner.search.objective import MaximizeAccuracy
+from opentuner.search.objective import ThresholdAccuracyMinimizeTime
+from opentuner.search.surrogatetechniques import GaussianProcessModel
+from opentuner.search.surrogatetechniques import SurrogateModel
+from opentuner.search.surrogatetechniques import SurrogateSearch
+from opentuner.search.surrogatetechniques import UnitEncoder
+
+
+class GaussianProcessModelTests(unittest.TestCase):
+
+    def test_interpolates_training_points(self):
+        x = numpy.linspace(0.0, 1.0, 20).reshape((20, 1))
+        y = (x[:, 0] - 0.3) ** 2
+        model = GaussianProcessModel(noise=1e-6)
+        model.fit(x, y)
+        mean, std = model.predict(x)
+        numpy.testing.assert_allclose(mean, y, atol=1e-3)
+        far_mean, far_std = model.predict(numpy.array([[5.0]]))
+        self.assertGreater(far_std[0], std.max())
+
+    def test_incomplete_model(self):
+        class FitOnly(SurrogateModel):
+            def fit(self, x, y):
+                pass
+
+        self.assertRaises(TypeError, FitOnly)
+
+
+class UnitEncoderTests(unittest.TestCase):
+
+    def test_mixed_parameters(self):
+        m = manipulator.ConfigurationManipulator()
+        m.add_parameter(manipulator.IntegerParameter('i', 0, 10))
+        m.add_parameter(manipulator.BooleanParameter('b'))
+        m.add_parameter(manipulator.EnumParameter('e', ['x', 'y', 'z']))
+        m.add_parameter(manipulator.PermutationParameter('p', [1, 2, 3]))
+        encoder = UnitEncoder(m)
+        cfg = {'i': 10, 'b': True, 'e': 'y', 'p': [3, 2, 1]}
+        x = encoder.encode_all([cfg])
+        self.assertEqual(x.shape, (1, encoder.width()))
+        self.assertEqual(x[0, 1:].tolist(), [1.0, 0.0, 1.0, 0.0])
+
+
+class SurrogateSearchTests(unittest.TestCase):
+
+    def technique(self, objective):
+        m = manipulator.ConfigurationManipulator()
+        m.add_parameter(manipulator.IntegerParameter('i', 0, 10))
+        driver = mock.MagicMock(manipulator=m, objective=objective)
+        technique = SurrogateSearch()
+        technique.set_driver(driver)
+        return technique
+
+    def result(self, i, **kwargs):
+        cfg = Configuration(hash=str(i), data={'i': i})
+        return Result(configuration=cfg, state='OK', **kwargs)
+
+    def test_objective_value(self):
+        technique = self.technique(MaximizeAccuracy())
+        technique.on_result(self.result(1, time=5.0, accuracy=0.5))
+        technique.on_result(self.result(2, time=1.0, accuracy=0.9))
+        x, y = technique.training_data()
+        self.assertEqual(y.tolist(), [-0.5, -0.9])
+
+    def test_unacceptable_results_skipped(self):
+        technique = self.technique(ThresholdAccuracyMinimizeTime(0.8))
+        technique.on_result(self.result(1, time=1.0, accuracy=0.5))
+        technique.on_result(self.result(2, time=2.0, accuracy=0.9))
+        self.assertEqual(len(technique.data), 1)
+
+    def test_duplicate_configurations(self):
+        technique = self.technique(MaximizeAccuracy())
+        technique.on_result(self.result(1, accuracy=0.5))
+        technique.on_result(self.result(1, accuracy=0.7))
+        technique.on_result(self.result(1, accuracy=0.6))
+        x, y = technique.training_data()
+        self.assertEqual(x.shape[0], 1)
+        self.assertEqual(y.tolist(), [-0.7])
@@ -1,9 +1,15 @@
+import random
 import unittest
 from builtins import next
 from unittest import mock
 
+import numpy
+
 from opentuner.search import manipulator
 from opentuner.search.composableevolutionarytechniques import ComposableEvolutionaryTechnique
+from opentuner.search.differentialevolution import DifferentialEvolution
+from opentuner.search.differentialevolution import PopulationMember
+from opentuner.search.pso import HybridParticle
 
 
 def faked_random(nums):
@@ -80,4 +86,47 @@ class ComposableSearchTechniqueTests(unittest.TestCase):
         self.technique.apply_operator(param_instance, ['p1', 'p2', 'p3', 'p4'])
         op3_cross_func.assert_called_once_with('p1', 'p2', 'p3', xchoice='op3_cross_CX')
 
+
+class ArrayOperatorTests(unittest.TestCase):
+    """numeric search spaces use the array operators, with the same results"""
+
+    def test_differential_evolution(self):
+        m = manipulator.ConfigurationManipulator()
+        m.add_parameter(manipulator.IntegerParameter('i', -100, 100))
+        m.add_parameter(manipulator.FloatParameter('f', 0.0, 10.0))
+        m.add_parameter(manipulator.LogIntegerParameter('l', 1, 1024))
+        technique = DifferentialEvolution(cr=0.5)
+        technique.manipulator = m
+        technique.driver = mock.Mock(best_result=None)
+        technique.population = [PopulationMember(mock.Mock(data=m.random()))
+                                for z in range(10)]
+        for seed in range(20):
+            random.seed(seed)
+            array = technique.create_new_configuration(technique.population[0])
+            random.seed(seed)
+            with mock.patch.object(m, 'is_numeric', return_value=False):
+                scalar = technique.create_new_configuration(technique.population[0])
+            self.assertEqual(array, scalar)
+
+    @mock.patch('numpy.random.uniform',
+                side_effect=lambda size: numpy.full(size, 0.3))
+    @mock.patch('random.random', return_value=0.3)
+    def test_pso(self, random_func, uniform_func):
+        m = manipulator.ConfigurationManipulator()
+        m.add_parameter(manipulator.FloatParameter('a', -5.0, 5.0))
+        m.add_parameter(manipulator.FloatParameter('b', 0.0, 1000.0))
+        array = HybridParticle(m, 'op3_cross_OX1')
+        scalar = HybridParticle(m, 'op3_cross_OX1')
+        scalar.unit_velocity = None
+        array.position = {'a': 4.0, 'b': 10.0}
+        scalar.position = dict(array.position)
+        array.best = scalar.best = {'a': -1.0, 'b': 500.0}
+        for g in ({'a': 0.0, 'b': 900.0}, {'a': -4.0, 'b': 0.0}):
+            array.move(g)
+            scalar.move(g)
+            for name in ('a', 'b'):
+                self.assertAlmostEqual(array.position[name],
+                                       scalar.position[name])
+        uniform_func.assert_called()
+
 # TODO tests for RandomThreeParentsComposableTechnique
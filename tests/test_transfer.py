@@ -0,0 +1,111 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+import opentuner
+from opentuner import ConfigurationManipulator
+from opentuner import IntegerParameter
+from opentuner import MeasurementInterface
+from opentuner import Result
+from opentuner import resultsdb
+from opentuner.search import transfer
+from opentuner.search.transfer import TransferRanking
+from opentuner.tuningrunmain import TuningRunMain
+
+
+class ShiftedSquareInterface(MeasurementInterface):
+
+    def __init__(self, args, shift, **kwargs):
+        super(ShiftedSquareInterface, self).__init__(args, **kwargs)
+        self.shift = shift
+        self.measured = []
+
+    def manipulator(self):
+        manipulator = ConfigurationManipulator()
+        manipulator.add_parameter(IntegerParameter('x', -50, 50))
+        return manipulator
+
+    def run(self, desired_result, input, limit):
+        x = desired_result.configuration.data['x']
+        self.measured.append(x)
+        return Result(time=float((x - self.shift) ** 2))
+
+
+class TransferRankingTests(unittest.TestCase):
+
+    def ranking(self, **kwargs):
+        ranking = TransferRanking('new', **kwargs)
+        ranking.add_results('near', ['a', 'b', 'c', 'd'])
+        ranking.add_results('far', ['d', 'c', 'b', 'a'])
+        return ranking
+
+    def test_features(self):
+        ranking = self.ranking(features={'new': [1.0, 0.0], 'near': [1.1, 0.0],
+                                         'far': [5.0, 3.0]}, neighbors=1)
+        self.assertEqual(list(ranking.similarity()), ['near'])
+        self.assertEqual(ranking.rank(2), ['a', 'b'])
+
+    def test_correlation(self):
+        ranking = self.ranking()
+        ranking.add_results('new', ['d', 'c', 'b'])
+        self.assertEqual(list(ranking.similarity()), ['far'])
+        self.assertEqual(ranking.rank(), ['a'])
+
+    def test_uniform(self):
+        ranking = self.ranking()
+        ranking.add_results('near', ['e'])
+        self.assertEqual(sorted(ranking.similarity()), ['far', 'near'])
+        self.assertEqual(ranking.rank()[-1], 'e')
+
+
+class TransferTests(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        os.chdir(self.dir)  # for opentuner.log
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dir)
+
+    def tune(self, name, shift, *argv):
+        # relative to the cwd, the directory of --transfer-from
+        args = opentuner.default_argparser().parse_args(
+            ['--no-dups', '--technique', 'PureRandom',
+             '--database', name + '.db'] + list(argv))
+        interface = ShiftedSquareInterface(args, shift, program_name=name)
+        TuningRunMain(interface, args).main()
+        return interface
+
+    def test_transfer(self):
+        old = self.tune('old', 10, '--test-limit', '40')
+        best = sorted(abs(x - 10) for x in set(old.measured))[:3]
+        new = self.tune('new', 11, '--test-limit', '5',
+                        '--transfer-from', self.dir, '--transfer-seeds', '3')
+        # configs with equal times may come in any order
+        self.assertEqual([abs(x - 10) for x in new.measured[:3]], best)
+
+    def test_databases_read_only(self):
+        self.tune('old', 10, '--test-limit', '10')
+        with open('old.db', 'rb') as f:
+            contents = f.read()
+        with open('junk.db', 'w') as f:
+            f.write('not a database')
+        with mock.patch.object(transfer.resultsdb, 'connect',
+                               wraps=resultsdb.connect) as connect:
+            self.tune('new', 11, '--test-limit', '5',
+                      '--transfer-from', self.dir)
+        opened = [call[0][0] for call in connect.call_args_list
+                  if call[1].get('readonly')]
+        self.assertEqual(sorted(os.path.basename(url) for url in opened),
+                         ['junk.db', 'old.db'])
+        with open('old.db', 'rb') as f:
+            self.assertEqual(f.read(), contents)
+
+
+if __name__ == '__main__':
+    unittest.main()
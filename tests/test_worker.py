@@ -0,0 +1,117 @@
+import argparse
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from datetime import timedelta
+
+from opentuner import resultsdb
+from opentuner.measurement.driver import MeasurementDriver
+from opentuner.resultsdb.models import Configuration
+from opentuner.resultsdb.models import DesiredResult
+from opentuner.resultsdb.models import Program
+from opentuner.resultsdb.models import ProgramVersion
+from opentuner.resultsdb.models import TuningRun
+
+
+class FakeMain(object):
+    def __init__(self, session):
+        self.session = session
+
+    def commit(self, force=False):
+        self.session.commit()
+
+
+class SharedDatabaseTests(unittest.TestCase):
+    """two engines on one sqlite file stand in for two worker processes"""
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        url = 'sqlite:///' + os.path.join(self.tmpdir, 'shared.db')
+        engine, Session = resultsdb.connect(url)
+        session = Session()
+        program = Program(project='test', name='test')
+        version = ProgramVersion(program=program, version='1')
+        tuning_run = TuningRun(uuid='a' * 32, program_version=version,
+                               state='RUNNING')
+        config = Configuration(program=program, hash='c' * 64, data={'x': 1})
+        session.add(DesiredResult(tuning_run=tuning_run, configuration=config,
+                                  state='REQUESTED', generation=0))
+        session.commit()
+        Session.remove()
+        engine.dispose()
+
+        self.drivers = [self.make_driver(url) for i in range(2)]
+
+    def make_driver(self, url):
+        engine, Session = resultsdb.connect(url)
+        # each scoped_session is thread local, use a plain session per driver
+        session = Session.session_factory()
+        args = argparse.Namespace(machine_class='default',
+                                  measurement_cache=None,
+                                  lease_timeout=60.0)
+        tuning_run = session.query(TuningRun).one()
+        return MeasurementDriver(measurement_interface=None,
+                                 input_manager=None,
+                                 args=args,
+                                 objective=None,
+                                 session=session,
+                                 tuning_run=tuning_run,
+                                 tuning_run_main=FakeMain(session))
+
+    def tearDown(self):
+        for driver in self.drivers:
+            driver.session.close()
+        shutil.rmtree(self.tmpdir)
+
+    def pending(self, driver):
+        return driver.query_pending_desired_results().all()
+
+    def test_claim_once(self):
+        dr1 = self.pending(self.drivers[0])[0]
+        dr2 = self.pending(self.drivers[1])[0]
+        self.assertTrue(self.drivers[0].claim_desired_result(dr1))
+        self.assertEqual(dr1.state, 'RUNNING')
+        self.assertFalse(self.drivers[1].claim_desired_result(dr2))
+        self.assertEqual(self.pending(self.drivers[1]), [])
+
+    def test_requeue_expired(self):
+        driver = self.drivers[0]
+        dr = self.pending(driver)[0]
+        self.assertTrue(driver.claim_desired_result(dr))
+        self.assertEqual(driver.requeue_expired(), 0)
+        dr.start_date = datetime.now() - timedelta(seconds=120)
+        driver.commit()
+        self.assertEqual(self.drivers[1].requeue_expired(), 1)
+        self.drivers[1].commit()
+        self.assertEqual(len(self.pending(self.drivers[1])), 1)
+
+    def test_lost_lease(self):
+        driver, other = self.drivers
+        dr = self.pending(driver)[0]
+        self.assertTrue(driver.claim_desired_result(dr))
+        # the heartbeat stalls, the lease expires and another worker claims it
+        lease = dr.start_date - timedelta(seconds=120)
+        dr.start_date = lease
+        driver.commit()
+        self.assertEqual(other.requeue_expired(), 1)
+        other.commit()
+        self.assertTrue(other.claim_desired_result(self.pending(other)[0]))
+        self.assertIsNone(driver.renew_lease(dr.id, lease))
+
+    def test_renew_after_round_trip(self):
+        driver, other = self.drivers
+        dr = self.pending(driver)[0]
+        self.assertTrue(driver.claim_desired_result(dr))
+        # the lease as read back from the database by another session
+        lease, = (other.session.query(DesiredResult.start_date)
+                  .filter_by(id=dr.id).one())
+        self.assertEqual(lease.microsecond, 0)
+        renewed = other.renew_lease(dr.id, lease)
+        self.assertIsNotNone(renewed)
+        other.commit()
+        lease, = (driver.session.query(DesiredResult.start_date)
+                  .filter_by(id=dr.id).one())
+        self.assertEqual(lease, renewed)
+        self.assertIsNotNone(driver.renew_lease(dr.id, lease))